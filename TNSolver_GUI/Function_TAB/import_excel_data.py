@@ -10,7 +10,7 @@
 from tkinter import Tk, Frame, filedialog, messagebox, LabelFrame, Label, Button
 from tkinter.ttk import Treeview, Scrollbar, Combobox
 from TNSolver_GUI.Thermal_Network_TAB.gUtility import is_float
-from openpyxl import load_workbook
+from TNSolver_code.utility_functions import read_excel_sheet
 
 
 class ExcelImporterApp(Frame):
@@ -90,73 +90,16 @@ class ExcelImporterApp(Frame):
 
     def load_excel_data(self, file_path):
         try:
-            self.workbook = load_workbook(filename=file_path, data_only=True)
-            self.sheet = self.workbook.active
-
-            self.all_data = []
-            self.header_row = []
-
-            # --- Find the first non-empty row and column ---
-            min_row_data = 0
-            for row_idx, row in enumerate(self.sheet.iter_rows(values_only=True)):
-                if any(cell_value is not None for cell_value in row):
-                    min_row_data = row_idx + 1  # +1 because iter_rows is 0-indexed, but sheet is 1-indexed
-                    break
-
-            if min_row_data == 0:  # No data found at all
-                messagebox.showwarning("Warning", "The selected Excel sheet is empty or contains only empty rows.")
-                self.clear_all_data()
-                return
-
-            # Find the first non-empty column based on the "data region"
-            min_col_data = self.sheet.max_column + 1  # Initialize with a value beyond max
-            for col_idx in range(1, self.sheet.max_column + 1):  # Iterate through all potential columns
-                has_data_in_col = False
-                for row_idx in range(min_row_data, self.sheet.max_row + 1):
-                    cell_value = self.sheet.cell(row=row_idx, column=col_idx).value
-                    if cell_value is not None:
-                        has_data_in_col = True
-                        break
-                if has_data_in_col:
-                    min_col_data = col_idx
-                    break
-
-            if min_col_data > self.sheet.max_column:  # No data found in any column from the first non-empty row
-                messagebox.showwarning("Warning",
-                                       "The selected Excel sheet does not contains data.")
-                self.clear_all_data()
-                return
-
-            # Now, read the data from the identified data region
-            # max_column and max_row still give the overall max, which is fine here
-            # since min_col_data and min_row_data narrow down the starting point.
-            num_columns = self.sheet.max_column
-            num_rows = self.sheet.max_row  # Use actual max_row, not just first data row
-
-            # Read all rows from the identified starting row and column
-            all_rows_raw = list(self.sheet.iter_rows(min_row=min_row_data,
-                                                     max_row=num_rows,
-                                                     min_col=min_col_data,
-                                                     max_col=num_columns,
-                                                     values_only=True))
-
-            if not all_rows_raw:
-                messagebox.showwarning("Warning", "No data found after cleaning initial empty rows/columns.")
-                self.clear_all_data()
-                return
-
-            # Assume the first row of the cleaned data is the header
-            self.header_row = [str(cell_value) if cell_value is not None else "" for cell_value in all_rows_raw[0]]
-
-            # Store the rest of the data
-            self.all_data = []
-            for row_data_tuple in all_rows_raw[1:]:  # Skip the header row
-                self.all_data.append(
-                    [str(cell_value) if cell_value is not None else "" for cell_value in row_data_tuple])
+            self.sheet, self.header_row, self.all_data = read_excel_sheet(file_path)
+            self.workbook = self.sheet.parent
 
             self.display_data_in_treeview()
             self.populate_column_comboboxes()
 
+        except ValueError as e:
+            messagebox.showwarning("Warning", str(e))
+            self.clear_all_data()
+
         except Exception as e:
             messagebox.showerror("Error", f"Failed to read Excel file: {e}")
             self.clear_all_data()
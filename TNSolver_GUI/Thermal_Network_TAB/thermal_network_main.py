@@ -8,7 +8,6 @@
 
     next steps:
      - Drag the entire network, activate the CTRL+A?
-     - Renumbering,
      - Zoom in/out: implement the autoscroll to give the feeling of a continuous zoom centered to the mouse pointer
      - CTRL+f fit the graphic area
      - Activate the ESC press to stop the element or node import
@@ -18,6 +17,7 @@
 from tkinter import Tk, Frame, Menu, PanedWindow, VERTICAL, HORIZONTAL, BOTH, messagebox
 from tkinter.font import Font
 import numpy as np
+import scipy.sparse as sparse
 
 from TNSolver_GUI.Thermal_Network_TAB.graphic_frame import GraphicWindow
 from TNSolver_GUI.Thermal_Network_TAB.progress_window import Terminal
@@ -29,6 +29,7 @@ from TNSolver_GUI.Thermal_Network_TAB.solver_settings import SolverSetting
 from TNSolver_GUI.Thermal_Network_TAB.graphic_plots import FunctionPlotter
 from TNSolver_GUI.Thermal_Network_TAB.time_slider import ScaleFrame
 from TNSolver_code.utility_functions import verdate
+from TNSolver_code.network_graph import bandwidth, bandwidth_ordering
 from TNSolver_GUI.Thermal_Network_TAB import gUtility
 
 
@@ -81,7 +82,7 @@ class ThermalNetwork(Frame):
         self.RightMenu.add_separator()
         self.RightMenu.add_command(label="Delete", command=self.Delete)
         self.RightMenu.add_separator()
-        # self.RightMenu.add_command(label="Renumber", command=self.Renumber)
+        self.RightMenu.add_command(label="Renumber", command=self.Renumber)
 
     def welcome_message(self):
         self.bottomFrame.write_text('TNSolver GUI\n'+verdate()+'\n')
@@ -315,7 +316,43 @@ class ThermalNetwork(Frame):
         return serialized_elm
 
     def Renumber(self):
-        pass
+        """Renumbers the nodes to minimize the bandwidth of the network matrix (reverse Cuthill-McKee)."""
+        if not self.node_dict:
+            messagebox.showerror(title='Renumber', message='Nothing to renumber!')
+            return
+        self.deselectAll()
+        old_ids = list(self.node_dict.keys())
+        index = {node_id: i for i, node_id in enumerate(old_ids)}
+        pairs = [(index[elm.nodeIn], index[elm.nodeOut]) for elm in self.elm_dict.values()
+                 if elm.nodeIn in index and elm.nodeOut in index]
+        rows = [i for i, j in pairs] + [j for i, j in pairs]
+        cols = [j for i, j in pairs] + [i for i, j in pairs]
+        graph = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(old_ids), len(old_ids)))
+        order, new_bandwidth = bandwidth_ordering(graph)
+        old_bandwidth = bandwidth(graph)
+        new_ids = {old_ids[i]: k + 1 for k, i in enumerate(order)}
+
+        canvas = self.centralFrame.th_canvas
+        for node_id in old_ids:
+            node = self.node_dict[node_id]
+            node.node_ID = new_ids[node_id]
+            for item in (node.g_body, node.g_ID, node.g_solution):
+                if item is not None:
+                    tags = list(canvas.gettags(item))
+                    tags[2] = node.node_ID
+                    canvas.itemconfig(item, tags=tuple(tags))
+            canvas.itemconfig(node.g_ID, text=node.node_ID)
+            if node.node_thermostatic_node is not None and str(node.node_thermostatic_node).isdigit():
+                node.node_thermostatic_node = new_ids.get(int(node.node_thermostatic_node),
+                                                          node.node_thermostatic_node)
+        for elm in self.elm_dict.values():
+            elm.nodeIn = new_ids.get(elm.nodeIn, elm.nodeIn)
+            elm.nodeOut = new_ids.get(elm.nodeOut, elm.nodeOut)
+        nodes = {new_ids[node_id]: self.node_dict[node_id] for node_id in old_ids}
+        self.node_dict.clear()
+        self.node_dict.update(sorted(nodes.items()))
+        self.bottomFrame.write_text('Nodes renumbered, matrix bandwidth: {} -> {}\n'.format(old_bandwidth,
+                                                                                           new_bandwidth))
 
     def setup(self):  # run first
         """Calls methods to setup the user interface."""
@@ -0,0 +1,148 @@
+"""
+Solution of the thermally disconnected parts of a thermal network.
+
+Networks built in the GUI often contain several sub-assemblies with no conductor between them. Each connected
+component of the network is extracted as a model of its own and solved independently: the nonlinear iterations
+are converged component by component, so a stiff (e.g. radiation) part does not force extra iterations on the
+linear ones, and the large components are solved in parallel processes. The results are then merged back in the
+original model. Transient runs with steady state detection are solved as a whole (see core_solver.solve_network):
+the steady state is a property of the whole network, and the components would stop at different times.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from .utility_functions import user_feedback
+from .network_graph import extract_submodel
+from .linear_solvers import BlockFactor
+
+PARALLEL_NODES = 500  # components with at least this number of nodes are solved in parallel processes
+
+
+def _solve_component(sub, func, mat, logfID, prog_report, *text_widget):
+    """Solves the model of a component, returns it with the solution."""
+
+    from .core_solver import network_driver  # imported here, core_solver imports this module
+
+    driver = network_driver(sub.spar)
+    sub.T, sub.Q, sub.spar, sub.nd, sub.el, sub.src, func = driver(None, sub.T, sub.Q, sub.spar, sub.nd, sub.el,
+                                                                 sub.bc, sub.src, func, mat, logfID, prog_report,
+                                                                 *text_widget)
+    return sub
+
+
+def _solve_component_process(sub, func, mat):
+    return _solve_component(sub, func, mat, None, 0)
+
+
+def merge_components(subs, T, Q, spar, nd, el, bc, src):
+    """
+    Merges the solutions of the components in the original model.
+
+    Args:
+        subs: list of solved SubModel classes.
+        T, Q, spar, nd, el, bc, src: original model (updated).
+
+    Returns:
+        T, Q in the tnsdriver format (time histories for transient models).
+    """
+
+    nnd = len(nd)
+    nel = len(el)
+    if spar.steady:
+        T = np.zeros(nnd)
+        Q = np.zeros(nel)
+    else:
+        nt = subs[0].T.shape[0]
+        T = np.zeros((nt, nnd + 1))
+        Q = np.zeros((nt, nel + 1))
+        T[:, 0] = subs[0].T[:, 0]
+        Q[:, 0] = subs[0].T[:, 0]
+
+    for i in range(len(src)):
+        src[i].Qtot = 0.0
+    spar.iterations = 0
+    factors = []
+    for sub in subs:
+        eqns = np.array([nd[n].eqn for n in sub.nodes], dtype=int)
+        if spar.steady:
+            T[eqns] = sub.T
+            Q[sub.elements] = sub.Q
+        else:
+            T[:, eqns + 1] = sub.T[:, 1:]
+            Q[:, np.array(sub.elements, dtype=int) + 1] = sub.Q[:, 1:]
+        for i in range(len(sub.nodes)):
+            sub.nd[i].eqn = nd[sub.nodes[i]].eqn
+            nd[sub.nodes[i]] = sub.nd[i]
+        for j in range(len(sub.elements)):
+            e = sub.elements[j]
+            sub.el[j].elnd = el[e].elnd
+            el[e] = sub.el[j]
+        for k in range(len(sub.bcs)):
+            i, _ = sub.bcs[k]
+            bc[i].Tinf = sub.bc[k].Tinf
+            bc[i].q = sub.bc[k].q
+            bc[i].A = sub.bc[k].A
+        for k in range(len(sub.srcs)):
+            i, positions = sub.srcs[k]
+            src[i].Sc = list(src[i].Sc) + [0.0] * (len(src[i].nd) - len(src[i].Sc))
+            for j in range(len(positions)):
+                src[i].Sc[positions[j]] = sub.src[k].Sc[j]
+            src[i].qdot = sub.src[k].qdot
+            src[i].Q = sub.src[k].Q
+            src[i].Qtot += sub.src[k].Qtot
+        spar.iterations += sub.spar.iterations
+        factors.append(sub.spar.factor)
+    spar.time = subs[0].spar.time
+    steady_times = [sub.spar.steady_time for sub in subs]
+    spar.steady_time = max(steady_times) if not np.any(np.isnan(steady_times)) else float('nan')
+    spar.factor = BlockFactor(nnd, factors, [np.array([nd[n].eqn for n in sub.nodes]) for sub in subs])
+    return T, Q
+
+
+def solve_components(components, T, Q, spar, nd, el, bc, src, func, mat, logfID, prog_report, *text_widget):
+    """
+    Solves the connected components of a thermal network independently.
+
+    The components with at least PARALLEL_NODES nodes are solved in parallel processes (when there are more than
+    one of them), the others in this process with the usual progress report.
+
+    Args:
+        components: node numbers of each connected component (see network_graph.connected_components).
+        T, Q, spar, nd, el, bc, src, func, mat: initialized model.
+        logfID: Log file ID
+        prog_report: code for the progress report
+        *text_widget: Terminal widget (optional)
+
+    Returns:
+        T, Q, spar, nd, el, src, func (updated, as returned by tnsdriver).
+    """
+
+    subs = [extract_submodel(T, Q, spar, nd, el, bc, src, nodes) for nodes in components]
+    large = [c for c in range(len(subs)) if len(subs[c].nodes) >= PARALLEL_NODES]
+    if len(large) < 2:
+        large = []
+
+    message = '\nThe network has {} thermally disconnected parts, solved separately\n'.format(len(subs))
+    user_feedback(message, prog_report, logfID, *text_widget)
+
+    executor = ProcessPoolExecutor(max_workers=min(len(large), os.cpu_count() or 1)) if large else None
+    futures = {c: executor.submit(_solve_component_process, subs[c], func, mat) for c in large}
+    for c in range(len(subs)):
+        if c not in futures:
+            message = '\nComponent {} ({} nodes):\n'.format(c + 1, len(subs[c].nodes))
+            user_feedback(message, prog_report, logfID, *text_widget)
+            subs[c] = _solve_component(subs[c], func, mat, logfID, prog_report, *text_widget)
+    for c in large:
+        subs[c] = futures[c].result()
+    if executor is not None:
+        executor.shutdown()
+
+    message = '\n\n  Component    Nodes  Elements  Iterations\n  --------- -------- --------- -----------\n'
+    for c in range(len(subs)):
+        message += '  {:9d} {:8d} {:9d} {:11d}\n'.format(c + 1, len(subs[c].nodes), len(subs[c].elements),
+                                                        subs[c].spar.iterations)
+    user_feedback(message, prog_report, logfID, *text_widget)
+
+    T, Q = merge_components(subs, T, Q, spar, nd, el, bc, src)
+    return T, Q, spar, nd, el, src, func
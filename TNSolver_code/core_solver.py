@@ -5,11 +5,25 @@ import re
 import math
 from .utility_functions import verdate, setunits, QCF, functionF, plotfunc, user_feedback
 from .read_functions import read_input_file, Element, Node, InitialCondition, is_float
-from .evaluate_properties import evalfunc, rhoCvprop
-from .output_files_writing import write_rst, write_csv_el, write_csv_nd, wrt_time, write_mat, write_out
+from .evaluate_properties import evalfunc, evalfunc_slope, rhoCvprop
+from .output_files_writing import (write_rst, write_csv_el, write_csv_nd, wrt_time, write_mat, write_out,
+                                   write_time_history)
 from .element_matrix import elmat_radiation, elmat_outflow, elmat_conduction, elmat_convection, elmat_advection
 from .element_preprocessor import elpre_radiation
 from .element_postprocessor import elpost_radiation
+from .linear_solvers import factorize
+from .jfnk_solver import jfnk_solve
+from .kirchhoff_transform import kirchhoff_solve
+from .network_coarsening import coarsen_network
+from .network_assembly import element_blocks, assemble_matrix, dirichlet_equations
+from .network_graph import connected_components, flow_ordering
+from .component_solver import solve_components
+from .multirate_integration import multirate_driver
+from .modal_analysis import time_step_analysis
+from .fd_jacobian import fd_elements, distance2_coloring, colored_jacobian
+from .update_schedule import update_plan, write_update_plan, CONSTANT, TIME, TEMPERATURE
+from .pseudo_transient import PseudoTransient
+from .time_predictor import PREDICTOR_ORDER, PredictorHistory, predict_temperatures, write_predictor_statistics
 
 
 def tn_solver(base_file_name, prog_report=1, *text_widget):  # quiet is now a keyword argument with a default value
@@ -61,36 +75,16 @@ def tn_solver(base_file_name, prog_report=1, *text_widget):  # quiet is now a ke
                 message = '\nReading the input file: {}\n'.format(os.path.abspath(input_file))
                 user_feedback(message, prog_report, logfID, *text_widget)
 
-                inp_err, spar, nd, el, bc, src, ic, func, enc, mat = read_input_file(fid, logfID, prog_report,
-                                                                                     *text_widget)
-
-                if inp_err:
-                    message = '\nTNSolver: Errors reading the input file.\nPlease correct them and try again.\n\n'
-                    user_feedback(message, prog_report, logfID, *text_widget)
+                model = solve_input_file(fid, base_file_name, logfID, prog_report, *text_widget)
+                if model is None:
                     return None, None, None, None  # Return None values to indicate failure
+                T, Q, spar, nd, el, bc, src, ic, enc, mat = model
 
                 # Set global constants
                 Toff = spar.Toff
                 g = spar.gravity
                 sigma = spar.sigma
 
-                # Initialize the thermal model
-                message = '\nInitializing the thermal network model ...\n'
-                user_feedback(message, prog_report, logfID, *text_widget)
-
-                T, Q, spar, nd, el, bc, src, ic, func, enc, mat = init(spar, nd, el, bc, src, ic, func,
-                                                                       enc, mat, logfID, prog_report, *text_widget)
-
-                # Solve the thermal model
-                if spar.steady:  # Accessing dictionary elements
-                    message = '\nStarting solution of a steady thermal network model ...\n'
-                    user_feedback(message, prog_report, logfID, *text_widget)
-                else:
-                    message = '\nStarting solution of a transient thermal network model ...\n'
-                    user_feedback(message, prog_report, logfID, *text_widget)
-
-                T, Q, spar, nd, el, src, func = tnsdriver(fid, T, Q, spar, nd, el, bc, src, func, mat,
-                                                          logfID, prog_report, *text_widget)
                 # Write output files
                 with open(base_file_name + '_py.out', 'w') as fid:  # Use context manager
                     write_out(fid, spar, nd, el, bc, src, ic, enc, mat)
@@ -127,11 +121,186 @@ def tn_solver(base_file_name, prog_report=1, *text_widget):  # quiet is now a ke
         return None, None, None, None
 
 
+def solve_input_file(fid, base_file_name, logfID, prog_report, *text_widget):
+    """
+    Reads, initializes and solves the thermal model of an input file, without writing the output files (see
+    tn_solver).
+
+    Args:
+        fid: input file.
+        base_file_name: base name of the time data file of a transient model (None for in-memory runs, no time
+            data file written).
+        logfID: Log file ID
+        prog_report: code for the progress report
+        *text_widget: Terminal widget (optional)
+
+    Returns:
+        A tuple containing T, Q, spar, nd, el, bc, src, ic, enc, mat (temperatures in the I/O units), None on input
+        errors.
+    """
+
+    inp_err, spar, nd, el, bc, src, ic, func, enc, mat = read_input_file(fid, logfID, prog_report, *text_widget)
+
+    if inp_err:
+        message = '\nTNSolver: Errors reading the input file.\nPlease correct them and try again.\n\n'
+        user_feedback(message, prog_report, logfID, *text_widget)
+        return None
+
+    # Initialize the thermal model
+    message = '\nInitializing the thermal network model ...\n'
+    user_feedback(message, prog_report, logfID, *text_widget)
+
+    T, Q, spar, nd, el, bc, src, ic, func, enc, mat = init(spar, nd, el, bc, src, ic, func, enc, mat, logfID,
+                                                           prog_report, *text_widget)
+
+    # Solve the thermal model
+    if spar.steady:  # Accessing dictionary elements
+        message = '\nStarting solution of a steady thermal network model ...\n'
+        user_feedback(message, prog_report, logfID, *text_widget)
+    else:
+        message = '\nStarting solution of a transient thermal network model ...\n'
+        user_feedback(message, prog_report, logfID, *text_widget)
+
+    if spar.coarsening or spar.condensation:  # solve the reduced network, then reconstruct the original
+        net = coarsen_network(T, Q, spar, nd, el, bc, src, mat, logfID, prog_report, *text_widget)
+        Tr, Qr, spar, nd_r, el_r, src_r, func = solve_network(None, net.T, net.Q, spar, net.nd, net.el, net.bc,
+                                                              net.src, func, mat, logfID, prog_report, *text_widget)
+        T, Q = net.expand(Tr, Qr, spar, nd, el, bc, src, nd_r, el_r, net.bc, src_r, T)
+        if not spar.steady and base_file_name is not None:
+            filename = base_file_name + '_timedata_py.csv'
+            with open(filename, 'w') as fplt:
+                write_time_history(fplt, T, Q, nd, el)
+            message = ('\nTime data written to: {}'.format(filename))
+            user_feedback(message, prog_report, logfID, *text_widget)
+    else:
+        data_fid = fid if base_file_name is not None else None  # names the time data file
+        T, Q, spar, nd, el, src, func = solve_network(data_fid, T, Q, spar, nd, el, bc, src, func, mat, logfID,
+                                                      prog_report, *text_widget)
+    return T, Q, spar, nd, el, bc, src, ic, enc, mat
+
+
+def solve_network(fid, T, Q, spar, nd, el, bc, src, func, mat, logfID, prog_report, *text_widget):
+    """
+    Solves the thermal network with its driver (see network_driver), one connected component at a time when the
+    network is made of thermally disconnected parts (see component_solver).
+
+    Args and Returns as tnsdriver.
+    """
+
+    components = connected_components(nd, el, src)
+    detection = not spar.steady and (spar.steady_rate > 0.0 or spar.steady_imbalance > 0.0)
+    if not spar.component_solve or len(components) < 2 or spar.step_monitor is not None or detection:
+        # the steady state is detected on the whole network, the components would stop at different times
+        return network_driver(spar)(fid, T, Q, spar, nd, el, bc, src, func, mat, logfID, prog_report, *text_widget)
+
+    T, Q, spar, nd, el, src, func = solve_components(components, T, Q, spar, nd, el, bc, src, func, mat, logfID,
+                                                     prog_report, *text_widget)
+    if not spar.steady and fid is not None:
+        filename = re.split(r'\.', fid.name)[0] + '_timedata_py.csv'
+        with open(filename, 'w') as fplt:
+            write_time_history(fplt, T, Q, nd, el)
+        message = ('\nTime data written to: {}'.format(filename))
+        user_feedback(message, prog_report, logfID, *text_widget)
+    return T, Q, spar, nd, el, src, func
+
+
+def steady_state_reached(spar, nd, Q, dt):
+    """
+    Checks the steady state criteria at the end of a time step: the maximum rate of change of the node temperatures
+    below spar.steady_rate, the heat stored in the nodes below spar.steady_imbalance times the heat flowing through
+    the conductors (the criteria set to 0 are not used).
+
+    Args:
+        spar: Simulation parameters.
+        nd: List of nodes (temperatures at the end and at the beginning of the time step).
+        Q: heat flows of the elements.
+        dt: time step.
+
+    Returns:
+        True if all the criteria are met.
+    """
+
+    dTdt = np.array([(node.T - node.Told) / dt for node in nd])
+    if spar.steady_rate > 0.0 and np.abs(dTdt).max() > spar.steady_rate:
+        return False
+    if spar.steady_imbalance > 0.0:
+        stored = abs(sum(nd[n].rhocv * nd[n].vol * dTdt[n] for n in range(len(nd)) if nd[n].vol > 0))
+        if stored > spar.steady_imbalance * np.abs(Q).sum():
+            return False
+    return True
+
+
+def network_driver(spar):
+    """Returns the driver solving the model: tnsdriver, or multirate_driver for the multirate transient models."""
+
+    if not spar.steady and spar.multirate > 1 and spar.step_monitor is None:
+        return multirate_driver
+    return tnsdriver
+
+
+class DriverSetup:
+    """Quantities of the network computed once per run of tnsdriver (see driver_setup)."""
+
+    def __init__(self):
+        self.dense = True  # bool - the Newton loop assembles the dense network matrix (not with JFNK)
+        self.plan = None  # UpdatePlan class - update schedule of the node and element parameters (see update_schedule)
+        self.G_constant = None  # scipy.sparse matrix - pre-assembled matrix of the constant conductors
+        self.A_constant = None  # NumPy array - dense copy of G_constant (dense runs only)
+        self.colored = set()  # set - conductors of the finite-difference Jacobian (see fd_jacobian)
+        self.color = None  # NumPy array - distance-2 color of each node of the colored Jacobian
+        self.adjacency = None  # scipy.sparse matrix - node adjacency of the colored Jacobian
+
+
+def driver_setup(spar, nd, el, bc, src, mat, logfID, prog_report, *text_widget):
+    """
+    Computes the constant quantities of a network solved by tnsdriver: the update plan (the constant elements are
+    pre-processed and the constant node heat capacities evaluated), the pre-assembled matrix of the constant
+    conductors, the Jacobian coloring and the flow order (spar.flow_order). A caller solving the same network
+    many times (e.g. multirate_driver, one time step per call) keeps it in spar.setup.
+
+    Args:
+        spar, nd, el, bc, src, mat: thermal model.
+        logfID: Log file ID
+        prog_report: code for the progress report
+        *text_widget: Terminal widget (optional)
+
+    Returns:
+        DriverSetup class.
+    """
+
+    nnd = len(nd)
+    setup = DriverSetup()
+    setup.dense = spar.nonlinear_solver != 'jfnk' or spar.step_monitor is not None
+    if spar.jacobian == 'colored':
+        setup.colored = set(fd_elements(el, mat))
+        setup.color, setup.adjacency = distance2_coloring(nnd, el, setup.colored)
+    if spar.flow_sweep:  # the flow direction is fixed during the solution
+        spar.flow_order = flow_ordering(nd, el)
+
+    # Update the constant quantities once per run, the others per time step or iteration (see update_schedule)
+    setup.plan = update_plan(nd, el, bc, src, mat)
+    for e in setup.plan.elements[CONSTANT]:
+        Tel = np.array([nd[el[e].elnd[0]].T, nd[el[e].elnd[1]].T])
+        el[e] = el[e].elpre(el[e], mat, Tel, logfID, prog_report, *text_widget)
+    if not spar.steady:
+        for nn in setup.plan.capacity[CONSTANT]:
+            if nd[nn].matID is not None and nd[nn].matID > 0:
+                rho, cv = rhoCvprop(mat[nd[nn].matID], nd[nn].T)
+                nd[nn].rhocv = rho * cv
+
+    # Pre-assemble the matrix of the constant conductors, only the others are assembled every iteration
+    constant_eqs, constant_blocks = element_blocks(nd, [el[e] for e in setup.plan.elements[CONSTANT]])
+    setup.G_constant = assemble_matrix(nnd, constant_eqs, constant_blocks)
+    setup.A_constant = setup.G_constant.toarray() if setup.dense else None
+    return setup
+
+
 def tnsdriver(fid, T, Q, spar, nd, el, bc, src, func, mat, logfID, prog_report, *text_widget):
     """
     Solves the thermal network.
 
     Args:
+        fid: input file, used to name the time data file (None for in-memory runs, no time data file written).
         T: Initial nodal temperatures (NumPy array).
         Q: Initial element heat flows (NumPy array).
         spar: Simulation parameters (dictionary).
@@ -149,20 +318,32 @@ def tnsdriver(fid, T, Q, spar, nd, el, bc, src, func, mat, logfID, prog_report,
         T, Q, spar, nd, el, src, func (updated).
     """
 
-    global time, scrout  # Access global variables
-
     nnd = len(nd)
     nel = len(el)
     nsrc = len(src)
-    nbc = len(bc)
+    spar.iterations = 0
+    spar.steady_time = float('nan')
+    spar.predictor_iterations = float('nan')
 
     units, _ = setunits(spar.units)  # Get units (assuming setunits is defined)
 
-    # Initialize linear system
-    A = np.zeros((nnd, nnd))
+    # Constant quantities of the network, computed once per run (or kept by the caller, see driver_setup)
+    setup = spar.setup if spar.setup is not None else driver_setup(spar, nd, el, bc, src, mat, logfID, prog_report,
+                                                                   *text_widget)
+    plan = setup.plan
+    G_constant = setup.G_constant
+    A_constant = setup.A_constant
+    colored, color, adjacency = setup.colored, setup.color, setup.adjacency
+    eqns = np.array([nd[nn].eqn for nn in range(nnd)], dtype=int)
+
+    # Initialize linear system (JFNK runs never assemble the network matrix, see jfnk_solver)
+    A = np.zeros((nnd, nnd)) if setup.dense else None
     b = np.zeros((nnd, 1))
     lhs = np.zeros((2, 2))
     rhs = np.zeros((2, 1))
+    steady_count = 0  # consecutive time steps meeting the steady state criterion
+    stop = False  # steady state reached, the transient stops
+    final_steady = False  # steady state reached, the last time step is a steady solve
 
     if spar.steady:
         n_time_steps = 1
@@ -186,9 +367,10 @@ def tnsdriver(fid, T, Q, spar, nd, el, bc, src, func, mat, logfID, prog_report,
         Q = np.zeros(nel)
         for e in range(nel):
             el[e].Q = Q[e]
-        filename = re.split(r'\.', fid.name)[0] + '_timedata_py.csv'
-        fplt = open(filename, 'w')
-        wrt_time(fplt, 0, time, nd, el, Toff)
+        if fid is not None:  # in-memory runs (fid = None) do not write the time data file
+            filename = re.split(r'\.', fid.name)[0] + '_timedata_py.csv'
+            fplt = open(filename, 'w')
+            wrt_time(fplt, 0, time, nd, el, spar.Toff)
         next_out = spar.print_interval
         nt = 0
         timeT = np.zeros((n_time_steps + 1, nnd + 1))  # Preallocate for efficiency
@@ -197,21 +379,36 @@ def tnsdriver(fid, T, Q, spar, nd, el, bc, src, func, mat, logfID, prog_report,
         timeT[nt, 1:nnd + 1] = T - spar.Toff
         timeQ[nt, 0] = time
         timeQ[nt, 1:nel + 1] = Q
+        history = PredictorHistory(PREDICTOR_ORDER[spar.predictor])  # initial guess of the time steps
+        history.accept(time, T)
+        fixed_nodes = np.array([int(bc[spar.Dirichlet[i]].nd[j]) for i in range(spar.nDBC)
+                                for j in range(len(bc[spar.Dirichlet[i]].nd))], dtype=int)
 
     # Time step loop - n_time_steps = 1 for steady problem
     for n in range(n_time_steps):
+        if transient and n == 0:  # capacitances of the constant nodes, pre-assembled for the time step dt
+            constant_capacity = set(plan.capacity[CONSTANT]) & set(plan.volume[CONSTANT])
+            quasi_steady = set(spar.quasi_steady)  # nodes with no capacitance term (see multirate_integration)
+            cap_nodes = np.array([nn for nn in range(nnd) if nn in constant_capacity and nd[nn].vol > 0 and
+                                  nn not in quasi_steady], dtype=int)
+            other_cap_nodes = [nn for nn in range(nnd) if nn not in constant_capacity and nn not in quasi_steady]
+            cap_constant = np.array([float(np.squeeze(nd[nn].rhocv * nd[nn].vol)) / dt for nn in cap_nodes])
         if transient:
             time += dt
-            if n == n_time_steps - 1:
+            if n == n_time_steps - 1 or final_steady:
                 time = spar.end_time
             spar.time = time
             message = '\nTaking a time step to: {} {}\n'.format(time, units["time"])
             user_feedback(message, prog_report, logfID, *text_widget)
             for nn in range(nnd):
                 nd[nn].Told = nd[nn].T
+            for nn in plan.capacity[TIME]:
+                nd[nn].rhocv = evalfunc(func[nd[nn].mfncID], time)
+            for nn in plan.volume[TIME]:
+                nd[nn].vol = evalfunc(func[nd[nn].vfncID], time)
 
         # Update sources
-        for i in range(nsrc):
+        for i in sorted(plan.sources[TIME] + (plan.sources[CONSTANT] if n == 0 else [])):
             if src[i].ntype is not None:
                 if src[i].ntype == 1:  # Constant source
                     if src[i].fncqdot is not None:  # Check if 'fncqdot' exists
@@ -239,7 +436,7 @@ def tnsdriver(fid, T, Q, spar, nd, el, bc, src, func, mat, logfID, prog_report,
                     user_feedback(message, prog_report, logfID, *text_widget)
 
         # Update BCs
-        for bcn in range(nbc):
+        for bcn in plan.bcs[TIME]:
             if bc[bcn].fncTinf is not None:
                 bc[bcn].Tinf = evalfunc(func[bc[bcn].fncTinf], time)
                 for j in range(len(bc[bcn].nd)):
@@ -254,49 +451,71 @@ def tnsdriver(fid, T, Q, spar, nd, el, bc, src, func, mat, logfID, prog_report,
             if bc[bcn].fncq is not None:
                 bc[bcn].A = evalfunc(func[bc[bcn].fncq], time)
 
+        # Extrapolated initial guess of the time step (see time_predictor)
+        predicted = False
+        if transient and not final_steady and history.order > 0:
+            T_pred = predict_temperatures(history, time, T, fixed_nodes, spar.max_change)
+            if T_pred is not None:
+                predicted = True
+                for nn in range(nnd):
+                    nd[nn].T = T_pred[nn]
+                    T[nn] = nd[nn].T
+        iterations_before = spar.iterations
+
         # Nonlinear loop
         converged = False
         iter_number = 0
         message = '\n    Nonlinear Solve\n  Iteration     Residual\n  --------- ------------\n'
         user_feedback(message, prog_report, logfID, *text_widget)
+        if spar.nonlinear_solver == 'jfnk' and spar.step_monitor is None:  # see jfnk_solver
+            jfnk_solve(T, spar, nd, el, bc, src, func, mat, time, dt, transient and not final_steady, logfID,
+                       prog_report, *text_widget)
+            spar.factor = None  # no factorization of the network matrix
+            converged = True
+        elif spar.nonlinear_solver == 'kirchhoff' and not transient and spar.step_monitor is None:
+            kirchhoff_solve(T, spar, nd, el, bc, src, mat, logfID, prog_report, *text_widget)  # initial guess
+        pseudo = None
+        if spar.nonlinear_solver == 'continuation' and not transient:  # see pseudo_transient
+            pseudo = PseudoTransient()
+            fixed_eqns, _ = dirichlet_equations(spar, nd, bc)
 
         while not converged:
             iter_number += 1
+            spar.iterations += 1
 
-            # Update node parameters
+            # Update the temperature dependent node parameters
             if transient:
-                for nn in range(nnd):
-                    if nd[nn].matID is not None:  # Check if 'matID' exists
-                        if nd[nn].matID > 0:
-                            ndT = (nd[nn].T + nd[nn].Told) / 2.0
-                            rho, cv = rhoCvprop(mat[nd[nn].matID], ndT)
-                            nd[nn].rhocv = rho * cv
-                    if nd[nn].mfncID is not None:
-                        nd[nn].rhocv = evalfunc(func[nd[nn].mfncID], time)
-                    if nd[nn].vfncID is not None:
-                        nd[nn].vol = evalfunc(func[nd[nn].vfncID], time)
-
-            # Update element parameters
-            for e in range(nel):
+                for nn in plan.capacity[TEMPERATURE]:
+                    ndT = (nd[nn].T + nd[nn].Told) / 2.0
+                    rho, cv = rhoCvprop(mat[nd[nn].matID], ndT)
+                    nd[nn].rhocv = rho * cv
+
+            # Update the temperature dependent element parameters
+            for e in plan.elements[TEMPERATURE]:
                 nd1 = el[e].elnd[0]
                 nd2 = el[e].elnd[1]
                 Tel = np.array([nd[nd1].T, nd[nd2].T])
                 el[e] = el[e].elpre(el[e], mat, Tel, logfID, prog_report, *text_widget)
 
-            A[:, :] = 0.0  # reset after each iteration
-            b[:] = 0.0  # reset after each iteration
-
-            # Add capacitance term
-            if transient:
-                for nn in range(nnd):
+            A[:, :] = A_constant  # constant conductors, pre-assembled
+            Tn = np.zeros(nnd)
+            Tn[eqns] = [float(np.squeeze(nd[nn].T)) for nn in range(nnd)]
+            b[:, 0] = -(G_constant @ Tn)
+
+            # Add capacitance term (not in the final steady solve of a transient at steady state)
+            if transient and not final_steady:
+                A[eqns[cap_nodes], eqns[cap_nodes]] += cap_constant
+                b[eqns[cap_nodes], 0] += cap_constant * np.array([float(np.squeeze(nd[nn].Told - nd[nn].T))
+                                                                 for nn in cap_nodes])
+                for nn in other_cap_nodes:
                     if nd[nn].vol > 0:
                         row = nd[nn].eqn
                         cap = (nd[nn].rhocv * nd[nn].vol) / dt
                         A[row, row] += cap
                         b[row] += cap * (nd[nn].Told - nd[nn].T)
 
-            # Add elements/conductors
-            for e in range(nel):
+            # Add the temperature dependent elements/conductors
+            for e in plan.elements[TEMPERATURE]:
                 lhs[:, :] = 0.0
                 rhs[:] = 0.0
 
@@ -310,9 +529,24 @@ def tnsdriver(fid, T, Q, spar, nd, el, bc, src, func, mat, logfID, prog_report,
                 Tel = np.array([nd[nd1].T, nd[nd2].T])
                 lhs, rhs = el[e].elmat(el[e], Tel, rhs)  # Call elmat method
                 # Add to the global matrix and right-hand-side
-                A[row[:, None], col] += lhs
+                if e not in colored:
+                    A[row[:, None], col] += lhs
                 b[row] += rhs
 
+            if colored:  # derivatives of the conductors with no analytic derivative
+                rows_fd, cols_fd, values_fd = colored_jacobian(nd, el, colored, mat, color, adjacency, logfID,
+                                                               prog_report, *text_widget)
+                np.add.at(A, (rows_fd, cols_fd), values_fd)
+
+            # Temperature dependent sources, linearized at the node temperatures: -Sp on the matrix diagonal
+            for i in plan.sources[TEMPERATURE]:
+                linear = [evalfunc_slope(func[src[i].fncQT], nd[nn].T - spar.Toff) for nn in src[i].nd]
+                src[i].Sc = [S for S, _ in linear]
+                src[i].Sp = [Sp for _, Sp in linear]
+                for j in range(len(src[i].nd)):
+                    eqn = nd[src[i].nd[j]].eqn
+                    A[eqn, eqn] -= src[i].Sp[j]
+
             # Add source terms
             for i in range(nsrc):
                 for j in range(len(src[i].nd)):
@@ -346,13 +580,17 @@ def tnsdriver(fid, T, Q, spar, nd, el, bc, src, func, mat, logfID, prog_report,
                                                                                      2) != 0 else np.inf
 
             message = '\n  {:6d}    {:g}'.format(iter_number, residual)
+            if pseudo is not None:  # pseudo-transient continuation: pseudo capacitance on the diagonal
+                message += '    pseudo time step {:g}'.format(pseudo.update(residual))
+                pseudo.add_capacitance(A, fixed_eqns)
             user_feedback(message, prog_report, logfID, *text_widget)
             if residual < spar.convergence_residual:
                 converged = True
 
             # Solve linear system
             try:
-                dT = np.linalg.solve(A, b)  # Use NumPy's linear solver
+                spar.factor = factorize(A, spar)  # kept for the post-processing (e.g. sensitivity analysis)
+                dT = spar.factor.solve(b)
             except np.linalg.LinAlgError as e:  # Catch singular matrix errors
                 message = ('ERROR: Singular matrix: {}, thermal model is most likely missing a boundary condition.'
                            .format(e))
@@ -371,6 +609,14 @@ def tnsdriver(fid, T, Q, spar, nd, el, bc, src, func, mat, logfID, prog_report,
                 user_feedback(message, prog_report, logfID, *text_widget)
                 break
 
+        if transient and not final_steady:
+            if predicted:
+                history.record(spar.iterations - iterations_before)
+            history.accept(time, T)
+
+        if spar.step_monitor is not None:  # e.g. forward sensitivities of the model calibration
+            spar.step_monitor(time, dt, spar, nd, el, bc, src)
+
         # Post-process solution (heat flow rates)
         for e in range(nel):
             nd1 = el[e].elnd[0]
@@ -387,27 +633,49 @@ def tnsdriver(fid, T, Q, spar, nd, el, bc, src, func, mat, logfID, prog_report,
                         src[i].Qtot += src[i].qdot * nd[src[i].nd[j] - 1].vol  # Corrected indexing
                     elif src[i].ntype == 2 or src[i].ntype == 3:
                         src[i].Qtot += src[i].Q
+                    elif src[i].ntype == 4:
+                        Tsrc = nd[src[i].nd[j]].T - spar.Toff
+                        src[i].Qtot += evalfunc_slope(func[src[i].fncQT], Tsrc)[0]
                     else:
                         message = 'TNSolver: Oops - unknown source type in post processing.'
                         user_feedback(message, prog_report, logfID, *text_widget)
 
+        # Steady state detection
+        if transient and not final_steady and (spar.steady_rate > 0.0 or spar.steady_imbalance > 0.0):
+            steady_count = steady_count + 1 if steady_state_reached(spar, nd, Q, dt) else 0
+            if steady_count >= spar.steady_steps:
+                spar.steady_time = time
+                message = '\nSteady state detected at: {} {}\n'.format(time, units["time"])
+                user_feedback(message, prog_report, logfID, *text_widget)
+                stop = spar.steady_action == 'stop' or n == n_time_steps - 1
+
         # Output if necessary
-        if transient and n + 1 >= next_out:
+        if transient and (n + 1 >= next_out or stop or final_steady):
             nt += 1
             timeT[nt, 0] = time
             timeT[nt, 1:nnd + 1] = T - spar.Toff
             timeQ[nt, 0] = time
             timeQ[nt, 1:nel + 1] = Q
-            wrt_time(fplt, n, time, nd, el, spar.Toff)
+            if fid is not None:
+                wrt_time(fplt, n, time, nd, el, spar.Toff)
             next_out += spar.print_interval
             next_out = min(next_out, n_time_steps - 1)
 
+        if stop or final_steady:
+            break
+        if spar.steady_time == spar.steady_time:  # steady state detected, solve for the final steady state
+            final_steady = True
+
     # Convert temperatures to I/O units
     if transient:
-        fplt.close()  # Close the file
-        message = ('\nTime data written to: {}'.format(filename))
-        user_feedback(message, prog_report, logfID, *text_widget)
+        if fid is not None:
+            fplt.close()  # Close the file
+            message = ('\nTime data written to: {}'.format(filename))
+            user_feedback(message, prog_report, logfID, *text_widget)
 
+        write_predictor_statistics(spar, history, logfID, prog_report, *text_widget)
+        timeT = timeT[:nt + 1]  # the printed time steps (print interval, end at steady state)
+        timeQ = timeQ[:nt + 1]
         T = timeT
         for n in range(nnd):
             nd[n].T = T[-1, n + 1]  # Corrected indexing
@@ -616,6 +884,17 @@ def init(spar, nd, el, bc, src, ic, func, enc, mat, logfID, prog_report, *text_w
                            format(src[i].strQ, src[i].type))
                 user_feedback(message, prog_report, logfID, *text_widget)
 
+        if len(src[i].strQT) != 0:  # User defined function of the node temperature
+            ndx = matchfunc(func, src[i].strQT)
+            if ndx != -1:
+                src[i].fncQT = ndx
+                src[i].Sc = [0.0] * len(src[i].nd)
+                src[i].Sp = [0.0] * len(src[i].nd)
+            else:
+                message = ('\nERROR: Cannot find matching function {} for source{}.\n'.
+                           format(src[i].strQT, src[i].type))
+                user_feedback(message, prog_report, logfID, *text_widget)
+
         if src[i].fncqdot is not None:  # User function Q_dot exists
             src[i].qdot = evalfunc(func[src[i].fncqdot], initial_time)
 
@@ -744,6 +1023,10 @@ def init(spar, nd, el, bc, src, ic, func, enc, mat, logfID, prog_report, *text_w
         el[e] = el[e].elpre(el[e], mat, Tel, logfID, prog_report, *text_widget)
         el[e], Q[e] = el[e].elpost(el[e], Tel)
 
+    write_update_plan(update_plan(nd, el, bc, src, mat), not spar.steady, logfID, prog_report, *text_widget)
+    if not spar.steady:  # time constants of the network, automatic time parameters
+        time_step_analysis(spar, nd, el, bc, func, mat, logfID, prog_report, *text_widget)
+
     return T, Q, spar, nd, el, bc, src, ic, func, enc, mat
 
 
@@ -288,3 +288,39 @@ def evalfunc(func, ind_v):
         pass
 
     return val
+
+
+def evalfunc_slope(func, ind_v):
+    """
+    Evaluates a function and its derivative at a value of the independent variable (e.g. a source function of the
+    temperature, linearized as S = Sc + Sp*(T - T*)).
+
+    The tables (linear interpolation) hold their end values outside their range (constant extrapolation, zero
+    derivative), so an iterate beyond the table does not turn the source into NaN.
+
+    Args:
+        func: function (see evalfunc).
+        ind_v: value of the independent variable.
+
+    Returns:
+        A tuple containing the function value and its derivative (central difference, exact for the polynomials).
+    """
+
+    data = np.array(func.data)
+    if func.type == 1:  # table, the end values are held outside its range
+        lo, hi = data[0, 0], data[-1, 0]
+        val = float(np.squeeze(evalfunc(func, min(max(ind_v, lo), hi))))
+    else:
+        val = float(np.squeeze(evalfunc(func, ind_v)))
+    if func.type == 0:
+        return val, 0.0
+    if func.type == 3:
+        return val, float(np.polyval(np.polyder(data), ind_v))
+    h = 1.0e-4 * max(1.0, abs(ind_v))
+    if func.type == 1:  # stay inside the table, linear interpolation is not extrapolated
+        a, b = max(ind_v - h, lo), min(ind_v + h, hi)
+    else:
+        a, b = ind_v - h, ind_v + h
+    if b <= a:
+        return val, 0.0
+    return val, (float(np.squeeze(evalfunc(func, b))) - float(np.squeeze(evalfunc(func, a)))) / (b - a)
@@ -0,0 +1,117 @@
+"""
+Sparse finite-difference Jacobian of the conductors with no analytic derivative.
+
+The element matrix of a convection correlation (and of the user correlations, elpre_FCuser and elpre_NCuser) is
+its conductance h*A: the derivative of h with respect to the temperatures is missing from the Newton matrix of
+tnsdriver, and the nonlinear iterations converge linearly. With 'jacobian = colored' the matrix of these
+conductors is replaced by the finite-difference derivative of their residual.
+
+A perturbation of a node temperature changes the residual of the node and of its neighbours only, so the nodes with
+no common neighbour (distance-2 coloring of the conductor graph) are perturbed together: the whole Jacobian takes
+one residual evaluation per color, a number bounded by the node degrees and independent of the network size.
+"""
+
+import copy
+import numpy as np
+from .network_assembly import is_linear_element
+
+FD_EPS = 1.0e-7  # relative temperature perturbation
+
+
+def fd_elements(el, mat):
+    """
+    Lists the elements whose matrix is replaced by the finite-difference Jacobian: the temperature dependent
+    conductors, except radiation (its element matrix is the exact derivative).
+
+    Returns:
+        List of element numbers.
+    """
+
+    return [e for e in range(len(el)) if el[e].elst != 3 and not is_linear_element(el[e], mat)]
+
+
+def distance2_coloring(nnd, el, elements):
+    """
+    Greedy distance-2 coloring of the nodes of the given elements (largest degree first): two nodes connected by an
+    element, or with a common neighbour, have different colors.
+
+    Returns:
+        A tuple containing the color of each node (-1 for the nodes of no element, NumPy array) and the neighbours
+        of each node (list of sets).
+    """
+
+    adjacency = [set() for _ in range(nnd)]
+    for e in elements:
+        n1, n2 = el[e].elnd
+        if n1 != n2:
+            adjacency[n1].add(n2)
+            adjacency[n2].add(n1)
+
+    color = -np.ones(nnd, dtype=int)
+    for n in sorted((n for n in range(nnd) if adjacency[n]), key=lambda n: -len(adjacency[n])):
+        forbidden = set()
+        for m in adjacency[n]:
+            forbidden.add(color[m])
+            forbidden.update(color[k] for k in adjacency[m])
+        c = 0
+        while c in forbidden:
+            c += 1
+        color[n] = c
+    return color, adjacency
+
+
+def element_residual(T, nd, el, elements, mat, logfID, prog_report, *text_widget):
+    """
+    Assembles the residual of the given elements at the node temperatures T (K, by node number), without changing
+    the elements.
+
+    Returns:
+        The residual (NumPy array, by equation number).
+    """
+
+    b = np.zeros(len(nd))
+    for e in elements:
+        n1, n2 = el[e].elnd
+        Tel = np.array([T[n1], T[n2]])
+        element = copy.copy(el[e])
+        element = element.elpre(element, mat, Tel, logfID, prog_report, *text_widget)
+        _, rhs = element.elmat(element, Tel, np.zeros((2, 1)))
+        b[[nd[n1].eqn, nd[n2].eqn]] += np.asarray(rhs, dtype=float).reshape(2)
+    return b
+
+
+def colored_jacobian(nd, el, elements, mat, color, adjacency, logfID, prog_report, *text_widget):
+    """
+    Evaluates the finite-difference Jacobian of the residual of the given elements at the node temperatures, with
+    one residual evaluation per color.
+
+    Args:
+        nd, el, mat: thermal model (temperatures in K).
+        elements: element numbers (see fd_elements).
+        color, adjacency: node coloring (see distance2_coloring).
+        logfID: Log file ID
+        prog_report: code for the progress report
+        *text_widget: Terminal widget (optional)
+
+    Returns:
+        A tuple containing the rows, columns (equation numbers) and values of the matrix entries, in the sign
+        convention of tnsdriver (A dT = b: the matrix is minus the derivative of the residual).
+    """
+
+    T = np.array([node.T for node in nd], dtype=float)
+    F0 = element_residual(T, nd, el, elements, mat, logfID, prog_report, *text_widget)
+    rows = []
+    cols = []
+    values = []
+    for c in range(color.max() + 1):
+        nodes = np.flatnonzero(color == c)
+        h = FD_EPS * np.maximum(np.abs(T[nodes]), 1.0)
+        Tp = T.copy()
+        Tp[nodes] += h
+        dF = element_residual(Tp, nd, el, elements, mat, logfID, prog_report, *text_widget) - F0
+        for n, hn in zip(nodes, h):  # the rows changed by the node n are its own and its neighbours'
+            for m in [n] + list(adjacency[n]):
+                rows.append(nd[m].eqn)
+                cols.append(nd[n].eqn)
+                values.append(-dF[nd[m].eqn] / hn)
+    return np.array(rows, dtype=int), np.array(cols, dtype=int), np.array(values)
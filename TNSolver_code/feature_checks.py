@@ -0,0 +1,740 @@
+"""
+Consistency checks of the solver features against independent oracles.
+
+The regression harness (regression_check) compares the Test_Gui cases against stored outputs; these checks build
+small models on the fly and compare each feature against a result obtained in a different way, e.g. a solver
+option against the plain dense solve, a derivative against finite differences, a fast re-evaluation against a
+full re-solve. Each check is a function registered with the check decorator, taking a scratch folder and returning
+a short description of what was verified; a failed comparison raises CheckFailure.
+
+Usage:
+    python -m TNSolver_code.feature_checks [--checks name ...]
+"""
+
+import os
+import sys
+import argparse
+import tempfile
+import traceback
+import numpy as np
+import scipy.sparse as sparse
+
+CHECKS = {}  # name: check function, in registration order
+
+
+class CheckFailure(Exception):
+    pass
+
+
+def check(function):
+    """Registers a check function."""
+
+    CHECKS[function.__name__] = function
+    return function
+
+
+def expect_close(what, value, reference, rtol=1.0e-8, atol=1.0e-8):
+    """Raises CheckFailure if |value - reference| > atol + rtol * |reference| anywhere, returns the max difference."""
+
+    value = np.asarray(value, dtype=float)
+    reference = np.asarray(reference, dtype=float)
+    if value.shape != reference.shape:
+        raise CheckFailure('{}: shape {} instead of {}'.format(what, value.shape, reference.shape))
+    difference = np.abs(value - reference)
+    if not np.all(difference <= atol + rtol * np.abs(reference)):
+        raise CheckFailure('{}: max difference {:g}'.format(what, difference.max()))
+    return float(difference.max()) if difference.size else 0.0
+
+
+def write_model(work_dir, name, parameters, nodes, conductors, bcs=(), sources=(), ics=(), functions=()):
+    """
+    Writes an input file.
+
+    Args:
+        work_dir: folder of the input file.
+        name: base name of the model.
+        parameters: lines of the solution parameters (e.g. 'type = steady').
+        nodes, conductors, bcs, sources, ics: lines of the blocks (e.g. '1 steel 0.001').
+        functions: lines of the functions block.
+
+    Returns:
+        The base name of the input file (with the folder).
+    """
+
+    base_file_name = os.path.join(work_dir, name)
+    blocks = [('Solution Parameters', parameters), ('Nodes', nodes), ('Conductors', conductors),
+              ('Boundary Conditions', bcs), ('Sources', sources), ('Initial Conditions', ics),
+              ('Radiation Enclosure', ()), ('Functions', functions), ('Material', ())]
+    with open(base_file_name + '.inp', 'w') as fid:
+        for block, lines in blocks:
+            fid.write('Begin {}\n'.format(block))
+            for line in lines:
+                fid.write('   {}\n'.format(line))
+            fid.write('End {}\n'.format(block))
+    return base_file_name
+
+
+STEADY = ['title = check', 'type = steady', 'units = SI', 'T units = C', 'nonlinear convergence = 1e-12',
+          'maximum nonlinear iterations = 100']
+
+
+LINEAR_CONDUCTORS = ['c1 conduction 1 2 150.0 0.15 0.1', 'c2 cylindrical 2 3 50.0 0.02 0.05 0.3',
+                     'c3 spherical 3 4 20.0 0.05 0.12', 'c4 conduction 2 4 80.0 0.3 0.1', 'c5 convection 4 5 25.0 0.2',
+                     'c6 conduction 3 6 30.0 0.1 0.1', 'c7 convection 6 5 40.0 0.05',
+                     'c8 conduction 6 7 60.0 0.2 0.02', 'c9 convection 7 5 15.0 0.1']
+LINEAR_BCS = ['fixed_T 100.0 1', 'fixed_T 20.0 5', 'heat_flux 200.0 0.05 2']
+LINEAR_SOURCES = ['Qsrc 50.0 3', 'Qsrc 10.0 6', 'qdot 1000.0 4', 'qdot 500.0 7']
+
+
+def linear_model(work_dir, name='linear', conductors=LINEAR_CONDUCTORS, bcs=LINEAR_BCS, sources=LINEAR_SOURCES):
+    """Writes a linear steady model with every kind of linear conductor, source and BC, returns its base name."""
+
+    nodes = ['1 air 0.0', '2 air 0.0', '3 air 0.0', '4 air 0.01', '5 air 0.0', '6 air 0.0', '7 air 0.002']
+    return write_model(work_dir, name, STEADY, nodes, conductors, bcs, sources)
+
+
+def grid_matrix(nx, ny, seed=0, shuffle=True):
+    """
+    Returns the matrix of a random nx x ny grid network (NumPy array): conductors between the neighbour nodes and to
+    the ambient, with the node numbers shuffled (the natural numbering has a small bandwidth).
+    """
+
+    rng = np.random.default_rng(seed)
+    n = nx * ny
+    A = np.diag(rng.uniform(0.1, 1.0, n))
+    for i in range(nx):
+        for j in range(ny):
+            for k, l in ((i + 1, j), (i, j + 1)):
+                if k < nx and l < ny:
+                    a, b = i * ny + j, k * ny + l
+                    G = rng.uniform(1.0, 10.0)
+                    A[[a, b], [a, b]] += G
+                    A[a, b] -= G
+                    A[b, a] -= G
+    order = rng.permutation(n) if shuffle else np.arange(n)
+    return A[np.ix_(order, order)]
+
+
+def expect_solves(what, factor, A, seed=1):
+    """Compares the solves of a factorization (vector and matrix right-hand sides, N and T) against the dense solve."""
+
+    rng = np.random.default_rng(seed)
+    worst = 0.0
+    for b in (rng.standard_normal(A.shape[0]), rng.standard_normal((A.shape[0], 3))):
+        for trans, M in (('N', A), ('T', A.T)):
+            worst = max(worst, expect_close('{} solve {}'.format(what, trans), factor.solve(b, trans=trans),
+                                            np.linalg.solve(M, b), rtol=1.0e-9, atol=1.0e-9))
+    return worst
+
+
+def transient_parameters(end_time, steps):
+    """Returns the solution parameters of a transient run printing every time step."""
+
+    return ['title = check', 'type = transient', 'units = SI', 'T units = C', 'nonlinear convergence = 1e-12',
+            'maximum nonlinear iterations = 100', 'begin time = 0', 'end time = {}'.format(end_time),
+            'number of time steps = {}'.format(steps), 'print interval = 1']
+
+
+def ladder_model(work_dir, name, parameters, n=20, ambient=True):
+    """
+    Writes a linear model made of a chain of n capacitive nodes (1..n) with parallel conductors between them,
+    each one connected to the ambient (node 999) through a series of arithmetic nodes (100+i, 200+i), and clusters
+    of arithmetic nodes (300+i...) every 4 nodes; returns its base name. Without ambient the series go to the next
+    node (a network with a small bandwidth) and the last node has a fixed temperature.
+    """
+
+    nodes = ['999 air 0.0'] if ambient else []
+    conductors = []
+    sources = []
+    for i in range(1, n + 1):
+        nodes += ['{} steel 0.0005'.format(i), '{} air 0.0'.format(100 + i), '{} air 0.0'.format(200 + i)]
+        conductors += ['s{0}a conduction {0} {1} 40.0 0.05 0.001'.format(i, 100 + i),
+                       's{0}b convection {0} {1} 200.0 0.01'.format(100 + i, 200 + i),
+                       's{}c conduction {} {} 2.0 0.1 0.01'.format(i, 200 + i,
+                                                                   999 if ambient else i + 1 if i < n else i - 1)]
+        sources.append('Qsrc {} {}'.format(2.0 + 0.5 * i, i))
+        if i < n:
+            conductors += ['p{0}a conduction {0} {1} 50.0 0.1 0.01'.format(i, i + 1),
+                           'p{0}b convection {0} {1} 10.0 0.02'.format(i, i + 1)]
+        if i % 4 == 0 and i < n:
+            c = [300 + 3 * i, 301 + 3 * i, 302 + 3 * i]
+            nodes += ['{} air 0.0'.format(label) for label in c]
+            conductors += ['c{}a conduction {} {} 30.0 0.1 0.01'.format(i, i, c[0]),
+                           'c{}b conduction {} {} 20.0 0.1 0.01'.format(i, c[0], c[1]),
+                           'c{}c conduction {} {} 25.0 0.1 0.01'.format(i, c[1], c[2]),
+                           'c{}d conduction {} {} 15.0 0.1 0.01'.format(i, c[2], c[0]),
+                           'c{}e conduction {} {} 35.0 0.1 0.01'.format(i, c[2], i + 1)]
+    bcs = ['fixed_T 20.0 {}'.format(999 if ambient else n), 'fixed_T 100.0 1']
+    return write_model(work_dir, name, parameters, nodes, conductors, bcs, sources, ['20.0 all'])
+
+
+def solved_session(base_file_name):
+    """Returns the SolverSession of a model after solving it."""
+
+    from .solver_session import SolverSession
+
+    session = SolverSession(base_file_name)
+    if not session.ready:
+        raise CheckFailure('errors reading {}'.format(base_file_name))
+    session.solve()
+    return session
+
+
+def advection_model(work_dir, name, parameters, n=30, loops=True, wall_conduction=True):
+    """
+    Writes a duct model: a chain of n + 1 fluid nodes (advection, outflow to the outlet node) heated by the wall
+    nodes through convection, with the axial wall conduction (the coupling against the flow) and flow loops
+    (recirculations) as options; the node labels are shuffled. Returns its base name.
+    """
+
+    labels = list(range(1, 2 * n + 3))
+    np.random.default_rng(3).shuffle(labels)
+    fluid = labels[:n + 1]  # 0 is the inlet
+    wall = labels[n + 1:2 * n + 1]
+    outlet = labels[2 * n + 1]
+    nodes = ['{} air 0.0'.format(label) for label in sorted(labels)]
+    conductors = ['f{} advection {} {} water 0.01 0.0002'.format(i, fluid[i], fluid[i + 1]) for i in range(n)]
+    for i in range(n):
+        conductors.append('h{} convection {} {} 500.0 0.01'.format(i, wall[i], fluid[i + 1]))
+        if wall_conduction and i < n - 1:
+            conductors.append('w{} conduction {} {} 15.0 0.01 0.0001'.format(i, wall[i], wall[i + 1]))
+    conductors.append('out outflow {} {} water 0.01 0.0002'.format(fluid[n], outlet))
+    if loops:
+        conductors += ['r1 advection {} {} water 0.002 0.0002'.format(fluid[n // 2], fluid[n // 4]),
+                       'r2 advection {} {} water 0.002 0.0002'.format(fluid[n - 5], fluid[n // 2 + 3])]
+    sources = ['Qsrc 50.0 {}'.format(wall[i]) for i in range(0, n, 7)]
+    return write_model(work_dir, name, parameters, nodes, conductors,
+                       ['fixed_T 20.0 {}'.format(fluid[0]), 'fixed_T 20.0 {}'.format(outlet)], sources)
+
+
+def foil_model(work_dir, name, steps, options=()):
+    """
+    Writes a transient model with widely separated time constants, a slow chain of 6 blocks (about 15 min) heated
+    by 3 thin foils (about 4 s) with a source, in 100 s; returns its base name.
+    """
+
+    nodes = ['{} steel 0.001'.format(i) for i in range(1, 7)] + ['{} steel 0.000002'.format(10 + i)
+                                                                  for i in range(1, 4)] + ['99 air 0.0']
+    conductors = ['b{0} conduction {0} {1} 40.0 0.1 0.01'.format(i, i + 1) for i in range(1, 6)]
+    conductors.append('b6 conduction 6 99 40.0 0.1 0.01')
+    sources = []
+    for i in range(1, 4):
+        conductors += ['f{0} convection {1} {0} 100.0 0.01'.format(10 + i, 2 * i - 1),
+                       'a{0} convection {0} 99 100.0 0.01'.format(10 + i)]
+        sources.append('Qsrc 20.0 {}'.format(10 + i))
+    return write_model(work_dir, name, transient_parameters(100.0, steps) + list(options), nodes, conductors,
+                       ['fixed_T 20.0 99'], sources, ['20.0 all'])
+
+
+def fin_model(work_dir, name, steps, n=60, options=()):
+    """
+    Writes a transient model of a fin of n capacitive nodes, its base at 100 C and cooled by convection to 20 C,
+    heating up in 2000 s; returns its base name.
+    """
+
+    nodes = ['{} steel 0.00001'.format(i) for i in range(1, n + 1)] + ['98 air 0.0', '99 air 0.0']
+    conductors = ['k{0} conduction {0} {1} 40.0 0.01 0.0001'.format(i, i + 1) for i in range(1, n)]
+    conductors += ['h{0} convection {0} 99 20.0 0.0004'.format(i) for i in range(1, n + 1)]
+    conductors.append('b1 conduction 98 1 40.0 0.005 0.0001')
+    return write_model(work_dir, name, transient_parameters(2000.0, steps) + list(options), nodes, conductors,
+                       ['fixed_T 100.0 98', 'fixed_T 20.0 99'], [], ['20.0 all'])
+
+
+def solver_results(base_file_name):
+    """Solves a model with tn_solver (output files included), returns T, Q (NumPy arrays)."""
+
+    from .core_solver import tn_solver
+
+    results = tn_solver(base_file_name, 0)
+    if results[0] is None:
+        raise CheckFailure('{} not solved'.format(os.path.basename(base_file_name)))
+    return np.asarray(results[0], dtype=float), np.asarray(results[1], dtype=float)
+
+
+def reduced_size(base_file_name):
+    """Returns the number of nodes of the full and of the reduced (coarsened or condensed) network of a model."""
+
+    from .solver_session import SolverSession
+    from .network_coarsening import coarsen_network
+
+    T, Q, spar, nd, el, bc, src, ic, func, enc, mat = SolverSession(base_file_name).model()
+    net = coarsen_network(T, Q, spar, nd, el, bc, src, mat, None, 0)
+    return len(nd), len(net.nd)
+
+
+@check
+def adjoint_sensitivity(work_dir):
+    """Adjoint sensitivities of a linear steady model against central finite differences."""
+
+    from .solver_session import SolverSession
+    from .sensitivity_analysis import adjoint_sensitivity as adjoint
+
+    session = SolverSession(linear_model(work_dir))
+    session.solve()
+    parameters = adjoint('4', session.spar, session.nd, session.el, session.bc, session.src)
+    names = {(par.kind, par.label, par.name) for par in parameters}
+    for name in ('ri', 'ro', 'cylL'):
+        if ('conductor', 'c2', name) not in names:
+            raise CheckFailure('cylindrical conductor parameter {} missing'.format(name))
+    worst = 0.0
+    for par in parameters:
+        h = 1.0e-5 * abs(par.value)
+        T = []
+        for value in (par.value + h, par.value - h):
+            session.set_parameter(par.kind, par.label, par.name, value)
+            session.solve()
+            T.append(session.node_temperatures(['4'])['4'])
+        session.set_parameter(par.kind, par.label, par.name, par.value)
+        fd = (T[0] - T[1]) / (2 * h)
+        worst = max(worst, expect_close('{} {} {}'.format(par.kind, par.label, par.name), par.dTdp, fd,
+                                        rtol=1.0e-5, atol=1.0e-6 * max(1.0, abs(fd))))
+    return '{} parameters, max |dT/dp - FD| {:.2g}'.format(len(parameters), worst)
+
+
+@check
+def radiation_classification(work_dir):
+    """Radiation and surfrad conductors are not linear, their sensitivities (sF, A) against finite differences."""
+
+    from .solver_session import SolverSession
+    from .network_assembly import is_linear_element
+    from .sensitivity_analysis import adjoint_sensitivity as adjoint
+    from .influence_matrix import influence_matrix
+
+    nodes = ['1 air 0.0', '2 air 0.0', '3 air 0.0']
+    conductors = ['c1 conduction 1 2 50.0 0.1 0.01', 'r1 radiation 2 3 0.8 0.5', 's1 surfrad 2 3 0.6 0.3']
+    session = SolverSession(write_model(work_dir, 'radiation', STEADY, nodes, conductors,
+                                        ['fixed_T 400.0 1', 'fixed_T 20.0 3'], ['Qsrc 100.0 2']))
+    session.solve()
+    if any(is_linear_element(element, session.mat) for element in session.el if element.elst in (3, 4)):
+        raise CheckFailure('radiation conductor classified as linear')
+    try:
+        influence_matrix(session.spar, session.nd, session.el, session.bc, session.src, session.mat)
+        raise CheckFailure('influence matrix of a radiation model accepted')
+    except ValueError:
+        pass
+    parameters = [par for par in adjoint('2', session.spar, session.nd, session.el, session.bc, session.src)
+                  if par.label in ('r1', 's1')]
+    if sorted((par.label, par.name) for par in parameters) != [('r1', 'A'), ('r1', 'sF'), ('s1', 'A'),
+                                                                ('s1', 'sF')]:
+        raise CheckFailure('radiation parameters: {}'.format([(par.label, par.name) for par in parameters]))
+    worst = 0.0
+    for par in parameters:
+        h = 1.0e-5 * abs(par.value)
+        T = []
+        for value in (par.value + h, par.value - h):
+            session.set_parameter(par.kind, par.label, par.name, value)
+            session.solve()
+            T.append(session.node_temperatures(['2'])['2'])
+        session.set_parameter(par.kind, par.label, par.name, par.value)
+        worst = max(worst, expect_close('{} {}'.format(par.label, par.name), par.dTdp, (T[0] - T[1]) / (2 * h),
+                                        rtol=1.0e-4, atol=1.0e-6))
+    return 'not linear, {} parameters, max |dT/dp - FD| {:.2g}'.format(len(parameters), worst)
+
+
+@check
+def coarsening_steady(work_dir):
+    """Steady solve of the coarsened network (series, parallel, condensation) against the full network."""
+
+    T, Q = solver_results(ladder_model(work_dir, 'full', STEADY))
+    coarse = ladder_model(work_dir, 'coarse', STEADY + ['network coarsening = yes'])
+    Tc, Qc = solver_results(coarse)
+    difference = expect_close('node temperatures', Tc, T, rtol=1.0e-9, atol=1.0e-9)
+    expect_close('conductor heat flows', Qc, Q, rtol=1.0e-8, atol=1.0e-9)
+    return '{} nodes reduced to {}, max |dT| {:.2g}'.format(*reduced_size(coarse), difference)
+
+
+@check
+def condensation_transient(work_dir):
+    """Transient solve with static condensation of the arithmetic nodes against the full network."""
+
+    parameters = transient_parameters(200.0, 20)
+    T, Q = solver_results(ladder_model(work_dir, 'full', parameters))
+    condensed = ladder_model(work_dir, 'condensed', parameters + ['static condensation = yes'])
+    Tc, Qc = solver_results(condensed)
+    difference = expect_close('temperature histories', Tc, T, rtol=1.0e-8, atol=1.0e-8)
+    expect_close('heat flow histories', Qc, Q, rtol=1.0e-7, atol=1.0e-8)
+    return '{} nodes reduced to {}, {} time steps, max |dT| {:.2g}'.format(*reduced_size(condensed),
+                                                                           T.shape[0] - 1, difference)
+
+
+@check
+def schur_factor(work_dir):
+    """Domain decomposition (Schur complement) solves against the dense solve, matrix and model."""
+
+    from .linear_solvers import SchurFactor
+    from .network_graph import partition_graph
+
+    A = grid_matrix(12, 9)
+    worst = 0.0
+    for n_parts in (2, 5):
+        parts = partition_graph(sparse.csr_matrix(A != 0), n_parts)
+        worst = max(worst, expect_solves('{} subdomains'.format(n_parts), SchurFactor(A, parts), A))
+
+    T, Q = solver_results(ladder_model(work_dir, 'dense', STEADY + ['banded solver = no']))
+    Ts, Qs = solver_results(ladder_model(work_dir, 'schur', STEADY + ['domain decomposition = 4']))
+    difference = expect_close('node temperatures', Ts, T, rtol=1.0e-9, atol=1.0e-9)
+    expect_close('conductor heat flows', Qs, Q, rtol=1.0e-8, atol=1.0e-9)
+    return 'max solve difference {:.2g}, model max |dT| {:.2g}'.format(worst, difference)
+
+
+@check
+def banded_factor(work_dir):
+    """Banded and tridiagonal factorizations after renumbering against the dense solve, matrix and model."""
+
+    from .linear_solvers import BandedFactor
+    from .network_graph import bandwidth_ordering
+    from .solver_session import SolverSession
+
+    worst = 0.0
+    for what, A, expected in (('chain', grid_matrix(60, 1), 1), ('strip', grid_matrix(30, 4), 4)):
+        order, bw = bandwidth_ordering(sparse.csr_matrix(A != 0))
+        if bw != expected:
+            raise CheckFailure('{}: half bandwidth {} instead of {}'.format(what, bw, expected))
+        worst = max(worst, expect_solves(what, BandedFactor(A, order, bw), A))
+
+    T, Q = solver_results(ladder_model(work_dir, 'dense', STEADY + ['banded solver = no'], 40, False))
+    banded = ladder_model(work_dir, 'banded', STEADY + ['banded solver = yes'], 40, False)
+    Tb, Qb = solver_results(banded)
+    difference = expect_close('node temperatures', Tb, T, rtol=1.0e-9, atol=1.0e-9)
+    expect_close('conductor heat flows', Qb, Q, rtol=1.0e-8, atol=1.0e-9)
+    session = SolverSession(banded)
+    session.solve()
+    if not isinstance(session.spar.factor, BandedFactor):
+        raise CheckFailure('model not solved by the banded factorization')
+    return 'max solve difference {:.2g}, model (half bandwidth {}) max |dT| {:.2g}'.format(
+        worst, session.spar.bandwidth, difference)
+
+
+@check
+def sweep_factor(work_dir):
+    """Flow ordered sweep solver of duct models (with and without outer coupling) against the dense solve."""
+
+    from .linear_solvers import SweepFactor
+    from .solver_session import SolverSession
+
+    worst = 0.0
+    details = []
+    for what, options in (('pure advection', {'loops': False, 'wall_conduction': False}),
+                          ('loops and wall conduction', {})):
+        T, Q = solver_results(advection_model(work_dir, 'dense', STEADY + ['flow sweep = no', 'banded solver = no'],
+                                              **options))
+        sweep = advection_model(work_dir, 'sweep', STEADY + ['flow sweep = yes'], **options)
+        Ts, Qs = solver_results(sweep)
+        difference = expect_close('{}: node temperatures'.format(what), Ts, T, rtol=1.0e-9, atol=1.0e-8)
+        expect_close('{}: conductor heat flows'.format(what), Qs, Q, rtol=1.0e-8, atol=1.0e-8)
+
+        session = SolverSession(sweep)
+        session.solve()
+        factor = session.spar.factor
+        if not isinstance(factor, SweepFactor):
+            raise CheckFailure('{}: model not solved by the sweep solver'.format(what))
+        A = np.empty(factor.shape)
+        A[np.ix_(factor.order, factor.order)] = factor.A.toarray()  # matrix in the original equation order
+        worst = max(worst, expect_solves(what, factor, A))
+        details.append('{} max |dT| {:.2g}'.format(what, difference))
+    return '{}, max solve difference {:.2g}'.format(', '.join(details), worst)
+
+
+@check
+def multirate_accuracy(work_dir):
+    """Multirate integration against the single rate one at the same time step, errors from a fine step run."""
+
+    import time
+
+    steps, substeps, refinement = 10, 8, 64
+    T_fine, _ = solver_results(foil_model(work_dir, 'fine', steps * refinement))
+    reference = T_fine[::refinement]
+    T_single, _ = solver_results(foil_model(work_dir, 'single', steps))
+    start = time.perf_counter()
+    solver_results(foil_model(work_dir, 'substeps', steps * substeps))
+    time_sub = time.perf_counter() - start
+    start = time.perf_counter()
+    T_multi, _ = solver_results(foil_model(work_dir, 'multirate', steps,
+                                           ['multirate substeps = {}'.format(substeps)]))
+    time_multi = time.perf_counter() - start
+    error_single = np.abs(T_single[:, 1:] - reference[:, 1:]).max()
+    error_multi = np.abs(T_multi[:, 1:] - reference[:, 1:]).max()
+    if not error_multi < 0.5 * error_single:
+        raise CheckFailure('multirate error {:.3g} K, single rate error {:.3g} K'.format(error_multi, error_single))
+    return 'max error {:.3g} K (single rate {:.3g} K), run time {:.2f} s (sub-step time step {:.2f} s)'.format(
+        error_multi, error_single, time_multi, time_sub)
+
+
+@check
+def multirate_output(work_dir):
+    """Multirate time histories at the print interval and steady state detection, one setup of the slow steps."""
+
+    from . import core_solver
+
+    multirate = ['multirate substeps = 8']
+    setups = []
+    driver_setup = core_solver.driver_setup
+
+    def counted_setup(*args):
+        setups.append(args[0])
+        return driver_setup(*args)
+
+    core_solver.driver_setup = counted_setup
+    try:
+        T_all, Q_all = solver_results(foil_model(work_dir, 'multirate_all', 20, multirate))
+        T_print, Q_print = solver_results(foil_model(work_dir, 'multirate_print', 20,
+                                                     multirate + ['print interval = 2']))
+    finally:
+        core_solver.driver_setup = driver_setup
+    if len(setups) != 2:
+        raise CheckFailure('{} setups of the slow steps for 2 runs'.format(len(setups)))
+    T_single, _ = solver_results(foil_model(work_dir, 'single_print', 20, ['print interval = 2']))
+    if T_print.shape != T_single.shape or not np.array_equal(T_print[:, 0], T_single[:, 0]):
+        raise CheckFailure('rows at {}, single rate at {}'.format(T_print[:, 0], T_single[:, 0]))
+    rows = np.searchsorted(T_all[:, 0], T_print[:, 0])
+    expect_close('printed temperatures', T_print, T_all[rows], rtol=0.0, atol=0.0)
+    expect_close('printed heat flows', Q_print, Q_all[rows], rtol=0.0, atol=0.0)
+
+    results = []
+    detection = ['steady detection rate = 0.01', 'steady detection action = steady']
+    for name, options in (('multirate_steady', multirate + detection), ('single_steady', detection)):
+        solution = core_solver.tn_solver(foil_model(work_dir, name, 20, options), 0)
+        if solution[0] is None:
+            raise CheckFailure('{} not solved'.format(name))
+        results.append((np.asarray(solution[0]), solution[4].steady_time))
+    (T, steady_time), (T_ref, _) = results
+    if not steady_time < 100.0 or T[-1, 0] != 100.0 or T.shape[0] >= T_all.shape[0]:
+        raise CheckFailure('steady state at {:g} s, {} rows to {:g} s'.format(steady_time, T.shape[0], T[-1, 0]))
+    difference = expect_close('final steady state', T[-1], T_ref[-1], rtol=1.0e-9, atol=1.0e-9)
+    return '{} rows at the print interval, steady state at {:g} s, final steady max |dT| {:.2g}'.format(
+        T_print.shape[0], steady_time, difference)
+
+
+@check
+def component_steady_detection(work_dir):
+    """Transient with steady state detection of a network in two disconnected parts, components on and off."""
+
+    from .core_solver import tn_solver
+
+    nodes = ['1 steel 0.001', '2 steel 0.0001', '3 air 0.0', '4 air 0.0']
+    conductors = ['k1 conduction 1 3 40.0 0.1 0.01', 'k2 conduction 2 4 40.0 0.1 0.01']
+    results = []
+    for solve in ('yes', 'no'):
+        parameters = transient_parameters(3000.0, 300) + ['steady detection rate = 0.001',
+                                                          'component solve = {}'.format(solve)]
+        base_file_name = write_model(work_dir, 'components_' + solve, parameters, nodes, conductors,
+                                     ['fixed_T 20.0 3', 'fixed_T 20.0 4'], ['Qsrc 10.0 1', 'Qsrc 5.0 2'],
+                                     ['20.0 all'])
+        solution = tn_solver(base_file_name, 0)
+        if solution[0] is None:
+            raise CheckFailure('component solve = {}: not solved'.format(solve))
+        results.append((np.asarray(solution[0]), np.asarray(solution[1]), solution[4].steady_time))
+    (T, Q, steady_time), (T_ref, Q_ref, steady_time_ref) = results
+    if steady_time != steady_time_ref or steady_time != steady_time:
+        raise CheckFailure('steady state at {} instead of {}'.format(steady_time, steady_time_ref))
+    difference = expect_close('temperature histories', T, T_ref, rtol=1.0e-10, atol=1.0e-10)
+    expect_close('heat flow histories', Q, Q_ref, rtol=1.0e-10, atol=1.0e-10)
+    return 'steady state at {:g} s, max |dT| {:.2g}'.format(steady_time, difference)
+
+
+@check
+def what_if_queries(work_dir):
+    """What-if queries (low-rank update and refactorization) against a re-solve of the modified model."""
+
+    session = solved_session(linear_model(work_dir))
+    scale = {'c1': 2.0, 'c2': 1.5, 'c5': 0.5}
+    add = [('3', '5', 0.7)]
+    remove = ['c8']
+    conductors = [line for line in LINEAR_CONDUCTORS if not line.startswith('c8 ')]
+    conductors = [line.replace('c1 conduction 1 2 150.0', 'c1 conduction 1 2 300.0').
+                  replace('c2 cylindrical 2 3 50.0', 'c2 cylindrical 2 3 75.0').
+                  replace('c5 convection 4 5 25.0', 'c5 convection 4 5 12.5') for line in conductors]
+    modified = solved_session(linear_model(work_dir, 'modified', conductors + ['n1 convection 3 5 0.7 1.0']))
+    reference = modified.node_temperatures()
+    worst = 0.0
+    for max_rank in (20, 0):  # Sherman-Morrison-Woodbury update, new factorization
+        T = session.what_if(scale, add, remove, max_rank)
+        worst = max(worst, expect_close('max rank {}'.format(max_rank), [T[label] for label in reference],
+                                        list(reference.values()), rtol=1.0e-9, atol=1.0e-9))
+    return '{} changes, max |dT| {:.2g}'.format(len(scale) + len(add) + len(remove), worst)
+
+
+@check
+def capacity_schedule(work_dir):
+    """The node heat capacities (rho*cv) are temperature dependent when rho or cv are, whatever cp is."""
+
+    from .material_library import Material
+    from .read_functions import Node
+    from .update_schedule import update_plan, CONSTANT, TEMPERATURE
+
+    constant_cv = Material()
+    constant_cv.rhotype, constant_cv.cvtype, constant_cv.cptype = 'CONST', 'CONST', 'SPLINE'
+    spline_cv = Material()
+    spline_cv.rhotype, spline_cv.cvtype, spline_cv.cptype = 'CONST', 'SPLINE', 'CONST'
+    nodes = [Node(), Node()]
+    nodes[0].matID, nodes[1].matID = 1, 2
+    plan = update_plan(nodes, [], [], [], [None, constant_cv, spline_cv])
+    if plan.capacity[CONSTANT] != [0] or plan.capacity[TEMPERATURE] != [1]:
+        raise CheckFailure('constant {}, temperature dependent {}'.format(plan.capacity[CONSTANT],
+                                                                          plan.capacity[TEMPERATURE]))
+    return 'constant cv node constant, spline cv node temperature dependent'
+
+
+@check
+def source_table_range(work_dir):
+    """Temperature table sources beyond the table hold the end value (Newton and JFNK) as a constant source."""
+
+    nodes = ['1 air 0.0', '2 air 0.0']
+    conductors = ['k1 conduction 1 2 10.0 0.1 0.01']
+    table = ['Begin Temperature Table heater', '0.0 50.0', '20.0 40.0', '40.0 30.0', 'End Temperature Table']
+    T, Q = solver_results(write_model(work_dir, 'constant', STEADY, nodes, conductors, ['fixed_T 20.0 2'],
+                                      ['Qsrc 30.0 1']))
+    worst = 0.0
+    for solver in ('newton', 'jfnk'):
+        Ts, Qs = solver_results(write_model(work_dir, 'table_' + solver, STEADY + ['nonlinear solver = ' + solver],
+                                            nodes, conductors, ['fixed_T 20.0 2'], ['QsrcT heater 1'], [],
+                                            table))
+        if not np.all(np.isfinite(Ts)):
+            raise CheckFailure('{}: temperatures not finite'.format(solver))
+        worst = max(worst, expect_close(solver, Ts, T, rtol=1.0e-8, atol=1.0e-7))
+    return 'node at {:.4g} C beyond the table (40 C), max |dT| {:.2g}'.format(T.max(), worst)
+
+
+@check
+def parareal_serial(work_dir):
+    """Parareal with the default coarse propagator against the serial run, in half as many iterations as slices."""
+
+    from .parareal import tn_parareal
+
+    slices = 8
+    worst = 0.0
+    for name, options in (('fin', ()), ('fin_print', ['print interval = 7'])):
+        base_file_name = fin_model(work_dir, name, 800, options=options)
+        T_ref, Q_ref = solver_results(base_file_name)
+        result = tn_parareal(base_file_name, slices, None, 1, max_iterations=slices // 2, prog_report=0)
+        if result is None:
+            raise CheckFailure('{} not solved'.format(name))
+        if result[0].shape != T_ref.shape or result[1].shape != Q_ref.shape:
+            raise CheckFailure('{}: {} rows, serial {} rows'.format(name, result[0].shape[0], T_ref.shape[0]))
+        worst = max(worst, expect_close(name + ' temperature histories', result[0], T_ref, rtol=0.0, atol=1.0e-3))
+        expect_close(name + ' heat flow histories', result[1], Q_ref, rtol=1.0e-4, atol=1.0e-6)
+    return '{} slices, {} iterations, max |dT| {:.2g}'.format(slices, slices // 2, worst)
+
+
+@check
+def influence_loads(work_dir):
+    """Influence matrix (written and read back) evaluated at new loads against a re-solve of the modified model."""
+
+    from .influence_matrix import tn_influence, read_influence_matrix
+
+    base_file_name = linear_model(work_dir)
+    monitors = ['2', '3', '4', '6', '7']
+    matrix = tn_influence(base_file_name, monitors, 0)
+    if matrix is None:
+        raise CheckFailure('influence matrix not evaluated')
+    matrix = read_influence_matrix(base_file_name + '_influence_py.csv')
+    cases = [[50.0, 10.0, 1000.0, 500.0, 100.0, 20.0, 200.0],  # nominal: Q, Q, qdot, qdot, Tinf, Tinf, q
+             [80.0, 0.0, 250.0, 1500.0, 60.0, 35.0, -400.0],
+             [0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]]
+    bcs = ['fixed_T {4} 1', 'fixed_T {5} 5', 'heat_flux {6} 0.05 2']
+    sources = ['Qsrc {0} 3', 'Qsrc {1} 6', 'qdot {2} 4', 'qdot {3} 7']
+    T = matrix.evaluate(cases)
+    worst = 0.0
+    for i, case in enumerate(cases):
+        session = solved_session(linear_model(work_dir, 'case{}'.format(i), LINEAR_CONDUCTORS,
+                                              [line.format(*case) for line in bcs],
+                                              [line.format(*case) for line in sources]))
+        reference = session.node_temperatures()
+        worst = max(worst, expect_close('case {}'.format(i), T[i], [reference[label] for label in monitors],
+                                        rtol=1.0e-9, atol=1.0e-9))
+    return '{} monitors, {} loads, {} cases, max |dT| {:.2g}'.format(len(monitors), len(matrix.loads), len(cases),
+                                                                    worst)
+
+
+@check
+def concurrent_transients(work_dir):
+    """Transient models solved at the same time in threads (as by the solver service) against serial solves."""
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    models = [foil_model(work_dir, 'foil', 400), fin_model(work_dir, 'fin', 400, 30)]
+
+    def solve(base_file_name):
+        session = solved_session(base_file_name)
+        return session.T.copy()
+
+    reference = [solve(base_file_name) for base_file_name in models]
+    with ThreadPoolExecutor(max_workers=len(models)) as executor:
+        results = list(executor.map(solve, models * 2))
+    worst = 0.0
+    for i, T in enumerate(results):
+        worst = max(worst, expect_close(os.path.basename(models[i % len(models)]), T, reference[i % len(models)],
+                                        rtol=0.0, atol=1.0e-12))
+    return '{} concurrent solves, max |dT| {:.2g}'.format(len(results), worst)
+
+
+@check
+def jfnk_memory(work_dir):
+    """A large chain solved with JFNK: the solve allocates much less than the dense matrix, Newton as reference."""
+
+    import tracemalloc
+    from .solver_session import SolverSession
+
+    n = 1500
+    nodes = ['{} air 0.0'.format(i) for i in range(1, n + 1)]
+    conductors = ['k{0} conduction {0} {1} 40.0 0.01 0.0001'.format(i, i + 1) for i in range(1, n)]
+    bcs = ['fixed_T 100.0 1', 'fixed_T 20.0 {}'.format(n)]
+    sources = ['Qsrc 1.0 {}'.format(n // 2)]
+    session = SolverSession(write_model(work_dir, 'chain_jfnk', STEADY + ['nonlinear solver = jfnk'], nodes,
+                                        conductors, bcs, sources))
+    if not session.ready:
+        raise CheckFailure('errors reading the model')
+    tracemalloc.start()
+    try:
+        session.solve()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    dense = 8.0 * n * n
+    if not peak < 0.5 * dense:
+        raise CheckFailure('peak allocation {:.3g} MB, dense matrix {:.3g} MB'.format(peak / 1.0e6, dense / 1.0e6))
+    reference = solved_session(write_model(work_dir, 'chain_newton', STEADY, nodes, conductors, bcs, sources))
+    T, T_ref = session.node_temperatures(), reference.node_temperatures()
+    difference = expect_close('temperatures', [T[label] for label in T_ref], list(T_ref.values()), rtol=1.0e-8,
+                              atol=1.0e-6)
+    return '{} nodes, peak allocation {:.3g} MB (dense matrix {:.3g} MB), max |dT| {:.2g}'.format(
+        n, peak / 1.0e6, dense / 1.0e6, difference)
+
+
+def run_checks(names=None, fid=sys.stdout):
+    """
+    Runs the checks (all of them if names is None) in a scratch folder and writes a line per check.
+
+    Returns:
+        The number of failed checks.
+    """
+
+    failed = 0
+    for name in names or list(CHECKS):
+        with tempfile.TemporaryDirectory() as work_dir:
+            try:
+                detail = CHECKS[name](work_dir)
+                status = 'ok'
+            except CheckFailure as e:
+                detail = str(e)
+                status = 'FAILED'
+            except Exception:
+                detail = traceback.format_exc().strip().splitlines()[-1]
+                status = 'ERROR'
+        failed += status != 'ok'
+        fid.write(' {:36} {:7} {}\n'.format(name, status, detail))
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='TNSolver feature consistency checks.')
+    parser.add_argument('--checks', nargs='*', choices=list(CHECKS), help='run only these checks')
+    args = parser.parse_args(argv)
+
+    failed = run_checks(args.checks)
+    print('\n{} checks, {} failed'.format(len(args.checks or CHECKS), failed))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,188 @@
+"""
+Influence coefficient (Green's function) matrix of a linear steady model, for load studies.
+
+The temperatures of a linear steady network are an affine function of the loads, i.e. the source powers (Q, qdot)
+and the BC values (fixed temperature Tinf, heat flux q):
+
+    T_m = T0_m + sum_j G[m, j] (p_j - p0_j)
+
+with T_m the temperature of the monitor node m, p0 and T0 the nominal loads and temperatures of the solved model.
+The influence coefficients G[m, j] = dT_m/dp_j are evaluated with the factorization of the solved model
+(spar.factor) and one batched solve: with A the network matrix and R the derivatives of the residual with respect to
+the loads (see sensitivity_analysis.model_parameters), G = E^T inv(A) R, solved as inv(A) R (a column per load) or
+as the adjoint inv(A^T) E (a column per monitor), whichever has fewer columns.
+
+The matrix is written to base_file_name + '_influence_py.csv' and read back with read_influence_matrix; then the
+monitor temperatures of any number of load cases are a matrix product (InfluenceMatrix.evaluate), with no solve.
+
+Usage:
+    python -m TNSolver_code.influence_matrix model [--monitors label ...]
+"""
+
+import csv
+import argparse
+import numpy as np
+from .utility_functions import user_feedback, setunits
+from .solver_session import SolverSession
+from .network_assembly import is_linear_element
+from .sensitivity_analysis import model_parameters
+
+LOADS = {'source': ('Q', 'qdot'), 'bc': ('Tinf', 'q')}  # parameters of the sources and BCs taken as loads
+
+
+class InfluenceMatrix:
+    def __init__(self):
+        self.monitors = []  # list - labels of the monitor nodes
+        self.loads = []  # list - (kind, label, name) of each load, as SolverSession.set_parameter
+        self.nominal = None  # NumPy array - nominal value of each load
+        self.offset = None  # NumPy array - monitor temperatures with all the loads set to zero (I/O units)
+        self.G = None  # NumPy array - influence coefficients (monitors, loads)
+
+    def evaluate(self, P):
+        """
+        Evaluates the monitor temperatures of a set of load cases.
+
+        Args:
+            P: load values (cases, loads), or a single case (loads).
+
+        Returns:
+            The monitor temperatures (cases, monitors), or (monitors) for a single case (I/O units).
+        """
+
+        return self.offset + np.asarray(P, dtype=float) @ self.G.T
+
+
+def influence_matrix(spar, nd, el, bc, src, mat, monitors=None):
+    """
+    Evaluates the influence matrix of the monitor nodes of a solved linear steady model.
+
+    Args:
+        spar, nd, el, bc, src, mat: solved model (e.g. from a SolverSession, spar.factor set).
+        monitors: labels of the monitor nodes (default: all the nodes).
+
+    Returns:
+        InfluenceMatrix class.
+    """
+
+    if not spar.steady or spar.factor is None:
+        raise ValueError('the influence matrix needs a solved steady model')
+    if (any(not is_linear_element(el[e], mat) for e in range(len(el))) or
+            any(src[i].ntype not in (1, 2) for i in range(len(src)))):
+        raise ValueError('the influence matrix needs a linear model (linear conductors, constant sources)')
+    node = {nd[n].label: n for n in range(len(nd))}
+    monitors = [nd[n].label for n in range(len(nd))] if monitors is None else list(monitors)
+    for label in monitors:
+        if label not in node:
+            raise KeyError('unknown node: {}'.format(label))
+
+    parameters = [par for par in model_parameters(spar, nd, el, bc, src) if par.name in LOADS.get(par.kind, ())]
+    nnd = len(nd)
+    R = np.zeros((nnd, len(parameters)))
+    for j in range(len(parameters)):
+        np.add.at(R[:, j], parameters[j].eqn, parameters[j].dR)
+    eqns = np.array([nd[node[label]].eqn for label in monitors], dtype=int)
+    if len(eqns) <= len(parameters):  # adjoint solve, a column per monitor
+        E = np.zeros((nnd, len(eqns)))
+        E[eqns, np.arange(len(eqns))] = 1.0
+        G = spar.factor.solve(E, trans='T').T @ R
+    else:
+        G = spar.factor.solve(R)[eqns, :]
+
+    matrix = InfluenceMatrix()
+    matrix.monitors = monitors
+    matrix.loads = [(par.kind, par.label, par.name) for par in parameters]
+    matrix.nominal = np.array([par.value for par in parameters])
+    matrix.G = G.reshape(len(eqns), len(parameters))
+    matrix.offset = np.array([nd[node[label]].T for label in monitors], dtype=float) - matrix.G @ matrix.nominal
+    return matrix
+
+
+def write_influence_matrix(fid, matrix):
+    """
+    Writes the influence matrix as csv: a column per load (the first row is the nominal load), a row per monitor.
+    """
+
+    fid.write('"Monitor", "Offset"')
+    for kind, label, name in matrix.loads:
+        fid.write(', "{} {} {}"'.format(kind, label, name))
+    fid.write('\n"Nominal", ')
+    for value in matrix.nominal:
+        fid.write(f', {value:.17g}')
+    fid.write('\n')
+    for m in range(len(matrix.monitors)):
+        fid.write(f'"{matrix.monitors[m]}", {matrix.offset[m]:.17g}')
+        for value in matrix.G[m]:
+            fid.write(f', {value:.17g}')
+        fid.write('\n')
+
+
+def read_influence_matrix(file_name):
+    """Reads an influence matrix written by write_influence_matrix, returns an InfluenceMatrix class."""
+
+    with open(file_name, 'r', newline='') as fid:
+        rows = [[cell.strip() for cell in row] for row in csv.reader(fid, skipinitialspace=True) if row]
+    matrix = InfluenceMatrix()
+    for column in rows[0][2:]:
+        tokens = column.split()
+        matrix.loads.append((tokens[0], ' '.join(tokens[1:-1]), tokens[-1]))
+    matrix.nominal = np.array([float(cell) for cell in rows[1][2:]])
+    matrix.monitors = [row[0] for row in rows[2:]]
+    matrix.offset = np.array([float(row[1]) for row in rows[2:]])
+    matrix.G = np.array([[float(cell) for cell in row[2:]] for row in rows[2:]]).reshape(len(matrix.monitors),
+                                                                                        len(matrix.loads))
+    return matrix
+
+
+def tn_influence(base_file_name, monitors=None, prog_report=1, *text_widget):
+    """
+    Solves a linear steady model and writes the influence matrix of the monitor nodes to
+    base_file_name + '_influence_py.csv'.
+
+    Args:
+        base_file_name: Base name of the input file (e.g., 'my_model').
+        monitors: labels of the monitor nodes (default: all the nodes).
+        prog_report: code for the progress report (0 = silent, 1 = screen, 2 = GUI).
+        *text_widget: optional argument used by the GUI to provide a widget for the progress reports
+
+    Returns:
+        InfluenceMatrix class, None on errors.
+    """
+
+    session = SolverSession(base_file_name, 0)
+    if not session.ready:
+        message = '\nTNSolver: Errors reading the model.\n'
+        user_feedback(message, prog_report, None, *text_widget)
+        return None
+
+    session.solve()
+    try:
+        matrix = influence_matrix(session.spar, session.nd, session.el, session.bc, session.src, session.mat,
+                                  monitors)
+    except (ValueError, KeyError) as e:
+        message = '\nERROR: {}\n'.format(e.args[0])
+        user_feedback(message, prog_report, None, *text_widget)
+        return None
+
+    u, _ = setunits(session.spar.units)
+    file_name = base_file_name + '_influence_py.csv'
+    with open(file_name, 'w') as fid:
+        write_influence_matrix(fid, matrix)
+    message = ('\nInfluence matrix: {} monitor nodes, {} loads (sources and BCs), temperatures in {}.\n'
+               'Influence matrix written to: {}\n'.format(len(matrix.monitors), len(matrix.loads), u['T'],
+                                                          file_name))
+    user_feedback(message, prog_report, None, *text_widget)
+    return matrix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='TNSolver influence matrix of a linear steady model.')
+    parser.add_argument('model', help='base name of the input file')
+    parser.add_argument('--monitors', nargs='*', default=None, help='labels of the monitor nodes (default: all)')
+    args = parser.parse_args(argv)
+
+    matrix = tn_influence(args.model, args.monitors)
+    return 0 if matrix is not None else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
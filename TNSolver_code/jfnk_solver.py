@@ -0,0 +1,189 @@
+"""
+Jacobian-free Newton-Krylov (JFNK) solution of the nonlinear thermal network equations.
+
+The standard nonlinear loop of tnsdriver assembles and factorizes the dense matrix of the network at every
+iteration. The JFNK iterations only need the residual of the network, assembled from the element kernels (elpre,
+elmat): the Newton corrections are solved with GMRES, the Jacobian-vector products are finite differences of the
+residual
+
+    J v = (F(T + eps v) - F(T)) / eps
+
+and the preconditioner is an incomplete LU factorization of the (sparse) conductance matrix assembled at the first
+iteration of the time step (lagged). Memory stays proportional to the number of conductors.
+"""
+
+import numpy as np
+import scipy.sparse as sparse
+import scipy.sparse.linalg as spla
+from .utility_functions import user_feedback
+from .evaluate_properties import evalfunc, evalfunc_slope, rhoCvprop
+
+GMRES_RESTART = 30
+GMRES_MAXITER = 20  # restart cycles
+ILU_DROP_TOL = 1.0e-5
+ILU_FILL_FACTOR = 10.0
+
+
+def assemble_residual(T, spar, nd, el, bc, src, func, mat, time, dt, transient, matrix, logfID, prog_report,
+                      *text_widget):
+    """
+    Assembles the residual of the network equations at the temperatures T, as tnsdriver (b of A dT = b).
+
+    Args:
+        T: node temperatures (K, NumPy array), copied to the nodes.
+        spar, nd, el, bc, src, func, mat: thermal model.
+        time, dt: time and time step (transient models).
+        transient: True for a time step of a transient model.
+        matrix: True to assemble the sparse matrix of the network too.
+        logfID: Log file ID
+        prog_report: code for the progress report
+        *text_widget: Terminal widget (optional)
+
+    Returns:
+        A tuple containing the residual (NumPy array) and the matrix (scipy.sparse csr matrix, None if not
+        assembled).
+    """
+
+    nnd = len(nd)
+    for nn in range(nnd):
+        nd[nn].T = T[nn]
+    if transient:
+        for nn in range(nnd):
+            if nd[nn].matID is not None and nd[nn].matID > 0:
+                rho, cv = rhoCvprop(mat[nd[nn].matID], (nd[nn].T + nd[nn].Told) / 2.0)
+                nd[nn].rhocv = rho * cv
+            if nd[nn].mfncID is not None:
+                nd[nn].rhocv = evalfunc(func[nd[nn].mfncID], time)
+            if nd[nn].vfncID is not None:
+                nd[nn].vol = evalfunc(func[nd[nn].vfncID], time)
+
+    b = np.zeros(nnd)
+    rows = []
+    cols = []
+    values = []
+    rhs = np.zeros((2, 1))
+    for e in range(len(el)):
+        nd1, nd2 = el[e].elnd
+        Tel = np.array([nd[nd1].T, nd[nd2].T])
+        el[e] = el[e].elpre(el[e], mat, Tel, logfID, prog_report, *text_widget)
+        lhs, rhs_e = el[e].elmat(el[e], Tel, rhs)
+        eqs = [nd[nd1].eqn, nd[nd2].eqn]
+        b[eqs] += rhs_e.reshape(2)
+        if matrix:
+            rows.extend([eqs[0], eqs[0], eqs[1], eqs[1]])
+            cols.extend([eqs[0], eqs[1], eqs[0], eqs[1]])
+            values.extend(np.asarray(lhs, dtype=float).reshape(4))
+
+    if transient:
+        for nn in range(nnd):
+            if nd[nn].vol > 0:
+                cap = float(np.squeeze(nd[nn].rhocv * nd[nn].vol / dt))
+                b[nd[nn].eqn] += cap * (nd[nn].Told - nd[nn].T)
+                if matrix:
+                    rows.append(nd[nn].eqn)
+                    cols.append(nd[nn].eqn)
+                    values.append(cap)
+
+    for i in range(len(src)):
+        for j in range(len(src[i].nd)):
+            if src[i].ntype == 4:  # function of the node temperature
+                S, Sp = evalfunc_slope(func[src[i].fncQT], nd[src[i].nd[j]].T - spar.Toff)
+                b[nd[src[i].nd[j]].eqn] += S
+                if matrix:
+                    rows.append(nd[src[i].nd[j]].eqn)
+                    cols.append(nd[src[i].nd[j]].eqn)
+                    values.append(-Sp)
+            else:
+                b[nd[src[i].nd[j]].eqn] += src[i].Sc[j]
+    for i in range(spar.nNBC):
+        bcn = spar.Neumann[i]
+        if bc[bcn].type == 'heat_flux':
+            for j in range(len(bc[bcn].nd)):
+                b[nd[int(bc[bcn].nd[j])].eqn] += bc[bcn].q * bc[bcn].A
+
+    fixed = dirichlet_rows(spar, nd, bc)
+    b[fixed] = 0.0
+    A = None
+    if matrix:
+        A = sparse.csr_matrix((values, (rows, cols)), shape=(nnd, nnd)).tolil()
+        A[fixed, :] = 0.0
+        A[fixed, fixed] = 1.0
+        A = A.tocsr()
+    return b, A
+
+
+def dirichlet_rows(spar, nd, bc):
+    """Returns the equations of the fixed temperature nodes."""
+
+    return np.array([nd[int(bc[bcn].nd[j])].eqn for bcn in spar.Dirichlet for j in range(len(bc[bcn].nd))],
+                    dtype=int)
+
+
+def preconditioner(A):
+    """Incomplete LU factorization of the network matrix, as a LinearOperator (complete LU if ILU fails)."""
+
+    try:
+        ilu = spla.spilu(A.tocsc(), drop_tol=ILU_DROP_TOL, fill_factor=ILU_FILL_FACTOR)
+    except RuntimeError:  # singular incomplete factors
+        ilu = spla.splu(A.tocsc())
+    return spla.LinearOperator(A.shape, ilu.solve)
+
+
+def jfnk_solve(T, spar, nd, el, bc, src, func, mat, time, dt, transient, logfID, prog_report, *text_widget):
+    """
+    Converges the nonlinear network equations of a (time) step with the Jacobian-free Newton-Krylov iterations.
+
+    Args:
+        T: node temperatures (K, NumPy array), updated with the solution.
+        spar, nd, el, bc, src, func, mat: thermal model, the nodes are updated with the solution.
+        time, dt: time and time step (transient models).
+        transient: True for a time step of a transient model.
+        logfID: Log file ID
+        prog_report: code for the progress report
+        *text_widget: Terminal widget (optional)
+    """
+
+    fixed = dirichlet_rows(spar, nd, bc)
+    F, A = assemble_residual(T, spar, nd, el, bc, src, func, mat, time, dt, transient, True, logfID, prog_report,
+                             *text_widget)
+    M = preconditioner(A)
+
+    for iter_number in range(1, spar.max_iter_number + 2):
+        spar.iterations += 1
+        residual = np.linalg.norm(F) / np.linalg.norm(T) if np.linalg.norm(T) != 0 else np.inf
+        message = '\n  {:6d}    {:g}'.format(iter_number, residual)
+        user_feedback(message, prog_report, logfID, *text_widget)
+        if residual < spar.convergence_residual:
+            return
+
+        T0 = T.copy()
+        F0 = F.copy()
+
+        def jacobian_vector(v):
+            v = np.asarray(v).reshape(-1)
+            norm_v = np.linalg.norm(v)
+            if norm_v == 0.0:
+                return np.zeros_like(v)
+            eps = np.sqrt(np.finfo(float).eps) * (1.0 + np.linalg.norm(T0)) / norm_v
+            Fv, _ = assemble_residual(T0 + eps * v, spar, nd, el, bc, src, func, mat, time, dt, transient, False,
+                                      logfID, prog_report, *text_widget)
+            Jv = -(Fv - F0) / eps  # A dT = b: the matrix is minus the derivative of the residual
+            Jv[fixed] = v[fixed]
+            return Jv
+
+        J = spla.LinearOperator(A.shape, jacobian_vector)
+        dT, info = spla.gmres(J, F0, M=M, rtol=min(0.1, max(residual, 1.0e-10)), atol=0.0,
+                              restart=GMRES_RESTART, maxiter=GMRES_MAXITER)
+        if info != 0:  # the lagged preconditioner is too far from the Jacobian: refresh it
+            _, A = assemble_residual(T0, spar, nd, el, bc, src, func, mat, time, dt, transient, True, logfID,
+                                     prog_report, *text_widget)
+            M = preconditioner(A)
+
+        # Limit the change of the temperatures as tnsdriver
+        limit = spar.max_change * np.abs(T0)
+        T[:] = T0 + np.where(np.abs(dT) > limit, np.sign(dT) * limit, dT)
+        F, _ = assemble_residual(T, spar, nd, el, bc, src, func, mat, time, dt, transient, False, logfID,
+                                 prog_report, *text_widget)
+
+    message = '\nWARNING: Nonlinear iterations exceeded limit of {}'.format(spar.max_iter_number)
+    user_feedback(message, prog_report, logfID, *text_widget)
@@ -0,0 +1,128 @@
+"""
+Kirchhoff transformation of steady conduction networks with a temperature dependent conductivity.
+
+In a network of conduction conductors (conduction, cylindrical, spherical) made of one material, the Kirchhoff
+transform of the temperature
+
+    U(T) = integral of k(s) ds from T0 to T
+
+makes the heat flow of every conductor linear in U: Q = (A/L) (U_i - U_j). The steady network is then solved with a
+single linear solve in U (fixed temperatures mapped to U, sources and heat fluxes unchanged), and the temperatures
+are recovered by inverting U(T). The conductors of the network model use k at the mean temperature of their nodes
+instead of the mean value of k, so the transformed solution is the initial guess of the usual nonlinear iterations,
+which converge to the network solution in one or two iterations instead of ten or more.
+
+The transformation is not applicable when the network has other conductors (radiation, convection, advection,
+conductors with a given k) or more than one temperature dependent material, or for transient models.
+"""
+
+import numpy as np
+import scipy.sparse.linalg as spla
+from .utility_functions import user_feedback
+from .evaluate_properties import kprop
+from .network_assembly import constant_property, assemble_matrix, dirichlet_equations, load_vector
+
+CONDUCTION_TYPES = (1, 14, 15)  # conduction, cylindrical, spherical: G = k A / L
+TABLE_POINTS = 2001  # points of the U(T) table
+TABLE_MARGIN = 1.0  # the U(T) table covers the known temperatures, widened by this fraction of their range
+
+
+def kirchhoff_material(el, mat):
+    """
+    Checks if the Kirchhoff transformation applies to a network.
+
+    Returns:
+        A tuple containing the material ID (None if not applicable) and the reason it is not applicable.
+    """
+
+    if len(el) == 0:
+        return None, 'no conductors'
+    if any(el[e].elst not in CONDUCTION_TYPES for e in range(len(el))):
+        return None, 'conductors other than conduction'
+    materials = {el[e].matID for e in range(len(el))}
+    if '' in materials:
+        return None, 'conductors with a given conductivity'
+    if len(materials) > 1:
+        return None, 'more than one material'
+    matID = materials.pop()
+    if constant_property(mat[matID].ktype):
+        return None, 'constant conductivity'
+    return matID, ''
+
+
+def kirchhoff_table(material, T_low, T_high):
+    """
+    Tabulates the Kirchhoff transform U(T) of a material between two temperatures (K), within the range of the
+    conductivity table (if any).
+
+    Returns:
+        A tuple containing the temperatures and the transform (NumPy arrays).
+    """
+
+    if isinstance(material.kdata, np.ndarray) and material.kdata.ndim == 2 and material.ktype in (2, 'TABLE'):
+        T_low = max(T_low, material.kdata[0, 0])  # the piecewise linear tables are not extrapolated
+        T_high = min(T_high, material.kdata[-1, 0])
+    T_low = max(T_low, 1.0e-3)
+    Tt = np.linspace(T_low, T_high, TABLE_POINTS)
+    k = np.asarray(kprop(material, Tt), dtype=float).reshape(-1)
+    U = np.concatenate(([0.0], np.cumsum((k[1:] + k[:-1]) / 2.0 * np.diff(Tt))))
+    return Tt, U
+
+
+def kirchhoff_solve(T, spar, nd, el, bc, src, mat, logfID, prog_report, *text_widget):
+    """
+    Solves a steady conduction network with the Kirchhoff transformation (initial guess of the nonlinear
+    iterations, see the module description).
+
+    Args:
+        T: node temperatures (K, NumPy array), updated with the solution.
+        spar, nd, el, bc, src, mat: thermal model, the node temperatures are updated.
+        logfID: Log file ID
+        prog_report: code for the progress report
+        *text_widget: Terminal widget (optional)
+
+    Returns:
+        True if the transformation has been applied.
+    """
+
+    matID, reason = kirchhoff_material(el, mat)
+    if matID is None:
+        message = '\nKirchhoff transformation not applicable ({}), nonlinear iterations\n'.format(reason)
+        user_feedback(message, prog_report, logfID, *text_widget)
+        return False
+
+    nnd = len(nd)
+    fixed, T_fixed = dirichlet_equations(spar, nd, bc)
+    if len(fixed) == 0:
+        message = '\nKirchhoff transformation not applicable (no fixed temperature), nonlinear iterations\n'
+        user_feedback(message, prog_report, logfID, *text_widget)
+        return False
+    T_fixed = T_fixed + spar.Toff
+    known = np.concatenate((T_fixed, [nd[n].T for n in range(nnd)]))
+    margin = TABLE_MARGIN * max(known.max() - known.min(), 1.0)
+    Tt, Ut = kirchhoff_table(mat[matID], known.min() - margin, known.max() + margin)
+
+    # Linear network in U: conductances A/L, fixed temperatures mapped to U
+    eqs = np.array([[nd[el[e].elnd[0]].eqn, nd[el[e].elnd[1]].eqn] for e in range(len(el))], dtype=int)
+    geometry = np.array([el[e].A / el[e].L for e in range(len(el))], dtype=float)
+    blocks = geometry[:, None, None] * np.array([[1.0, -1.0], [-1.0, 1.0]])
+    G = assemble_matrix(nnd, eqs, blocks).tolil()
+    f = load_vector(spar, nd, bc, src)
+    G[fixed, :] = 0.0
+    G[fixed, fixed] = 1.0
+    f[fixed] = np.interp(T_fixed, Tt, Ut)
+    U = spla.splu(G.tocsc()).solve(f)
+
+    # Back to temperatures, linear extrapolation out of the table
+    T_new = np.interp(U, Ut, Tt)
+    k_low, k_high = (Ut[1] - Ut[0]) / (Tt[1] - Tt[0]), (Ut[-1] - Ut[-2]) / (Tt[-1] - Tt[-2])
+    T_new = np.where(U < Ut[0], Tt[0] + (U - Ut[0]) / k_low, T_new)
+    T_new = np.where(U > Ut[-1], Tt[-1] + (U - Ut[-1]) / k_high, T_new)
+    T_new[fixed] = T_fixed  # exactly the fixed temperatures
+    for n in range(nnd):
+        nd[n].T = T_new[nd[n].eqn]
+        T[n] = nd[n].T
+
+    message = '\nKirchhoff transformation: linear solution of the conduction network ({})\n'.format(mat[matID].name)
+    user_feedback(message, prog_report, logfID, *text_widget)
+    return True
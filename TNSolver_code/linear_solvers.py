@@ -0,0 +1,268 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import scipy.sparse as sparse
+import scipy.sparse.linalg as spla
+from scipy.linalg import lu_factor, lu_solve, lapack
+from .network_graph import partition_graph, bandwidth_ordering
+
+BANDED_MIN_EQUATIONS = 50  # smaller systems are solved by the dense factorization
+BANDED_MAX_RATIO = 0.1  # banded factorization when the half bandwidth is up to this fraction of the equations
+SWEEP_TOLERANCE = 1.0e-10  # relative residual of the outer iterations of the flow sweep solver
+SWEEP_RESTART = 25  # outer iterations of the flow sweep solver between the GMRES restarts
+SWEEP_MAX_ITERATIONS = 100  # outer iterations of the flow sweep solver, beyond them the system is factorized
+
+
+class DenseFactor:
+    """
+    LU factorization of a dense matrix, it can be reused for several right-hand sides.
+
+    The interface is the same of the scipy.sparse.linalg.splu object: solve(b, trans='N'), trans='T' solves the
+    transposed system.
+    """
+
+    def __init__(self, A):
+        self.shape = A.shape
+        self.lu, self.piv = lu_factor(A, check_finite=False)
+        if np.any(np.diag(self.lu) == 0.0):
+            raise np.linalg.LinAlgError('Singular matrix')
+
+    def solve(self, b, trans='N'):
+        return lu_solve((self.lu, self.piv), b, trans=0 if trans == 'N' else 1, check_finite=False)
+
+
+def band_diagonal(A, order, k):
+    """Returns the diagonal k of the matrix A with the rows and columns permuted by order."""
+
+    n = len(order)
+    return A[order[:n - k], order[k:]] if k >= 0 else A[order[-k:], order[:n + k]]
+
+
+class BandedFactor:
+    """
+    LU factorization of a banded matrix, after the symmetric permutation of the equations that minimizes its
+    bandwidth (see network_graph.bandwidth_ordering): O(n bw^2) operations instead of O(n^3), tridiagonal (LAPACK
+    gttrf) for the chain-like networks. The interface is the same of DenseFactor.
+    """
+
+    def __init__(self, A, order, bw):
+        self.shape = A.shape
+        self.order = order
+        self.bw = bw
+        if bw == 1:
+            dl, d, du, du2, self.ipiv, info = lapack.dgttrf(band_diagonal(A, order, -1), band_diagonal(A, order, 0),
+                                                            band_diagonal(A, order, 1))
+            self.lu = (dl, d, du, du2)
+        else:
+            ab = np.zeros((3 * bw + 1, A.shape[0]))  # LAPACK band storage, bw extra rows for the fill-in
+            for k in range(-bw, bw + 1):
+                if k >= 0:
+                    ab[2 * bw - k, k:] = band_diagonal(A, order, k)
+                else:
+                    ab[2 * bw - k, :k] = band_diagonal(A, order, k)
+            self.lu, self.ipiv, info = lapack.dgbtrf(ab, bw, bw)
+        if info != 0:
+            raise np.linalg.LinAlgError('Singular matrix')
+
+    @staticmethod
+    def fits(A, order, bw):
+        """Checks that the permuted matrix has no entry out of the band (e.g. a conductance that was zero)."""
+
+        in_band = sum(np.count_nonzero(band_diagonal(A, order, k)) for k in range(-bw, bw + 1))
+        return in_band == np.count_nonzero(A)
+
+    def solve(self, b, trans='N'):
+        b = np.asarray(b, dtype=float)
+        bp = b[self.order].reshape(self.shape[0], -1)
+        if self.bw == 1:
+            xp, info = lapack.dgttrs(*self.lu, self.ipiv, bp, trans=trans)
+        else:
+            xp, info = lapack.dgbtrs(self.lu, self.bw, self.bw, bp, self.ipiv, trans=0 if trans == 'N' else 1)
+        x = np.empty(xp.shape)
+        x[self.order] = xp
+        return x.reshape(b.shape)
+
+
+class SchurFactor:
+    """
+    Domain decomposition of a sparse matrix: the equations are split in subdomains, the interior unknowns of the
+    subdomains are condensed independently (in parallel threads, SuperLU and LAPACK release the GIL) and only the
+    Schur complement of the interface unknowns is factorized as a whole.
+
+    The interface is made of the equations coupled to an equation of another subdomain, the interiors of different
+    subdomains are then uncoupled:
+
+        S = A_GG - sum_p A_GI[p] inv(A_II[p]) A_IG[p]
+
+    The interface is the same of DenseFactor.
+    """
+
+    def __init__(self, A, parts):
+        A = sparse.csr_matrix(A)
+        self.shape = A.shape
+        coupled = A + A.T
+        coupled = sparse.coo_matrix(coupled)
+        cross = parts[coupled.row] != parts[coupled.col]
+        interface = np.zeros(A.shape[0], dtype=bool)
+        interface[coupled.row[cross]] = True
+        self.interface = np.flatnonzero(interface)
+        self.interiors = [np.flatnonzero((parts == p) & ~interface) for p in range(parts.max() + 1)]
+        self.interiors = [nodes for nodes in self.interiors if len(nodes) > 0]
+        A_G = A[self.interface]
+        self.A_GG = A_G[:, self.interface].toarray()
+        self.A_GI = [A_G[:, nodes].tocsc() for nodes in self.interiors]
+        self.A_IG = [A[nodes][:, self.interface].tocsc() for nodes in self.interiors]
+        self.A_II = [A[nodes][:, nodes].tocsc() for nodes in self.interiors]
+
+        with ThreadPoolExecutor(max_workers=max(1, min(len(self.interiors), os.cpu_count() or 1))) as executor:
+            results = list(executor.map(self._condense, range(len(self.interiors))))
+
+        self.lu = [lu for lu, _, _ in results]
+        S = self.A_GG.copy()
+        for _, columns, contribution in results:
+            S[np.ix_(columns, columns)] -= contribution
+        self.S = DenseFactor(S) if len(self.interface) > 0 else None
+
+    def _condense(self, p):
+        """Factorizes the interior matrix of a subdomain and evaluates its contribution to the Schur complement."""
+
+        try:
+            lu = spla.splu(self.A_II[p])
+        except RuntimeError as e:  # SuperLU reports the singular matrices as RuntimeError
+            raise np.linalg.LinAlgError(str(e))
+        columns = np.union1d(self.A_IG[p].nonzero()[1], self.A_GI[p].nonzero()[0])  # interface next to subdomain p
+        if len(columns) == 0:
+            return lu, columns, np.zeros((0, 0))
+        X = lu.solve(self.A_IG[p][:, columns].toarray())
+        contribution = self.A_GI[p][columns] @ X
+        return lu, columns, contribution
+
+    def solve(self, b, trans='N'):
+        b = np.asarray(b, dtype=float)
+        x = np.zeros(b.shape)
+        A_GI = self.A_GI if trans == 'N' else [A.T for A in self.A_IG]
+        A_IG = self.A_IG if trans == 'N' else [A.T for A in self.A_GI]
+        y = [self.lu[p].solve(b[self.interiors[p]], trans=trans) for p in range(len(self.interiors))]
+        if self.S is not None:
+            g = b[self.interface] - sum(A_GI[p] @ y[p] for p in range(len(self.interiors)))
+            x[self.interface] = self.S.solve(g, trans=trans)
+            for p in range(len(self.interiors)):
+                y[p] = y[p] - self.lu[p].solve(A_IG[p] @ x[self.interface], trans=trans)
+        for p in range(len(self.interiors)):
+            x[self.interiors[p]] = y[p]
+        return x
+
+
+class SweepFactor:
+    """
+    Flow ordered sweep solver of the advection networks. With the equations ordered along the flow (see
+    network_graph.flow_ordering) the matrix is block lower triangular: each fluid node depends only on the upstream
+    nodes, the flow loops and the other nodes (e.g. walls) are diagonal blocks. The sweep, a forward substitution
+    through the blocks (sparse LU of the block lower triangular part, no fill-in along the flow), solves the fluid
+    in linear time; the remaining coupling (the conductors between the blocks, e.g. the axial wall conduction against
+    the flow) is solved by an outer iteration, GMRES preconditioned by the sweep (a Krylov accelerated block
+    Gauss-Seidel iteration).
+
+    Without outer coupling (pure advection networks) the sweep is exact. If the outer iterations do not converge
+    the permuted matrix is factorized. The interface is the same of DenseFactor.
+    """
+
+    def __init__(self, A, order, blocks):
+        self.shape = A.shape
+        self.order = order
+        position = np.empty(len(order), dtype=int)
+        position[order] = np.arange(len(order))
+        A = sparse.coo_matrix(A)
+        A = sparse.coo_matrix((A.data, (position[A.row], position[A.col])), shape=A.shape)
+        lower = (A.row >= A.col) | (blocks[A.row] == blocks[A.col])
+        self.A = A.tocsr()
+        self.coupled = not np.all(lower)  # outer iterations needed
+        try:
+            self.sweep = spla.splu(sparse.csc_matrix((A.data[lower], (A.row[lower], A.col[lower])), shape=A.shape))
+        except RuntimeError as e:  # SuperLU reports the singular matrices as RuntimeError
+            raise np.linalg.LinAlgError(str(e))
+        self.lu = None  # factorization of the permuted matrix, when the outer iterations fail
+        self.iterations = 0  # int - outer iterations of the last solve
+
+    def _solve_column(self, bp, trans):
+        if not self.coupled:
+            return self.sweep.solve(bp, trans=trans)
+        if self.lu is None:
+            n = self.shape[0]
+            A = self.A if trans == 'N' else self.A.T
+            M = spla.LinearOperator((n, n), matvec=lambda r: self.sweep.solve(r, trans=trans))
+            count = [0]
+
+            def counter(_):
+                count[0] += 1
+
+            xp, info = spla.gmres(A, bp, M=M, rtol=SWEEP_TOLERANCE, atol=0.0, restart=SWEEP_RESTART,
+                                  maxiter=SWEEP_MAX_ITERATIONS // SWEEP_RESTART, callback=counter,
+                                  callback_type='pr_norm')
+            self.iterations = count[0]
+            if info == 0 and np.all(np.isfinite(xp)):
+                return xp
+            try:
+                self.lu = spla.splu(self.A.tocsc())
+            except RuntimeError as e:
+                raise np.linalg.LinAlgError(str(e))
+        return self.lu.solve(bp, trans=trans)
+
+    def solve(self, b, trans='N'):
+        b = np.asarray(b, dtype=float)
+        bp = b[self.order].reshape(self.shape[0], -1)
+        xp = np.column_stack([self._solve_column(bp[:, j], trans) for j in range(bp.shape[1])])
+        x = np.empty(xp.shape)
+        x[self.order] = xp
+        return x.reshape(b.shape)
+
+
+def factorize(A, spar):
+    """
+    Factorizes the matrix of the linear system of the thermal network.
+
+    Args:
+        A: matrix of the linear system (NumPy array).
+        spar: Simulation parameters, spar.subdomains > 1 selects the domain decomposition (SchurFactor), spar.flow_sweep
+              the flow ordered sweeps of the advection networks (SweepFactor, spar.flow_order set by tnsdriver),
+              spar.banded the banded factorization of the networks with a small bandwidth after renumbering
+              (BandedFactor).
+
+    Returns:
+        A factorization object with a solve(b, trans='N') method.
+    """
+
+    n = A.shape[0]
+    if spar.subdomains > 1 and n > spar.subdomains:
+        if spar.partition is None or len(spar.partition) != n:  # the network graph does not change
+            pattern = sparse.csr_matrix(A)
+            spar.partition = partition_graph((pattern + pattern.T) != 0, spar.subdomains)
+        return SchurFactor(A, spar.partition)
+    if spar.flow_sweep and spar.flow_order is not None and len(spar.flow_order[0]) == n:
+        return SweepFactor(A, *spar.flow_order)
+    if spar.banded and n >= BANDED_MIN_EQUATIONS:
+        if (spar.ordering is None or len(spar.ordering) != n or
+                not BandedFactor.fits(A, spar.ordering, spar.bandwidth)):  # renumbered once per network
+            spar.ordering, spar.bandwidth = bandwidth_ordering(sparse.csr_matrix(A))
+        if spar.bandwidth <= BANDED_MAX_RATIO * n:
+            return BandedFactor(A, spar.ordering, spar.bandwidth)
+    return DenseFactor(A)
+
+
+class BlockFactor:
+    """
+    Factorizations of the independent diagonal blocks of a block diagonal matrix (e.g. the thermally disconnected
+    parts of a network), with the same interface of DenseFactor.
+    """
+
+    def __init__(self, n, factors, eqns):
+        self.shape = (n, n)
+        self.factors = factors  # list - factorization of each block
+        self.eqns = eqns  # list - equation numbers of each block (NumPy arrays)
+
+    def solve(self, b, trans='N'):
+        b = np.asarray(b, dtype=float)
+        x = np.zeros(b.shape)
+        for factor, eqns in zip(self.factors, self.eqns):
+            x[eqns] = factor.solve(b[eqns], trans=trans)
+        return x
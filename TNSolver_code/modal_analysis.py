@@ -0,0 +1,206 @@
+"""
+Modal analysis of a thermal network and automatic selection of the time parameters of transient models.
+
+The thermal modes of the network linearized at the current temperatures solve the generalized eigenproblem
+
+    K v = lambda C v
+
+with K the conductance matrix (the fixed temperature nodes removed) and C the diagonal of the node capacitances;
+the arithmetic nodes (no capacitance) are condensed out of K (Schur complement). The time constants of the modes
+are tau = 1 / lambda: the slowest ones dominate the response of the model, the fastest one is the shortest time the
+model can resolve. The advection conductors are not symmetric, their symmetric part is used.
+
+The smallest eigenvalues are computed with eigsh by shift-invert (sparse LU factorization of the network), the
+largest one with eigsh on the condensed operator; small networks are solved with a dense eigensolver.
+"""
+
+import math
+import numpy as np
+import scipy.sparse as sparse
+import scipy.sparse.linalg as spla
+from .utility_functions import user_feedback, setunits
+from .evaluate_properties import evalfunc, rhoCvprop
+from .network_assembly import element_blocks, assemble_matrix, dirichlet_equations
+
+N_MODES = 6  # number of slow modes computed
+DENSE_MODES = 200  # networks with up to this number of capacitive nodes are solved with the dense eigensolver
+STEPS_PER_TIME_CONSTANT = 5  # time steps per resolved time constant
+TIME_CONSTANT_RANGE = 100.0  # modes faster than the slowest one by more than this ratio are not resolved
+END_TIME_CONSTANTS = 5.0  # automatic end time, in slowest time constants
+OUTPUT_POINTS = 200  # approximate number of output times with the automatic print interval
+SMALL_STEP_RATIO = 100.0  # warn when the time step is smaller than this fraction of the recommended one
+
+
+def node_capacitances(spar, nd, func, mat):
+    """
+    Evaluates the heat capacitance (rho*cv*vol) of the nodes at the current temperatures (K) and begin time.
+
+    Returns:
+        NumPy array of the capacitances, ordered by equation number.
+    """
+
+    C = np.zeros(len(nd))
+    for n in range(len(nd)):
+        rhocv = nd[n].rhocv
+        vol = nd[n].vol
+        if nd[n].matID is not None and nd[n].matID > 0:  # as tnsdriver
+            rho, cv = rhoCvprop(mat[nd[n].matID], nd[n].T)
+            rhocv = rho * cv
+        if nd[n].mfncID is not None:
+            rhocv = evalfunc(func[nd[n].mfncID], spar.begin_time)
+        if nd[n].vfncID is not None:
+            vol = evalfunc(func[nd[n].vfncID], spar.begin_time)
+        C[nd[n].eqn] = float(np.squeeze(rhocv * vol)) if vol > 0 else 0.0
+    return C
+
+
+def thermal_time_constants(spar, nd, el, bc, func, mat, n_modes=N_MODES):
+    """
+    Computes the time constants of the slowest modes and of the fastest mode of the network.
+
+    Args:
+        spar, nd, el, bc, func, mat: initialized model (temperatures in K).
+        n_modes: number of slow modes.
+
+    Returns:
+        A tuple containing the slowest time constants (NumPy array, decreasing, inf for the modes of parts of the
+        network with no fixed temperature) and the fastest time constant (NaN if no node has a capacitance).
+    """
+
+    nnd = len(nd)
+    eqs, blocks = element_blocks(nd, el)
+    K = assemble_matrix(nnd, eqs, blocks)
+    K = ((K + K.T) / 2.0).tocsr()
+    C = node_capacitances(spar, nd, func, mat)
+    fixed, _ = dirichlet_equations(spar, nd, bc)
+    free = np.setdiff1d(np.arange(nnd), fixed)
+    K = K[free][:, free].tocsc()
+    C = C[free]
+    cap = np.flatnonzero(C > 0)
+    arith = np.flatnonzero(C <= 0)
+    nc = cap.size
+    if nc == 0:
+        return np.array([]), float('nan')
+    D = 1.0 / np.sqrt(C[cap])
+
+    Kcc = K[cap][:, cap]
+    Kca = K[cap][:, arith]
+    Kaa = None
+    if arith.size > 0:
+        Kaa = K[arith][:, arith] + sparse.eye(arith.size) * 1.0e-12 * abs(K).max()  # isolated arithmetic nodes
+        Kaa = spla.splu(Kaa.tocsc())
+
+    def modal(x):  # D (Kcc - Kca inv(Kaa) Kac) D x
+        x = np.asarray(x).reshape(nc, -1)
+        y = Kcc @ (D[:, None] * x)
+        if Kaa is not None:
+            y = y - Kca @ Kaa.solve(np.asarray(Kca.T @ (D[:, None] * x)))
+        return D[:, None] * y
+
+    if nc <= DENSE_MODES:
+        lam = np.linalg.eigvalsh(modal(np.eye(nc)))
+        lam_max = lam[-1]
+        lam = lam[:n_modes]
+    else:
+        M = spla.LinearOperator((nc, nc), matvec=lambda x: modal(x).reshape(-1), dtype=float)
+        lam_max = spla.eigsh(M, k=1, which='LA', return_eigenvectors=False)[0]
+
+        # Shift-invert: inv(M + sigma I) x = inv(D) [inv(K + sigma C) [inv(D) x; 0]]_cap
+        sigma = 1.0e-10 * lam_max  # the parts of the network with no fixed temperature make K singular
+        lu = spla.splu((K + sparse.diags(sigma * C)).tocsc())
+
+        def inverse(x):
+            b = np.zeros(len(free))
+            b[cap] = np.asarray(x).reshape(-1) / D
+            return lu.solve(b)[cap] / D
+
+        Minv = spla.LinearOperator((nc, nc), matvec=inverse, dtype=float)
+        mu = spla.eigsh(Minv, k=min(n_modes, nc - 1), which='LA', return_eigenvectors=False)
+        lam = 1.0 / mu - sigma
+
+    lam = np.sort(lam)
+    with np.errstate(divide='ignore'):
+        tau = np.where(lam > 1.0e-9 * lam_max, 1.0 / np.where(lam > 0, lam, 1.0), np.inf)
+    return tau, 1.0 / lam_max
+
+
+def recommend_time_parameters(spar, tau_slow, tau_fast):
+    """
+    Recommends the time step, end time and print interval of a transient model from its time constants.
+
+    The time step resolves the modes up to TIME_CONSTANT_RANGE times faster than the slowest one, with
+    STEPS_PER_TIME_CONSTANT steps per time constant; the end time (if not set) covers END_TIME_CONSTANTS slowest
+    time constants, and the print interval gives about OUTPUT_POINTS output times.
+
+    Returns:
+        A tuple containing the time step, end time and print interval (number of time steps).
+    """
+
+    finite = tau_slow[np.isfinite(tau_slow)]
+    tau_max = finite.max() if finite.size > 0 else tau_fast
+    tau_resolved = max(tau_fast, tau_max / TIME_CONSTANT_RANGE)
+    end_time = spar.end_time
+    if spar.auto_end_time or end_time != end_time:  # end time = auto, or not set
+        end_time = spar.begin_time + END_TIME_CONSTANTS * tau_max
+    n_time_steps = max(1, math.ceil((end_time - spar.begin_time) / (tau_resolved / STEPS_PER_TIME_CONSTANT)))
+    time_step = (end_time - spar.begin_time) / n_time_steps
+    return time_step, end_time, max(1, n_time_steps // OUTPUT_POINTS)
+
+
+def time_step_analysis(spar, nd, el, bc, func, mat, logfID, prog_report, *text_widget):
+    """
+    Reports the thermal time constants of a transient model, sets the automatic time parameters ('time step =
+    auto', 'end time = auto') and warns when the time step does not fit the time constants.
+
+    Args:
+        spar, nd, el, bc, func, mat: initialized transient model (temperatures in K), spar is updated.
+        logfID: Log file ID
+        prog_report: code for the progress report
+        *text_widget: Terminal widget (optional)
+    """
+
+    units, _ = setunits(spar.units)
+    try:
+        tau_slow, tau_fast = thermal_time_constants(spar, nd, el, bc, func, mat)
+    except (RuntimeError, ValueError, spla.ArpackError) as e:
+        message = '\nWARNING: The modal analysis of the network failed ({}), no time step check\n'.format(e)
+        user_feedback(message, prog_report, logfID, *text_widget)
+        return
+    if tau_fast != tau_fast:  # no capacitance
+        return
+
+    message = '\nThermal time constants ({}): fastest {:g}, slowest {}\n'.format(
+        units["time"], tau_fast, ', '.join('{:g}'.format(tau) for tau in tau_slow))
+    if np.isinf(tau_slow).any():
+        message += '  (inf: parts of the network with no fixed temperature)\n'
+    user_feedback(message, prog_report, logfID, *text_widget)
+
+    time_step, end_time, print_interval = recommend_time_parameters(spar, tau_slow, tau_fast)
+    if spar.auto_end_time or (spar.auto_time_step and spar.end_time != spar.end_time):
+        spar.end_time = end_time
+        message = 'Automatic end time: {:g} {}\n'.format(spar.end_time, units["time"])
+        user_feedback(message, prog_report, logfID, *text_widget)
+    if spar.auto_time_step:
+        spar.time_step = time_step
+        spar.print_interval = print_interval
+        message = 'Automatic time step: {:g} {}, print interval: {} time steps\n'.format(
+            spar.time_step, units["time"], spar.print_interval)
+        user_feedback(message, prog_report, logfID, *text_widget)
+        return
+
+    if spar.time_step == spar.time_step:
+        dt = spar.time_step
+    elif isinstance(spar.number_time_steps, (int, float)) and spar.number_time_steps == spar.number_time_steps:
+        dt = (spar.end_time - spar.begin_time) / spar.number_time_steps
+    else:
+        return
+    finite = tau_slow[np.isfinite(tau_slow)]
+    tau_max = finite.max() if finite.size > 0 else tau_fast
+    if dt >= tau_max:
+        message = ('\nWARNING: The time step {:g} is longer than the slowest thermal time constant {:g}: it resolves '
+                   'none of the dominant modes, recommended time step: {:g}\n'.format(dt, tau_max, time_step))
+        user_feedback(message, prog_report, logfID, *text_widget)
+    elif dt < time_step / SMALL_STEP_RATIO:
+        message = ('\nWARNING: The time step {:g} is more than {:g} times shorter than needed by the thermal time '
+                   'constants, recommended time step: {:g}\n'.format(dt, SMALL_STEP_RATIO, time_step))
+        user_feedback(message, prog_report, logfID, *text_widget)
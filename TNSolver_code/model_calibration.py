@@ -0,0 +1,427 @@
+"""
+Calibration of a thermal model against measured temperatures (e.g. thermocouple histories of a thermal test).
+
+The measurements are read from a csv or a Microsoft Excel file (same loading of the GUI Excel import): the first
+column is the time, the other columns are the measured temperatures, with the node label (or a name mapped to a
+node label) in the header row. Steady models are compared with every row of the file.
+
+The calibration parameters are multipliers of the nominal value of model parameters, listed in a csv file:
+
+    kind, label, name[, lower, upper]
+
+    kind:  conductor, source or bc
+    label: conductor label, or source/BC number in the input file order (starting from 1)
+    name:  k, L, A, htc, sF, vel for conductors (htc of a correlation multiplies its conductance), qdot, Q for
+           sources, q, A for heat flux BCs
+    lower, upper: bounds of the multiplier (default 0.1 and 10)
+
+The misfit is minimized with a bounded trust region least squares method, the jacobian is given by the forward
+sensitivities of the node temperatures, propagated through the time steps with the factorizations of the solver:
+the model is read once and every evaluation of the misfit and of its jacobian takes a single solution.
+The calibrated model is written as a new input file.
+"""
+
+import re
+import csv
+import numpy as np
+from scipy.optimize import least_squares
+from .utility_functions import user_feedback, setunits, read_excel_sheet
+from .read_functions import is_float
+from .solver_session import SolverSession
+from .network_assembly import conductance_exponents, dirichlet_equations
+
+# Position of the parameters in the input file lines
+INP_TOKENS = {'conduction': {'k': 4, 'L': 5, 'A': 6}, 'cylindrical': {'k': 4}, 'spherical': {'k': 4},
+              'convection': {'htc': 4, 'A': 5}, 'radiation': {'sF': 4, 'A': 5}, 'surfrad': {'sF': 4, 'A': 5},
+              'advection': {'vel': 5, 'A': 6}, 'outflow': {'vel': 5, 'A': 6}, 'IFCduct': {'A': 7},
+              'EFCplate': {'A': 8}, 'EFCcyl': {'A': 7}, 'INCvenc': {'A': 7}, 'EFCdiamond': {'A': 7},
+              'ENChcyl': {'A': 6}, 'ENChplateup': {'A': 6}, 'ENChplatedown': {'A': 6}, 'ENCvplate': {'A': 6},
+              'ENCiplateup': {'A': 8}, 'ENCiplatedown': {'A': 8}, 'qdot': {'qdot': 1}, 'Qsrc': {'Q': 1},
+              'heat_flux': {'q': 1, 'A': 2}}
+
+
+class CalibrationParameter:
+    def __init__(self):
+        self.kind = ""  # string - 'conductor', 'source' or 'bc'
+        self.label = ""  # string - conductor label or source/BC number
+        self.name = ""  # string - parameter name
+        self.lower = 0.1  # double - lower bound of the multiplier
+        self.upper = 10.0  # double - upper bound of the multiplier
+        self.attribute = ""  # string - attribute of the model changed by the multiplier
+        self.index = -1  # int - internal number of the conductor, source or BC
+        self.exponent = 1.0  # double - exponent of the conductance G ~ p^n (conductors)
+        self.token = -1  # int - position of the parameter in the input file line
+        self.nominal = 0.0  # double - nominal value
+        self.multiplier = 1.0  # double - calibrated multiplier
+
+
+def read_calibration_parameters(file_name, prog_report=1, *text_widget):
+    """
+    Reads the csv file of the calibration parameters.
+
+    Returns:
+        A tuple containing an error flag (1 = errors) and the list of CalibrationParameter classes.
+    """
+
+    err = 0
+    parameters = []
+    with open(file_name, 'r', newline='') as fid:
+        for line_number, row in enumerate(csv.reader(fid, skipinitialspace=True)):
+            row = [cell.strip() for cell in row if cell.strip() != '']
+            if not row or row[0].startswith('#') or row[0].lower() == 'kind':
+                continue
+            if (len(row) not in (3, 5) or row[0] not in ('conductor', 'source', 'bc') or
+                    (len(row) == 5 and not (is_float(row[3]) and is_float(row[4]) and
+                                            0.0 < float(row[3]) < float(row[4])))):
+                message = '\nERROR: Invalid calibration parameter at line {} of {}:\n{}\n'.format(
+                    line_number + 1, file_name, ', '.join(row))
+                user_feedback(message, prog_report, None, *text_widget)
+                err = 1
+                continue
+            par = CalibrationParameter()
+            par.kind, par.label, par.name = row[0], row[1], row[2]
+            if len(row) == 5:
+                par.lower, par.upper = float(row[3]), float(row[4])
+            parameters.append(par)
+    return err, parameters
+
+
+def read_measurements(file_name, node_map=None, prog_report=1, *text_widget):
+    """
+    Reads the measured temperatures from a csv or Excel (.xlsx) file.
+
+    Args:
+        file_name: name of the file.
+        node_map: optional dictionary column name: node label (default: the column names are the node labels).
+        prog_report: code for the progress report (0 = silent, 1 = screen, 2 = GUI).
+        *text_widget: optional argument used by the GUI to provide a widget for the progress reports
+
+    Returns:
+        A tuple containing an error flag (1 = errors), the times (NumPy array), the node labels (list) and the
+        measured temperatures (times, nodes), NaN where a value is missing.
+    """
+
+    if file_name.lower().endswith(('.xlsx', '.xlsm')):
+        try:
+            _, header, rows = read_excel_sheet(file_name)
+        except ValueError as e:
+            user_feedback('\nERROR: {}: {}\n'.format(file_name, e), prog_report, None, *text_widget)
+            return 1, None, None, None
+    else:
+        with open(file_name, 'r', newline='') as fid:
+            rows = [[cell.strip() for cell in row] for row in csv.reader(fid, skipinitialspace=True)]
+        rows = [row for row in rows if any(row)]
+        header, rows = (rows[0], rows[1:]) if rows else ([], [])
+
+    if len(header) < 2:
+        message = '\nERROR: {} must contain a time column and at least a temperature column.\n'.format(file_name)
+        user_feedback(message, prog_report, None, *text_widget)
+        return 1, None, None, None
+
+    labels = [node_map.get(name, name) if node_map else name for name in header[1:]]
+    times = []
+    data = []
+    for row in rows:
+        if not row or not is_float(row[0]):
+            continue
+        times.append(float(row[0]))
+        data.append([float(row[c]) if c < len(row) and is_float(row[c]) else np.nan for c in range(1, len(header))])
+    return 0, np.array(times), labels, np.array(data).reshape(len(times), len(labels))
+
+
+def setup_parameters(session, parameters, prog_report=1, *text_widget):
+    """
+    Finds the model parameters changed by the multipliers and their nominal values.
+
+    Returns:
+        Error flag (1 = errors).
+    """
+
+    err = 0
+    el, bc, src = session.initial[4], session.initial[5], session.initial[6]
+    for par in parameters:
+        item = None
+        if par.kind == 'conductor':
+            par.index = session.element_index(par.label)
+            if par.index != -1:
+                item = el[par.index]
+                exponents = conductance_exponents(item)
+                # A correlation evaluates htc at every iteration, its multiplier is applied to the area
+                par.attribute = 'A' if par.name == 'htc' and 'htc' not in INP_TOKENS.get(item.type, {}) else par.name
+                par.exponent = exponents.get(par.attribute, 0.0)
+                par.token = INP_TOKENS.get(item.type, {}).get(par.attribute, -1)
+                if par.attribute == 'k' and item.matID != '':
+                    par.token = -1  # conductivity of a material
+        else:
+            par.index = int(par.label.split()[0]) - 1 if par.label.split()[0].isdigit() else -1
+            items = src if par.kind == 'source' else bc
+            if 0 <= par.index < len(items):
+                item = items[par.index]
+                par.attribute = par.name
+                par.token = INP_TOKENS.get(item.type, {}).get(par.name, -1)
+                if par.kind == 'source' and (item.fncqdot is not None or item.fncQ is not None):
+                    par.token = -1  # source defined by a function
+                if par.kind == 'bc' and (item.fncq is not None or item.fncTinf is not None):
+                    par.token = -1  # BC defined by a function
+
+        if item is not None and par.token != -1 and (par.kind != 'conductor' or par.exponent != 0.0):
+            par.nominal = float(getattr(item, par.attribute))
+        if item is None or par.token == -1 or par.nominal == 0.0 or (par.kind == 'conductor' and par.exponent == 0.0):
+            message = ('\nERROR: {} {} {} cannot be calibrated: it does not exist, it has no numerical value in the '
+                       'input file or it is zero.\n'.format(par.kind, par.label, par.name))
+            user_feedback(message, prog_report, None, *text_widget)
+            err = 1
+    return err
+
+
+class ForwardSensitivity:
+    """
+    Step monitor of the solver (see SolverSession.solve) propagating the derivatives S = dT/dm of the node
+    temperatures with respect to the multipliers.
+
+    At each step the converged residual R(T, T_old, m) = 0 gives A S = dR/dm + C S_old, with A the matrix of the
+    last Newton iteration (already factorized by the solver) and C the capacitance matrix (transient models).
+    """
+
+    def __init__(self, parameters, multipliers, nodes, spar, T0):
+        self.parameters = parameters
+        self.multipliers = multipliers
+        self.nodes = nodes  # internal numbers of the measured nodes
+        self.S = None
+        self.times = [spar.begin_time]
+        self.T = [np.array([T0[n] for n in nodes], dtype=float).reshape(-1) - spar.Toff]
+        self.dT = [np.zeros((len(nodes), len(parameters)))]
+
+    def __call__(self, time, dt, spar, nd, el, bc, src):
+        nnd = len(nd)
+        npar = len(self.parameters)
+        if self.S is None:
+            self.S = np.zeros((nnd, npar))
+
+        dR = np.zeros((nnd, npar))
+        for j in range(npar):
+            par = self.parameters[j]
+            if par.kind == 'conductor':
+                e = par.index
+                eqn = [nd[el[e].elnd[0]].eqn, nd[el[e].elnd[1]].eqn]
+                Tel = np.array([nd[el[e].elnd[0]].T, nd[el[e].elnd[1]].T])
+                _, Re = el[e].elmat(el[e], Tel, np.zeros((2, 1)))
+                dR[eqn, j] += par.exponent * Re.reshape(2)
+            elif par.kind == 'source':
+                for k in range(len(src[par.index].nd)):
+                    dR[nd[src[par.index].nd[k]].eqn, j] += src[par.index].Sc[k]
+            else:
+                for k in range(len(bc[par.index].nd)):
+                    dR[nd[int(bc[par.index].nd[k])].eqn, j] += bc[par.index].q * bc[par.index].A
+            dR[:, j] /= self.multipliers[j]
+
+        if dt > 0.0:
+            for nn in range(nnd):
+                if nd[nn].vol > 0:
+                    dR[nd[nn].eqn] += (nd[nn].rhocv * nd[nn].vol) / dt * self.S[nd[nn].eqn]
+        dR[dirichlet_equations(spar, nd, bc)[0]] = 0.0
+
+        self.S = spar.factor.solve(dR)
+        self.times.append(time)
+        self.T.append(np.array([nd[n].T for n in self.nodes]) - spar.Toff)
+        self.dT.append(self.S[[nd[n].eqn for n in self.nodes]])
+
+
+def interpolate_history(times, values, t):
+    """Linear interpolation of a history (first axis of values) at the times t, constant outside."""
+
+    if len(times) == 1:
+        return np.repeat(values[:1], len(t), axis=0)
+    i = np.clip(np.searchsorted(times, t, side='right') - 1, 0, len(times) - 2)
+    w = np.clip((t - times[i]) / (times[i + 1] - times[i]), 0.0, 1.0)
+    w = w.reshape((-1,) + (1,) * (values.ndim - 1))
+    return values[i] * (1.0 - w) + values[i + 1] * w
+
+
+class Calibration:
+    """Misfit between the model and the measurements, and its jacobian, as functions of the multipliers."""
+
+    def __init__(self, session, parameters, times, nodes, data):
+        self.session = session
+        self.parameters = parameters
+        self.times = times
+        self.nodes = nodes
+        self.data = data
+        self.mask = ~np.isnan(data)
+        self.n_solves = 0
+        self.multipliers = None
+        self.model = None
+        self.jac = None
+
+    def solve(self, m):
+        if self.multipliers is not None and np.array_equal(m, self.multipliers):
+            return  # residuals and jacobian of the same multipliers share the solution
+        for j in range(len(self.parameters)):
+            par = self.parameters[j]
+            self.session.set_parameter(par.kind, par.label, par.attribute, float(m[j]) * par.nominal)
+        spar = self.session.initial[2]
+        monitor = ForwardSensitivity(self.parameters, np.array(m, dtype=float), self.nodes, spar,
+                                     self.session.initial[0])
+        self.session.solve(monitor)
+        self.n_solves += 1
+        self.multipliers = np.array(m, dtype=float)
+        if spar.steady:
+            self.model = np.repeat(monitor.T[-1][None, :], len(self.times), axis=0)
+            self.jac = np.repeat(monitor.dT[-1][None, :, :], len(self.times), axis=0)
+        else:
+            times = np.array(monitor.times)
+            self.model = interpolate_history(times, np.array(monitor.T), self.times)
+            self.jac = interpolate_history(times, np.array(monitor.dT), self.times)
+
+    def residuals(self, m):
+        self.solve(m)
+        return (self.model - self.data)[self.mask]
+
+    def jacobian(self, m):
+        self.solve(m)
+        return self.jac[self.mask]
+
+
+def write_calibrated_input(base_file_name, file_name, parameters):
+    """
+    Writes a copy of the input file with the calibrated parameter values.
+
+    Args:
+        base_file_name: Base name of the original input file.
+        file_name: name of the calibrated input file.
+        parameters: list of CalibrationParameter classes.
+    """
+
+    with open(base_file_name + '.inp', 'r') as fid:
+        lines = fid.readlines()
+
+    def replace_token(line, position, value):
+        parts = re.split(r'(\s+)', line)
+        k = -1
+        for i in range(len(parts)):
+            if parts[i] and not parts[i].isspace():
+                if parts[i].startswith('!'):
+                    break
+                k += 1
+                if k == position:
+                    parts[i] = '{:.8g}'.format(value)
+                    break
+        return ''.join(parts)
+
+    block = None
+    count = 0
+    for i in range(len(lines)):
+        str_ = re.split(r'!', lines[i])[0].strip()
+        if not str_:
+            continue
+        if re.search(r'begin.*conductors', str_, re.IGNORECASE):
+            block, count = 'conductor', 0
+        elif re.search(r'begin.*boundary.*conditions', str_, re.IGNORECASE):
+            block, count = 'bc', 0
+        elif re.search(r'begin.*sources', str_, re.IGNORECASE):
+            block, count = 'source', 0
+        elif re.match(r'end', str_, re.IGNORECASE):
+            block = None
+        elif block is not None:
+            count += 1
+            label = str_.split()[0]
+            for par in parameters:
+                if par.kind == block and ((block == 'conductor' and par.label == label) or
+                                          (block != 'conductor' and par.index == count - 1)):
+                    lines[i] = replace_token(lines[i], par.token, par.multiplier * par.nominal)
+
+    with open(file_name, 'w') as fid:
+        fid.writelines(lines)
+
+
+def write_calibration_report(fid, parameters, labels, calibration, rms0, result, spar):
+    """Writes the calibrated parameters and the misfit at the measured nodes."""
+
+    u, _ = setunits(spar.units)
+    misfit = calibration.model - calibration.data
+    rms = np.sqrt(np.mean(misfit[calibration.mask] ** 2))
+
+    fid.write('\n*** Model calibration ***\n\n')
+    fid.write('  Measured values:    {} ({} nodes, {} times)\n'.format(int(np.count_nonzero(calibration.mask)),
+                                                                       len(labels), len(calibration.times)))
+    fid.write('  Model solutions:    {}\n'.format(calibration.n_solves))
+    fid.write('  Optimizer:          {}\n'.format(result.message))
+    fid.write('  RMS misfit ({}):     initial {:g}, calibrated {:g}\n\n'.format(u['T'], rms0, rms))
+
+    fid.write('    Kind       Label        Parameter    Nominal     Multiplier    Calibrated\n')
+    fid.write(' ---------- -------------------- ------ ------------- ------------- -------------\n')
+    for par in parameters:
+        fid.write(f' {par.kind:10} {par.label:20} {par.name:6} {par.nominal:13g} {par.multiplier:13g} '
+                  f'{par.multiplier * par.nominal:13g}\n')
+
+    fid.write('\n  Node        RMS misfit    Max misfit\n')
+    fid.write(' -------------------- ------------- -------------\n')
+    for c in range(len(labels)):
+        values = misfit[calibration.mask[:, c], c]
+        if values.size:
+            fid.write(f' {labels[c]:20} {np.sqrt(np.mean(values ** 2)):13g} {np.max(np.abs(values)):13g}\n')
+
+
+def tn_calibration(base_file_name, parameter_file, measurement_file, node_map=None, max_evaluations=50,
+                   prog_report=1, *text_widget):
+    """
+    Calibrates the parameters of a model against measured temperatures, writes the report to
+    base_file_name + '_cal_py.out' and the calibrated model to base_file_name + '_calibrated.inp'.
+
+    Args:
+        base_file_name: Base name of the input file (e.g., 'my_model').
+        parameter_file: csv file of the calibration parameters (see the module description).
+        measurement_file: csv or Excel file of the measured temperatures.
+        node_map: optional dictionary measurement column name: node label.
+        max_evaluations: maximum number of model solutions.
+        prog_report: code for the progress report (0 = silent, 1 = screen, 2 = GUI).
+        *text_widget: optional argument used by the GUI to provide a widget for the progress reports
+
+    Returns:
+        List of CalibrationParameter classes with the calibrated multipliers, None on errors.
+    """
+
+    err_par, parameters = read_calibration_parameters(parameter_file, prog_report, *text_widget)
+    err_meas, times, labels, data = read_measurements(measurement_file, node_map, prog_report, *text_widget)
+    session = SolverSession(base_file_name, 0)
+    if err_par or err_meas or not session.ready or not parameters:
+        message = '\nTNSolver: Errors reading the model, the calibration parameters or the measurements.\n'
+        user_feedback(message, prog_report, None, *text_widget)
+        return None
+    if setup_parameters(session, parameters, prog_report, *text_widget):
+        return None
+
+    columns = [c for c in range(len(labels)) if session.node_index(labels[c]) != -1]
+    for c in range(len(labels)):
+        if c not in columns:
+            message = '\nWARNING: measurement {} skipped, node not found.\n'.format(labels[c])
+            user_feedback(message, prog_report, None, *text_widget)
+    labels = [labels[c] for c in columns]
+    nodes = [session.node_index(label) for label in labels]
+    data = data[:, columns]
+    spar = session.initial[2]
+    if not spar.steady:
+        keep = (times >= spar.begin_time) & (times <= spar.end_time)
+        times, data = times[keep], data[keep]
+    if not np.any(~np.isnan(data)):
+        user_feedback('\nERROR: no measured values to compare with the model.\n', prog_report, None, *text_widget)
+        return None
+
+    calibration = Calibration(session, parameters, times, nodes, data)
+    lower = np.array([par.lower for par in parameters])
+    upper = np.array([par.upper for par in parameters])
+    x0 = np.clip(np.ones(len(parameters)), lower, upper)
+    rms0 = np.sqrt(np.mean(calibration.residuals(x0) ** 2))
+    result = least_squares(calibration.residuals, x0, jac=calibration.jacobian, bounds=(lower, upper),
+                           method='trf', max_nfev=max_evaluations)
+    for j in range(len(parameters)):
+        parameters[j].multiplier = float(result.x[j])
+    calibration.solve(result.x)
+
+    with open(base_file_name + '_cal_py.out', 'w') as fid:
+        write_calibration_report(fid, parameters, labels, calibration, rms0, result, spar)
+    write_calibrated_input(base_file_name, base_file_name + '_calibrated.inp', parameters)
+    message = ('\nCalibration report written to: {}\nCalibrated model written to: {}\n'.
+               format(base_file_name + '_cal_py.out', base_file_name + '_calibrated.inp'))
+    user_feedback(message, prog_report, None, *text_widget)
+    return parameters
@@ -0,0 +1,312 @@
+"""
+Multirate transient integration of thermal networks with widely separated time constants.
+
+The time constant of a node is estimated as tau = rhocv*vol / (sum of the conductances at the node). The nodes with
+a time constant shorter than the time step (fast nodes, e.g. thin foils) and the arithmetic nodes next to them make
+the fast group, the other nodes the slow partition. Every (macro) time step is taken slowest first:
+
+    1. the slow partition is advanced by one time step dt (tnsdriver), the fast group being held at its quasi-steady
+       state (no capacitance term for the fast nodes, spar.quasi_steady), which is what an implicit step longer than
+       their time constants gives them anyway;
+    2. the fast group alone is advanced from the beginning of the time step by spar.multirate sub-steps of
+       dt/spar.multirate (implicit Euler), the slow nodes next to it (interface) are held at temperatures linearly
+       interpolated between the beginning and the end of the time step, the sources and heat fluxes of the fast
+       nodes are the ones of the end of the time step.
+
+The sub-steps only assemble the (small) fast group, from the element matrices of its conductors; when its
+conductors and heat capacities are constant its matrix is factorized once for all the sub-steps. The time step can
+then be chosen for the slow parts of the model, the accuracy of the fast parts is recovered by the sub-steps.
+The constant quantities of the slow steps (update plan, pre-assembled constant conductors, orderings) are computed
+once for all the time steps (spar.setup of core_solver.driver_setup). The time histories are recorded at the print
+interval and the steady state is detected on the time steps, as tnsdriver.
+"""
+
+import copy
+import re
+import numpy as np
+from .utility_functions import user_feedback, setunits
+from .evaluate_properties import rhoCvprop
+from .output_files_writing import write_time_history
+from .network_assembly import element_blocks, load_vector
+from .network_graph import node_adjacency
+from .linear_solvers import DenseFactor
+from .update_schedule import update_plan, CONSTANT
+
+
+def time_steps(spar):
+    """Returns the number of time steps and the time step of a transient model (as tnsdriver)."""
+
+    if spar.time_step == spar.time_step:  # time step != NaN
+        return int((spar.end_time - spar.begin_time) / spar.time_step), spar.time_step
+    n_time_steps = int(spar.number_time_steps)
+    return n_time_steps, (spar.end_time - spar.begin_time) / n_time_steps
+
+
+def node_capacitances(nd, mat):
+    """Returns the heat capacity rhocv*vol of the nodes (NumPy array, 0 for the arithmetic nodes), as tnsdriver."""
+
+    C = np.zeros(len(nd))
+    for n in range(len(nd)):
+        if nd[n].vol > 0:
+            rhocv = nd[n].rhocv
+            if nd[n].matID is not None and nd[n].matID > 0:  # as tnsdriver, rhocv of the material
+                rho, cv = rhoCvprop(mat[nd[n].matID], nd[n].T)
+                rhocv = rho * cv
+            C[n] = rhocv * nd[n].vol
+    return C
+
+
+def time_constants(nd, el, mat):
+    """
+    Estimates the time constant of the nodes: capacitance over the sum of the conductances at the node.
+
+    Args:
+        nd: List of nodes (temperatures in K).
+        el: List of elements.
+        mat: List of materials.
+
+    Returns:
+        NumPy array of time constants (inf for the nodes with no conductor, 0 for the arithmetic nodes).
+    """
+
+    eqs, blocks = element_blocks(nd, el)
+    G = np.zeros(len(nd))
+    np.add.at(G, eqs[:, 0], np.abs(blocks[:, 0, 0]))
+    np.add.at(G, eqs[:, 1], np.abs(blocks[:, 1, 1]))
+    C = node_capacitances(nd, mat)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tau = np.where(G > 0, C / np.where(G > 0, G, 1.0), np.inf)
+    tau[C == 0.0] = 0.0
+    return tau
+
+
+def fast_group(spar, nd, el, bc, src, mat, dt):
+    """
+    Selects the nodes advanced with the sub-steps.
+
+    Returns:
+        A tuple containing the fast nodes (capacitive and arithmetic) and the slow nodes next to them (interface),
+        as sorted lists of node numbers.
+    """
+
+    fixed = set()
+    for i in spar.Dirichlet:
+        fixed.update(int(n) for n in bc[i].nd)
+    for i in range(len(src)):  # thermostats (with their sensing node) and temperature tables stay slow
+        if src[i].ntype == 3:
+            fixed.update(src[i].nd)
+            fixed.add(src[i].tnd)
+        elif src[i].ntype == 4:
+            fixed.update(src[i].nd)
+    fixed.update(n for n in range(len(nd)) if nd[n].mfncID is not None or nd[n].vfncID is not None)
+
+    tau = time_constants(nd, el, mat)
+    fast = {n for n in range(len(nd)) if 0.0 < tau[n] < dt and n not in fixed}
+    adjacency = node_adjacency(len(nd), el).tolil()
+    for n in list(fast):
+        fast.update(m for m in adjacency.rows[n] if tau[m] == 0.0 and m not in fixed)
+    interface = set()
+    for n in fast:
+        interface.update(m for m in adjacency.rows[n] if m not in fast)
+    return sorted(fast), sorted(interface)
+
+
+def _to_kelvin(nodes, Toff):
+    """tnsdriver returns the node temperatures in the I/O units, it expects them in K."""
+
+    for node in nodes:
+        node.T += Toff
+        node.Told += Toff
+    return np.array([node.T for node in nodes], dtype=float)
+
+
+def _single_step(spar):
+    """Returns the parameters of the slow steps (one tnsdriver time step each), kept for all the time steps."""
+
+    step = copy.copy(spar)
+    step.time_step = float('nan')
+    step.number_time_steps = 1
+    step.print_interval = 1
+    step.step_monitor = None
+    step.steady_rate = 0.0  # the steady state is detected on the macro steps
+    step.steady_imbalance = 0.0
+    return step
+
+
+class FastGroup:
+    """
+    Fast nodes of a multirate model, advanced by implicit Euler sub-steps with the interface (slow) nodes held at
+    given temperatures. The group is assembled from the element matrices of its conductors.
+    """
+
+    def __init__(self, nd, el, bc, src, mat, fast):
+        self.nodes = np.array(fast, dtype=int)  # node numbers of the fast group
+        self.local = {int(fast[i]): i for i in range(len(fast))}  # position of each fast node
+        self.elements = [e for e in range(len(el)) if el[e].elnd[0] in self.local or el[e].elnd[1] in self.local]
+        plan = update_plan(nd, el, bc, src, mat)
+        self.linear = (set(self.elements) <= set(plan.elements[CONSTANT]) and
+                       set(fast) <= set(plan.capacity[CONSTANT]))  # the matrix does not change
+        self.C = node_capacitances(nd, mat)[self.nodes]
+        self.factors = {}  # sub-step length: factorization of the matrix of a linear group
+        self.iterations = 0  # nonlinear iterations of all the sub-steps
+
+    def system(self, nd, el, mat, logfID):
+        """Assembles the conductance matrix and the residual of the conductors of the fast group."""
+
+        n = len(self.nodes)
+        G = np.zeros((n, n))
+        R = np.zeros(n)
+        rhs = np.zeros((2, 1))
+        for e in self.elements:
+            Tel = np.array([nd[el[e].elnd[0]].T, nd[el[e].elnd[1]].T])
+            if not self.linear:
+                el[e] = el[e].elpre(el[e], mat, Tel, logfID, 0)
+            lhs, Re = el[e].elmat(el[e], Tel, rhs)
+            rows = [self.local.get(el[e].elnd[0], -1), self.local.get(el[e].elnd[1], -1)]
+            for i in range(2):
+                if rows[i] >= 0:
+                    R[rows[i]] += Re[i, 0]
+                    for j in range(2):
+                        if rows[j] >= 0:
+                            G[rows[i], rows[j]] += lhs[i, j]
+        return G, R
+
+    def substep(self, h, loads, spar, nd, el, mat, logfID):
+        """Advances the fast nodes by a sub-step h (implicit Euler), the other nodes are held at their temperature."""
+
+        Told = np.array([nd[n].T for n in self.nodes], dtype=float)
+        Tf = Told.copy()
+        cap = self.C / h
+        for iteration in range(int(spar.max_iter_number)):
+            self.iterations += 1
+            G, R = self.system(nd, el, mat, logfID)
+            R += loads + cap * (Told - Tf)
+            if np.linalg.norm(R) < spar.convergence_residual * np.linalg.norm(Tf):
+                break
+            factor = self.factors.get(h) if self.linear else None
+            if factor is None:
+                factor = DenseFactor(G + np.diag(cap))
+                if self.linear:
+                    self.factors[h] = factor
+            Tf += factor.solve(R)
+            for i in range(len(self.nodes)):
+                nd[self.nodes[i]].T = Tf[i]
+            if self.linear:  # exact in one solve
+                break
+
+
+def multirate_driver(fid, T, Q, spar, nd, el, bc, src, func, mat, logfID, prog_report, *text_widget):
+    """
+    Solves a transient thermal network with the multirate time integration (spar.multirate sub-steps of the fast
+    group for every time step).
+
+    Args and Returns as tnsdriver.
+    """
+
+    from .core_solver import tnsdriver, driver_setup, steady_state_reached  # core_solver imports this module
+
+    n_time_steps, dt = time_steps(spar)
+    fast, interface = fast_group(spar, nd, el, bc, src, mat, dt)
+    if not fast:
+        message = '\nMultirate integration: no node faster than the time step, single rate integration\n'
+        user_feedback(message, prog_report, logfID, *text_widget)
+        return tnsdriver(fid, T, Q, spar, nd, el, bc, src, func, mat, logfID, prog_report, *text_widget)
+
+    units, _ = setunits(spar.units)
+    m = spar.multirate
+    message = ('\nMultirate integration: {} fast nodes, {} interface nodes, {} sub-steps of {:g} {}\n'.
+               format(len(fast), len(interface), m, dt / m, units["time"]))
+    user_feedback(message, prog_report, logfID, *text_widget)
+
+    nnd = len(nd)
+    nel = len(el)
+    group = FastGroup(nd, el, bc, src, mat, fast)
+    fast_eqns = np.array([nd[n].eqn for n in fast], dtype=int)
+    step = _single_step(spar)
+    step.setup = driver_setup(step, nd, el, bc, src, mat, logfID, prog_report, *text_widget)
+    detection = spar.steady_rate > 0.0 or spar.steady_imbalance > 0.0
+    spar.steady_time = float('nan')
+
+    time = spar.begin_time
+    timeT = [np.concatenate(([time], T - spar.Toff))]
+    timeQ = [np.concatenate(([time], np.zeros(nel)))]
+    next_out = spar.print_interval
+    iterations = 0
+    steady_count = 0  # consecutive time steps meeting the steady state criterion
+    stop = False  # steady state reached, the transient stops
+    final_steady = False  # steady state reached, the last time step is a steady solve
+
+    for n in range(n_time_steps):
+        end_time = spar.end_time if n == n_time_steps - 1 or final_steady else time + dt
+        T = np.array([nd[i].T for i in range(nnd)], dtype=float)
+        T0 = T[interface]
+        Tf0 = T[fast]
+
+        # 1. slow step, the fast group at its quasi-steady state (every node for the final steady solve)
+        step.begin_time = time
+        step.end_time = end_time
+        step.quasi_steady = list(range(nnd)) if final_steady else fast
+        _, Qs, step, nd, el, src, func = tnsdriver(None, T, np.zeros(nel), step, nd, el, bc, src, func, mat,
+                                                  logfID, prog_report, *text_widget)
+        iterations += step.iterations
+        T = _to_kelvin(nd, spar.Toff)
+        T1 = T[interface]
+        Q = np.array(Qs[-1, 1:], dtype=float)
+
+        # 2. fast sub-steps from the beginning of the time step, the interface nodes follow the slow step
+        if not final_steady:
+            loads = load_vector(step, nd, bc, src)[fast_eqns]
+            for i in range(len(fast)):
+                nd[fast[i]].T = Tf0[i]
+            h = (end_time - time) / m
+            for k in range(m):
+                weight = (k + 1) / m
+                for j in range(len(interface)):
+                    nd[interface[j]].T = T0[j] + weight * (T1[j] - T0[j])
+                group.substep(h, loads, spar, nd, el, mat, logfID)
+            for i in range(len(fast)):
+                nd[fast[i]].Told = Tf0[i]
+                T[fast[i]] = nd[fast[i]].T
+
+            # heat flows of the conductors of the fast group at the end of the time step
+            for e in group.elements:
+                Tel = np.array([nd[el[e].elnd[0]].T, nd[el[e].elnd[1]].T])
+                el[e], Q[e] = el[e].elpost(el[e], Tel)
+
+        # Steady state detection on the macro steps (as tnsdriver)
+        if detection and not final_steady:
+            steady_count = steady_count + 1 if steady_state_reached(spar, nd, Q, end_time - time) else 0
+            if steady_count >= spar.steady_steps:
+                spar.steady_time = end_time
+                message = '\nSteady state detected at: {} {}\n'.format(end_time, units["time"])
+                user_feedback(message, prog_report, logfID, *text_widget)
+                stop = spar.steady_action == 'stop' or n == n_time_steps - 1
+        time = end_time
+
+        # Output at the print interval (as tnsdriver)
+        if n + 1 >= next_out or stop or final_steady:
+            timeT.append(np.concatenate(([time], T - spar.Toff)))
+            timeQ.append(np.concatenate(([time], Q)))
+            next_out = min(next_out + spar.print_interval, n_time_steps - 1)
+
+        if stop or final_steady:
+            break
+        if spar.steady_time == spar.steady_time:  # steady state detected, solve for the final steady state
+            final_steady = True
+
+    timeT = np.array(timeT)
+    timeQ = np.array(timeQ)
+    spar.time = time
+    spar.iterations = iterations + group.iterations
+    spar.factor = step.factor
+    spar.ordering, spar.bandwidth, spar.flow_order = step.ordering, step.bandwidth, step.flow_order
+    for i in range(nnd):
+        nd[i].T = T[i] - spar.Toff
+        nd[i].Told = nd[i].Told - spar.Toff
+    if fid is not None:
+        filename = re.split(r'\.', fid.name)[0] + '_timedata_py.csv'
+        with open(filename, 'w') as fplt:
+            write_time_history(fplt, timeT, timeQ, nd, el)
+        message = ('\nTime data written to: {}'.format(filename))
+        user_feedback(message, prog_report, logfID, *text_widget)
+    return timeT, timeQ, spar, nd, el, src, func
@@ -0,0 +1,175 @@
+import numpy as np
+import scipy.sparse as sparse
+
+# Element types (elst) whose conductance does not depend on temperature, provided their material properties are
+# constant: conduction, cylindrical, spherical, convection, advection and outflow (radiation and surfrad, types 3
+# and 4, are not linear)
+LINEAR_TYPES = (1, 2, 5, 14, 15)
+
+# Conductance exponent of the parameters of each element type (G ~ p^n), the convection ones apply to every
+# convection type element (convection and correlations); the radii of the cylindrical and spherical conductors are
+# not power law parameters, see conductance_log_derivatives
+CONVECTION_EXPONENTS = {'htc': 1.0, 'A': 1.0}
+RADIATION_EXPONENTS = {'sF': 1.0, 'A': 1.0}  # radiation and surfrad (elmat_radiation)
+CONDUCTANCE_EXPONENTS = {1: {'k': 1.0, 'A': 1.0, 'L': -1.0}, 14: {'k': 1.0}, 15: {'k': 1.0}, 2: CONVECTION_EXPONENTS,
+                         3: RADIATION_EXPONENTS, 4: RADIATION_EXPONENTS, 5: {'vel': 1.0, 'A': 1.0}}
+
+
+def constant_property(prop_type):
+    """Checks if a material property type is a constant (library materials use 1, input file ones 'CONST')."""
+
+    return prop_type == 1 or prop_type == 'CONST'
+
+
+def conductance_exponents(el):
+    """Returns the dictionary parameter name: exponent n of the conductance G ~ p^n of an element."""
+
+    return CONDUCTANCE_EXPONENTS.get(el.elst, CONVECTION_EXPONENTS)
+
+
+def shell_geometry(el):
+    """
+    Sets the equivalent area A and length L of a cylindrical (elst 14) or spherical (elst 15) conductor from its
+    radii ri, ro (and length cylL), so that G = k A / L is the exact conductance of the shell.
+    """
+
+    if el.elst == 14:
+        rm = (el.ro - el.ri) / np.log(el.ro / el.ri)
+        el.A = 2 * np.pi * el.cylL * rm
+    elif el.elst == 15:
+        el.A = 4 * np.pi * (el.ri * el.ro)
+    el.L = el.ro - el.ri
+
+
+def conductance_log_derivatives(el):
+    """
+    Returns the dictionary parameter name: d(ln G)/dp of the conductance of an element at the current parameter
+    values, for the parameters with a non-zero value.
+
+    The power law parameters (see conductance_exponents) give n / p. The radii of the cylindrical and spherical
+    conductors are not power law parameters (G = 2 pi k cylL / ln(ro/ri) and G = 4 pi k ri ro / (ro - ri)), so they
+    are not in CONDUCTANCE_EXPONENTS and their derivatives are evaluated here.
+    """
+
+    derivatives = {}
+    for name, n in conductance_exponents(el).items():
+        value = getattr(el, name)
+        if value != 0.0:
+            derivatives[name] = n / value
+    if el.elst == 14 and el.ri > 0.0:
+        log_ratio = np.log(el.ro / el.ri)
+        derivatives['ri'] = 1.0 / (el.ri * log_ratio)
+        derivatives['ro'] = -1.0 / (el.ro * log_ratio)
+        derivatives['cylL'] = 1.0 / el.cylL
+    elif el.elst == 15 and el.ri > 0.0:
+        derivatives['ri'] = el.ro / (el.ri * (el.ro - el.ri))
+        derivatives['ro'] = -el.ri / (el.ro * (el.ro - el.ri))
+    return derivatives
+
+
+def is_linear_element(el, mat):
+    """
+    Checks if the conductance of an element is independent of the temperature.
+
+    Args:
+        el: Element class.
+        mat: List of materials.
+
+    Returns:
+        True for the linear elements (see LINEAR_TYPES) with no material or with constant material properties.
+    """
+
+    if el.elst not in LINEAR_TYPES:
+        return False
+    if el.elst in (1, 14, 15):
+        return el.matID == '' or constant_property(mat[el.matID].ktype)
+    if el.elst == 5:
+        return (el.matID == '' or (constant_property(mat[el.matID].rhotype) and
+                                   constant_property(mat[el.matID].cptype)))
+    return True
+
+
+def element_blocks(nd, el, Toff=0.0):
+    """
+    Evaluates the 2x2 element matrices of all the elements at the current node temperatures.
+
+    Args:
+        nd: List of nodes.
+        el: List of elements.
+        Toff: offset added to the node temperatures (spar.Toff when the nodes are in the I/O units).
+
+    Returns:
+        A tuple containing the equation numbers (nel, 2) and the element matrices (nel, 2, 2).
+    """
+
+    nel = len(el)
+    eqs = np.zeros((nel, 2), dtype=int)
+    blocks = np.zeros((nel, 2, 2))
+    rhs = np.zeros((2, 1))
+    for e in range(nel):
+        nd1 = el[e].elnd[0]
+        nd2 = el[e].elnd[1]
+        eqs[e, :] = [nd[nd1].eqn, nd[nd2].eqn]
+        Tel = np.array([nd[nd1].T, nd[nd2].T], dtype=float).reshape(2) + Toff
+        lhs, _ = el[e].elmat(el[e], Tel, rhs)
+        blocks[e, :, :] = lhs
+    return eqs, blocks
+
+
+def assemble_matrix(nnd, eqs, blocks, scale=None):
+    """
+    Assembles the element matrices in a sparse global matrix.
+
+    Args:
+        nnd: number of equations.
+        eqs: equation numbers of the elements (nel, 2).
+        blocks: element matrices (nel, 2, 2).
+        scale: optional multiplier of each element matrix (nel).
+
+    Returns:
+        The global matrix (scipy.sparse csr matrix).
+    """
+
+    if scale is not None:
+        blocks = blocks * np.asarray(scale)[:, None, None]
+    rows = np.repeat(eqs, 2, axis=1).reshape(-1)
+    cols = np.tile(eqs, (1, 2)).reshape(-1)
+    return sparse.csr_matrix((blocks.reshape(-1), (rows, cols)), shape=(nnd, nnd))
+
+
+def dirichlet_equations(spar, nd, bc):
+    """
+    Lists the equations with a fixed temperature.
+
+    Returns:
+        A tuple containing the equation numbers and the fixed temperatures in the I/O units (NumPy arrays).
+    """
+
+    eqns = []
+    values = []
+    for i in range(spar.nDBC):
+        bcn = spar.Dirichlet[i]
+        for j in range(len(bc[bcn].nd)):
+            eqns.append(nd[int(bc[bcn].nd[j])].eqn)
+            values.append(bc[bcn].Tinf)
+    return np.array(eqns, dtype=int), np.array(values, dtype=float)
+
+
+def load_vector(spar, nd, bc, src):
+    """
+    Assembles the source and heat flux BC terms with their current values.
+
+    Returns:
+        The load vector (NumPy array).
+    """
+
+    f = np.zeros(len(nd))
+    for i in range(len(src)):
+        for j in range(len(src[i].nd)):
+            f[nd[src[i].nd[j]].eqn] += src[i].Sc[j]
+    for i in range(spar.nNBC):
+        bcn = spar.Neumann[i]
+        if bc[bcn].type == 'heat_flux':
+            for j in range(len(bc[bcn].nd)):
+                f[nd[int(bc[bcn].nd[j])].eqn] += bc[bcn].q * bc[bcn].A
+    return f
@@ -0,0 +1,434 @@
+import copy
+import numpy as np
+from .utility_functions import user_feedback
+from .read_functions import Element
+from .element_matrix import elmat_convection
+from .element_preprocessor import elpre_convection
+from .element_postprocessor import elpost_convection
+from .network_assembly import is_linear_element, element_blocks
+
+# Conductors with a symmetric, temperature independent matrix G * [[1, -1], [-1, 1]] can be combined in series and
+# in parallel (advection and outflow are not symmetric)
+SYMMETRIC_TYPES = (1, 2, 14, 15)
+
+# Clusters of arithmetic nodes next to more nodes than this are not condensed (too many equivalent conductors)
+MAX_CONDENSED_BOUNDARY = 30
+
+
+class CoarseNetwork:
+    """
+    Reduced thermal network, with the records of the reductions needed to reconstruct the original one.
+
+    The reductions are applied in this order:
+        - lumping: nodes joined by a conductor much larger (lumping ratio) than all the other conductors at the two
+          nodes are merged in one node, with the sum of the volumes;
+        - parallel: linear conductors between the same pair of nodes are merged, G = sum(G_i);
+        - series: an arithmetic node (no capacitance, sources or BCs) with two linear conductors is eliminated,
+          G = G1 * G2 / (G1 + G2); a node with a single linear conductor is eliminated too (no heat flow);
+        - condensation (static condensation, spar.condensation): a cluster of arithmetic nodes with only linear
+          conductors is eliminated, the conductors between its boundary nodes b are the Schur complement
+          G_bb - G_ba inv(G_aa) G_ab, the cluster temperatures are recovered as T_a = -inv(G_aa) G_ab T_b.
+    The reduced conductors are convection elements with htc = G and A = 1.
+    """
+
+    def __init__(self):
+        self.nnd = 0  # number of nodes of the original network
+        self.nel = 0  # number of conductors of the original network
+        self.node_map = []  # list - reduced node of each original node (-1 if eliminated)
+        self.edge_map = []  # list - edge of each reduced conductor
+        self.records = []  # list - reductions in the order they were applied
+        self.n_series = 0
+        self.n_parallel = 0
+        self.n_lumped = 0
+        self.n_condensed = 0
+        self.T = None  # reduced model: initial temperatures, heat flows, nodes, elements, BCs, sources
+        self.Q = None
+        self.nd = None
+        self.el = None
+        self.bc = None
+        self.src = None
+
+    def expand(self, Tr, Qr, spar, nd, el, bc, src, nd_r, el_r, bc_r, src_r, T0=None):
+        """
+        Reconstructs the temperatures of all the original nodes and the heat flows of all the original conductors
+        from the solution of the reduced model, and updates the original nodes, elements, BCs and sources.
+
+        Args:
+            Tr, Qr: temperatures and heat flows of the reduced model (as returned by tnsdriver, I/O units).
+            spar: Simulation parameters.
+            nd, el, bc, src: original model.
+            nd_r, el_r, bc_r, src_r: solved reduced model.
+            T0: initial temperatures of the original model (from init), the eliminated nodes keep them in the
+                first row of the transient results.
+
+        Returns:
+            T, Q of the original model, in the tnsdriver format (time histories for transient models).
+        """
+
+        transient = Tr.ndim == 2
+        Tr2 = Tr[:, 1:] if transient else Tr.reshape(1, -1)
+        Qr2 = Qr[:, 1:] if transient else Qr.reshape(1, -1)
+        rows = Tr2.shape[0]
+
+        T = np.zeros((rows, self.nnd))
+        for n in range(self.nnd):
+            if self.node_map[n] != -1:
+                T[:, n] = Tr2[:, self.node_map[n]]
+        flow = {}  # heat flow of every edge, in the direction of the edge
+        for e in range(len(self.edge_map)):
+            flow[self.edge_map[e]] = Qr2[:, e]
+
+        for record in reversed(self.records):
+            if record[0] == 'parallel':
+                _, new, G, old = record
+                for edge, Gi, sign in old:
+                    flow[edge] = sign * Gi / G * flow[new]
+            elif record[0] == 'series':
+                _, k, a, b, new, (e1, G1, s1), (e2, G2, s2) = record
+                T[:, k] = (G1 * T[:, a] + G2 * T[:, b]) / (G1 + G2)
+                flow[e1] = s1 * flow[new]
+                flow[e2] = s2 * flow[new]
+            elif record[0] == 'condense':
+                _, cluster, boundary, X, removed = record
+                T[:, cluster] = T[:, boundary] @ X.T
+                for edge, a, b, G in removed:
+                    flow[edge] = G * (T[:, a] - T[:, b])
+            elif record[0] == 'dangling':
+                _, k, a, edge = record
+                T[:, k] = T[:, a]
+                flow[edge] = np.zeros(rows)
+            else:  # lumped nodes
+                _, rep, members, internal, external = record
+                for m in members:
+                    T[:, m] = T[:, rep]
+                # Internal flows: Kirchhoff distribution of the net inflow from the external conductors, the heat
+                # stored by the members of a transient model is neglected
+                index = {members[i]: i for i in range(len(members))}
+                inflow = np.zeros((rows, len(members)))
+                for m, edge, sign in external:
+                    inflow[:, index[m]] += sign * flow[edge]
+                L = np.zeros((len(members), len(members)))
+                for edge, a, b, G in internal:
+                    i, j = index[a], index[b]
+                    L[[i, j], [i, j]] += G
+                    L[i, j] -= G
+                    L[j, i] -= G
+                phi = np.linalg.lstsq(L, inflow.T, rcond=None)[0].T
+                for edge, a, b, G in internal:
+                    flow[edge] = G * (phi[:, index[a]] - phi[:, index[b]])
+
+        Q = np.column_stack([flow[e] for e in range(self.nel)]) if self.nel else np.zeros((rows, 0))
+        if transient and T0 is not None:
+            for n in range(self.nnd):
+                if self.node_map[n] == -1:
+                    T[0, n] = T0[n] - spar.Toff
+
+        # Update the original model with the solution of the reduced one
+        for n in range(self.nnd):
+            if self.node_map[n] != -1:
+                nr = nd_r[self.node_map[n]]
+                nd[n].Told = nr.Told
+                nd[n].rhocv = nr.rhocv
+            else:
+                nd[n].Told = T[-1, n]
+            nd[n].T = T[-1, n]
+        for e in range(len(self.edge_map)):
+            edge = self.edge_map[e]
+            if edge < self.nel and el_r[e].elst == el[edge].elst:  # original conductor kept in the reduced model
+                el_r[e].elnd = el[edge].elnd
+                el_r[e].nd1, el_r[e].nd2 = el[edge].nd1, el[edge].nd2
+                el[edge] = el_r[e]
+        for e in range(self.nel):
+            el[e].Q = float(Q[-1, e])
+        for i in range(len(bc)):
+            bc_r[i].nd = bc[i].nd
+            bc[i] = bc_r[i]
+        for i in range(len(src)):
+            src_r[i].nd, src_r[i].tnd = src[i].nd, src[i].tnd
+            src[i] = src_r[i]
+
+        if transient:
+            return np.column_stack((Tr[:, 0], T)), np.column_stack((Qr[:, 0], Q))
+        return T[0], Q[0]
+
+
+def coarsen_network(T, Q, spar, nd, el, bc, src, mat, logfID, prog_report, *text_widget):
+    """
+    Builds the reduced model of an initialized thermal network (see CoarseNetwork).
+
+    Args:
+        T, Q, spar, nd, el, bc, src, mat: initialized model (from init).
+        logfID: log file ID
+        prog_report: code for the progress report
+        *text_widget: Terminal widget (optional)
+
+    Returns:
+        CoarseNetwork class, with the reduced model in the T, Q, nd, el, bc, src fields.
+    """
+
+    net = CoarseNetwork()
+    nnd = len(nd)
+    nel = len(el)
+    net.nnd = nnd
+    net.nel = nel
+
+    # Conductance of the linear symmetric conductors, an estimate for the others (lumping criterion)
+    _, blocks = element_blocks(nd, el)
+    G0 = np.abs(blocks).max(axis=(1, 2)) if nel else np.zeros(0)
+    linear = [el[e].elst in SYMMETRIC_TYPES and is_linear_element(el[e], mat) for e in range(nel)]
+
+    # Nodes which must be kept: BCs, sources, thermostats, capacitance (transient)
+    protected = np.zeros(nnd, dtype=bool)
+    for i in range(len(bc)):
+        for j in range(len(bc[i].nd)):
+            protected[int(bc[i].nd[j])] = True
+    for i in range(len(src)):
+        for j in range(len(src[i].nd)):
+            protected[src[i].nd[j]] = True
+        if src[i].ntype == 3:
+            protected[src[i].tnd] = True
+    capacitive = np.array([not spar.steady and (nd[n].vol != 0.0 or nd[n].vfncID is not None)
+                           for n in range(nnd)], dtype=bool)
+
+    # Working graph: edge -> [node a, node b, conductance (None if not linear)]
+    edges = {e: [el[e].elnd[0], el[e].elnd[1], G0[e] if linear[e] else None] for e in range(nel)}
+    incident = [set() for _ in range(nnd)]
+    for e in range(nel):
+        incident[el[e].elnd[0]].add(e)
+        incident[el[e].elnd[1]].add(e)
+    alive = np.ones(nnd, dtype=bool)
+    volume = {}
+    next_edge = [nel]
+
+    def new_edge(a, b, G):
+        edge = next_edge[0]
+        next_edge[0] += 1
+        edges[edge] = [a, b, G]
+        incident[a].add(edge)
+        incident[b].add(edge)
+        return edge
+
+    def remove_edge(edge):
+        a, b, _ = edges.pop(edge)
+        incident[a].discard(edge)
+        incident[b].discard(edge)
+
+    # Lumping of tightly coupled nodes
+    if spar.coarsening and spar.lumping_ratio > 0.0:
+        parent = list(range(nnd))
+
+        def find(n):
+            while parent[n] != n:
+                parent[n] = parent[parent[n]]
+                n = parent[n]
+            return n
+
+        def lumpable(n):
+            return not protected[n] and nd[n].mfncID is None and nd[n].vfncID is None
+
+        # Strong conductors: the conductance is at least lumping ratio times the ones of the weak conductors at
+        # its nodes; starting from all the candidates, the conductors failing the test are made weak until none fails
+        strong = [False] * nel
+        for e in range(nel):
+            a, b = el[e].elnd
+            strong[e] = (linear[e] and a != b and lumpable(a) and lumpable(b) and nd[a].matID == nd[b].matID)
+        changed = True
+        while changed:
+            changed = False
+            for e in range(nel):
+                if strong[e]:
+                    a, b = el[e].elnd
+                    weak = [G0[o] for o in incident[a] | incident[b] if not strong[o]]
+                    if weak and G0[e] < spar.lumping_ratio * max(weak):
+                        strong[e] = False
+                        changed = True
+        for e in range(nel):
+            if strong[e]:
+                parent[find(el[e].elnd[1])] = find(el[e].elnd[0])
+
+        groups = {}
+        for n in range(nnd):
+            groups.setdefault(find(n), []).append(n)
+        for rep, members in groups.items():
+            if len(members) < 2:
+                continue
+            members = sorted(members)
+            rep = members[0]
+            in_group = set(members)
+            internal = []
+            external = []
+            for m in members:
+                for edge in list(incident[m]):
+                    a, b, G = edges[edge]
+                    if a in in_group and b in in_group:
+                        if edge not in [item[0] for item in internal]:
+                            internal.append((edge, a, b, G if G is not None else G0[edge]))
+                    else:
+                        external.append((m, edge, 1.0 if b == m else -1.0))
+            for edge, a, b, G in internal:
+                remove_edge(edge)
+            for m, edge, _ in external:  # the external conductors now end at the representative node
+                incident[m].discard(edge)
+                incident[rep].add(edge)
+                edges[edge] = [rep if n == m else n for n in edges[edge][:2]] + [edges[edge][2]]
+            volume[rep] = sum(nd[m].vol for m in members)
+            capacitive[rep] = any(capacitive[m] for m in members)
+            for m in members[1:]:
+                alive[m] = False
+            net.records.append(('lump', rep, members, internal, external))
+            net.n_lumped += len(members) - 1
+
+    def merge_parallel(a, b):
+        """Merges the linear conductors between a and b, returns the merged edge (None if there are none)."""
+
+        old = [edge for edge in incident[a] if edges[edge][2] is not None and
+               set(edges[edge][:2]) == {a, b} and a != b]
+        if len(old) < 2:
+            return old[0] if old else None
+        G = sum(edges[edge][2] for edge in old)
+        merged = [(edge, edges[edge][2], 1.0 if edges[edge][0] == a else -1.0) for edge in old]
+        for edge in old:
+            remove_edge(edge)
+        edge = new_edge(a, b, G)
+        net.records.append(('parallel', edge, G, merged))
+        net.n_parallel += len(old) - 1
+        return edge
+
+    for a in range(nnd):
+        for b in sorted({n for edge in list(incident[a]) for n in edges[edge][:2] if n > a}):
+            merge_parallel(a, b)
+
+    # Series elimination of the arithmetic nodes
+    queue = [n for n in range(nnd) if alive[n]]
+    while queue:
+        k = queue.pop()
+        if not alive[k] or protected[k] or capacitive[k]:
+            continue
+        ek = list(incident[k])
+        if len(ek) == 1 and edges[ek[0]][2] is not None and edges[ek[0]][0] != edges[ek[0]][1]:
+            a = edges[ek[0]][0] if edges[ek[0]][1] == k else edges[ek[0]][1]
+            remove_edge(ek[0])
+            alive[k] = False
+            net.records.append(('dangling', k, a, ek[0]))
+            net.n_series += 1
+            queue.append(a)
+        elif len(ek) == 2 and edges[ek[0]][2] is not None and edges[ek[1]][2] is not None:
+            e1, e2 = ek
+            a = edges[e1][0] if edges[e1][1] == k else edges[e1][1]
+            b = edges[e2][0] if edges[e2][1] == k else edges[e2][1]
+            if a == k or b == k or a == b:
+                continue
+            G1, G2 = edges[e1][2], edges[e2][2]
+            s1 = 1.0 if edges[e1][1] == k else -1.0  # e1 oriented a -> k
+            s2 = 1.0 if edges[e2][0] == k else -1.0  # e2 oriented k -> b
+            remove_edge(e1)
+            remove_edge(e2)
+            alive[k] = False
+            edge = new_edge(a, b, G1 * G2 / (G1 + G2))
+            net.records.append(('series', k, a, b, edge, (e1, G1, s1), (e2, G2, s2)))
+            net.n_series += 1
+            merge_parallel(a, b)
+            queue.extend([a, b])
+
+    # Static condensation of the clusters of arithmetic nodes left
+    if spar.condensation:
+        def condensable(n):
+            return (alive[n] and not protected[n] and not capacitive[n] and len(incident[n]) > 0 and
+                    all(edges[edge][2] is not None and edges[edge][0] != edges[edge][1] for edge in incident[n]))
+
+        seen = np.zeros(nnd, dtype=bool)
+        for start in range(nnd):
+            if seen[start] or not condensable(start):
+                continue
+            cluster = []
+            stack = [start]
+            seen[start] = True
+            while stack:
+                k = stack.pop()
+                cluster.append(k)
+                for edge in incident[k]:
+                    for n in edges[edge][:2]:
+                        if not seen[n] and condensable(n):
+                            seen[n] = True
+                            stack.append(n)
+            in_cluster = set(cluster)
+            removed = sorted({edge for k in cluster for edge in incident[k]})
+            boundary = sorted({n for edge in removed for n in edges[edge][:2] if n not in in_cluster})
+            if not boundary or len(boundary) > MAX_CONDENSED_BOUNDARY:
+                continue
+
+            nodes = cluster + boundary
+            index = {nodes[i]: i for i in range(len(nodes))}
+            L = np.zeros((len(nodes), len(nodes)))
+            for edge in removed:
+                a, b, G = edges[edge]
+                i, j = index[a], index[b]
+                L[[i, j], [i, j]] += G
+                L[i, j] -= G
+                L[j, i] -= G
+            s = len(cluster)
+            X = -np.linalg.solve(L[:s, :s], L[:s, s:])
+            S = L[s:, s:] + L[s:, :s] @ X
+            net.records.append(('condense', cluster, boundary, X, [(edge, *edges[edge]) for edge in removed]))
+            for edge in removed:
+                remove_edge(edge)
+            for k in cluster:
+                alive[k] = False
+            small = 1.0e-12 * np.abs(np.diag(S)).max()
+            for i in range(len(boundary)):
+                for j in range(i + 1, len(boundary)):
+                    if -S[i, j] > small:
+                        new_edge(boundary[i], boundary[j], -S[i, j])
+                        merge_parallel(boundary[i], boundary[j])
+            net.n_condensed += len(cluster)
+
+    # Reduced model
+    kept = [n for n in range(nnd) if alive[n]]
+    net.node_map = [-1] * nnd
+    for i in range(len(kept)):
+        net.node_map[kept[i]] = i
+    net.nd = []
+    for n in kept:
+        node = copy.deepcopy(nd[n])
+        node.eqn = net.node_map[n]
+        if n in volume:
+            node.vol = volume[n]
+        net.nd.append(node)
+    net.T = np.array([T[n] for n in kept], dtype=float)
+
+    net.el = []
+    net.edge_map = sorted(edges)
+    for edge in net.edge_map:
+        a, b, G = edges[edge]
+        if edge < nel:
+            element = copy.deepcopy(el[edge])
+        else:
+            element = Element()
+            element.label = 'R{}'.format(edge - nel + 1)
+            element.type = 'convection'
+            element.htc = G
+            element.A = 1.0
+            element.elst = 2
+            element.elmat = elmat_convection
+            element.elpre = elpre_convection
+            element.elpost = elpost_convection
+        element.elnd = [net.node_map[a], net.node_map[b]]
+        element.nd1, element.nd2 = nd[a].label, nd[b].label
+        net.el.append(element)
+    net.Q = np.zeros(len(net.el))
+
+    net.bc = copy.deepcopy(bc)
+    for i in range(len(bc)):
+        net.bc[i].nd = np.array([net.node_map[int(n)] for n in bc[i].nd], dtype=float)
+    net.src = copy.deepcopy(src)
+    for i in range(len(src)):
+        net.src[i].nd = [net.node_map[n] for n in src[i].nd]
+        if src[i].ntype == 3:
+            net.src[i].tnd = net.node_map[src[i].tnd]
+
+    message = ('\nNetwork coarsening: {} nodes -> {}, {} conductors -> {} ({} nodes eliminated in series, '
+               '{} parallel conductors merged, {} nodes lumped, {} nodes condensed)\n'.
+               format(nnd, len(net.nd), nel, len(net.el), net.n_series, net.n_parallel, net.n_lumped,
+                      net.n_condensed))
+    user_feedback(message, prog_report, logfID, *text_widget)
+    return net
@@ -0,0 +1,282 @@
+import copy
+import numpy as np
+import scipy.sparse as sparse
+from scipy.sparse import csgraph
+
+
+def node_adjacency(nnd, el, src=()):
+    """
+    Builds the adjacency matrix of the nodes of the thermal network.
+
+    Args:
+        nnd: number of nodes.
+        el: List of elements, each conductor couples its two nodes.
+        src: List of sources, a thermostat couples the controlled nodes with the thermostat node.
+
+    Returns:
+        Symmetric adjacency matrix (scipy.sparse csr matrix, 1 where two nodes are coupled).
+    """
+
+    rows = [el[e].elnd[0] for e in range(len(el))]
+    cols = [el[e].elnd[1] for e in range(len(el))]
+    for i in range(len(src)):
+        if src[i].ntype == 3:
+            rows.extend(src[i].nd)
+            cols.extend([src[i].tnd] * len(src[i].nd))
+    A = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(nnd, nnd))
+    A = ((A + A.T) > 0).astype(float)
+    return A
+
+
+def connected_components(nd, el, src=()):
+    """
+    Finds the thermally disconnected parts of the network.
+
+    Returns:
+        List of NumPy arrays with the (sorted) node numbers of each connected component.
+    """
+
+    n_comp, labels = csgraph.connected_components(node_adjacency(len(nd), el, src), directed=False)
+    return [np.flatnonzero(labels == c) for c in range(n_comp)]
+
+
+class SubModel:
+    """Part of a thermal model, with the maps to the original model."""
+
+    def __init__(self):
+        self.nodes = []  # list - original node of each node of the sub-model
+        self.elements = []  # list - original element of each element of the sub-model
+        self.bcs = []  # list - (original BC, positions of its nodes in the original BC) of each BC
+        self.srcs = []  # list - (original source, positions of its nodes in the original source) of each source
+        self.T = None  # sub-model: initial temperatures, heat flows, parameters, nodes, elements, BCs, sources
+        self.Q = None
+        self.spar = None
+        self.nd = None
+        self.el = None
+        self.bc = None
+        self.src = None
+
+
+def extract_submodel(T, Q, spar, nd, el, bc, src, nodes):
+    """
+    Extracts the part of a model connecting a set of nodes: the elements between them and the BCs and the sources
+    applied to them. The nodes, elements, BCs and sources are copies renumbered for the sub-model.
+
+    Args:
+        T, Q, spar, nd, el, bc, src: initialized model.
+        nodes: node numbers of the sub-model.
+
+    Returns:
+        SubModel class.
+    """
+
+    sub = SubModel()
+    sub.nodes = [int(n) for n in nodes]
+    local = {sub.nodes[i]: i for i in range(len(sub.nodes))}
+
+    sub.nd = []
+    for i in range(len(sub.nodes)):
+        node = copy.deepcopy(nd[sub.nodes[i]])
+        node.eqn = i
+        sub.nd.append(node)
+    sub.T = np.array([T[nd[n].eqn] for n in sub.nodes], dtype=float)
+
+    sub.el = []
+    for e in range(len(el)):
+        if el[e].elnd[0] in local and el[e].elnd[1] in local:
+            element = copy.deepcopy(el[e])
+            element.elnd = [local[el[e].elnd[0]], local[el[e].elnd[1]]]
+            sub.el.append(element)
+            sub.elements.append(e)
+    sub.Q = np.array([Q[e] for e in sub.elements], dtype=float)
+
+    sub.bc = []
+    for i in range(len(bc)):
+        positions = [j for j in range(len(bc[i].nd)) if int(bc[i].nd[j]) in local]
+        if positions:
+            bci = copy.deepcopy(bc[i])
+            bci.nds = [bc[i].nds[j] for j in positions] if len(bc[i].nds) == len(bc[i].nd) else bci.nds
+            bci.nd = np.array([local[int(bc[i].nd[j])] for j in positions], dtype=float)
+            sub.bc.append(bci)
+            sub.bcs.append((i, positions))
+
+    sub.src = []
+    for i in range(len(src)):
+        positions = [j for j in range(len(src[i].nd)) if src[i].nd[j] in local]
+        if positions:
+            srci = copy.deepcopy(src[i])
+            srci.nd = [local[src[i].nd[j]] for j in positions]
+            srci.Sc = [src[i].Sc[j] if j < len(src[i].Sc) else 0.0 for j in positions]
+            if src[i].ntype == 3:
+                srci.tnd = local[src[i].tnd]
+            sub.src.append(srci)
+            sub.srcs.append((i, positions))
+
+    sub.spar = copy.copy(spar)
+    sub.spar.Dirichlet = [i for i in range(len(sub.bc)) if sub.bc[i].type == 'fixed_T']
+    sub.spar.Neumann = [i for i in range(len(sub.bc)) if sub.bc[i].type != 'fixed_T']
+    sub.spar.nDBC = len(sub.spar.Dirichlet)
+    sub.spar.nNBC = len(sub.spar.Neumann)
+    sub.spar.factor = None
+    sub.spar.partition = None
+    sub.spar.ordering = None
+    sub.spar.flow_order = None
+    return sub
+
+
+def level_order(A):
+    """
+    Orders the nodes of a graph by breadth-first levels from a pseudo-peripheral node, the nodes of each connected
+    component follow the ones of the previous component.
+
+    Args:
+        A: adjacency matrix (scipy.sparse csr matrix).
+
+    Returns:
+        NumPy array of node numbers.
+    """
+
+    n = A.shape[0]
+    visited = np.zeros(n, dtype=bool)
+    order = []
+    for start in range(n):
+        if visited[start]:
+            continue
+        # the last node reached from any node is a good approximation of a peripheral node
+        nodes = csgraph.breadth_first_order(A, start, directed=False, return_predecessors=False)
+        nodes = csgraph.breadth_first_order(A, nodes[-1], directed=False, return_predecessors=False)
+        visited[nodes] = True
+        order.append(nodes)
+    return np.concatenate(order) if order else np.zeros(0, dtype=int)
+
+
+def partition_graph(A, n_parts):
+    """
+    Splits a graph in balanced parts by recursive bisection of its breadth-first level ordering, the parts are
+    compact sets of nodes with short boundaries.
+
+    Args:
+        A: adjacency matrix (scipy.sparse csr matrix).
+        n_parts: number of parts.
+
+    Returns:
+        NumPy array with the part of each node (0 to n_parts - 1).
+    """
+
+    A = sparse.csr_matrix(A)
+    parts = np.zeros(A.shape[0], dtype=int)
+
+    def bisect(nodes, k, first):
+        if k == 1 or len(nodes) < 2:
+            parts[nodes] = first
+            return
+        order = nodes[level_order(A[nodes][:, nodes])]
+        k1 = k // 2
+        split = len(nodes) * k1 // k
+        bisect(order[:split], k1, first)
+        bisect(order[split:], k - k1, first + k1)
+
+    bisect(np.arange(A.shape[0]), n_parts, 0)
+    return parts
+
+
+def bandwidth(A):
+    """Returns the half bandwidth of a matrix (max |i - j| of its nonzero entries, 0 for a diagonal matrix)."""
+
+    A = sparse.coo_matrix(A)
+    return int(np.abs(A.row - A.col).max()) if A.nnz > 0 else 0
+
+
+def bandwidth_ordering(A):
+    """
+    Orders the nodes of a graph to minimize the bandwidth of its matrix (reverse Cuthill-McKee): a chain of nodes
+    (fins, ducts, layered walls) becomes a tridiagonal matrix.
+
+    Args:
+        A: adjacency matrix (scipy.sparse matrix, the structure of the network matrix).
+
+    Returns:
+        A tuple containing the ordering (NumPy array of node numbers) and the half bandwidth of the reordered matrix.
+    """
+
+    A = sparse.csr_matrix(A)
+    A = ((A + A.T) != 0).astype(float).tocsr()
+    order = csgraph.reverse_cuthill_mckee(A, symmetric_mode=True).astype(int)
+    return order, bandwidth(A[order][:, order])
+
+
+def flow_ordering(nd, el):
+    """
+    Orders the equations along the flow direction of the advection and outflow conductors (sign of the velocity):
+    topological sort of the flow graph, the nodes of a flow loop (strongly connected component) are kept together.
+    Each other node (e.g. a wall) follows the nearest fluid node through the other conductors. The matrix of an
+    advection network is then block lower triangular, up to the conductors between the blocks (e.g. the axial wall
+    conduction), see linear_solvers.SweepFactor.
+
+    Returns:
+        A tuple containing the ordering (NumPy array of equation numbers) and the diagonal block of each position of
+        the ordering (NumPy array, a block for each fluid node or flow loop with its walls, the nodes not connected to
+        the fluid in the last block).
+    """
+
+    nnd = len(nd)
+    upstream = []
+    downstream = []
+    rows = []
+    cols = []
+    for e in range(len(el)):
+        n1, n2 = el[e].elnd[0], el[e].elnd[-1]
+        if el[e].elst == 5:  # advection, outflow
+            if el[e].vel < 0.0:
+                n1, n2 = n2, n1
+            upstream.append(nd[n1].eqn)
+            downstream.append(nd[n2].eqn)
+        elif n1 != n2:
+            rows.append(nd[n1].eqn)
+            cols.append(nd[n2].eqn)
+    fluid = np.union1d(upstream, downstream).astype(int)
+    if fluid.size == 0:
+        return np.arange(nnd), np.zeros(nnd, dtype=int)
+
+    upstream = np.array(upstream, dtype=int)
+    downstream = np.array(downstream, dtype=int)
+    G = sparse.csr_matrix((np.ones(len(upstream)), (upstream, downstream)), shape=(nnd, nnd))
+    n_comp, labels = csgraph.connected_components(G, directed=True, connection='strong')
+
+    # Topological sort (Kahn's algorithm) of the graph of the components
+    cross = labels[upstream] != labels[downstream]
+    C = sparse.csr_matrix((np.ones(np.count_nonzero(cross)), (labels[upstream[cross]], labels[downstream[cross]])),
+                          shape=(n_comp, n_comp))
+    indegree = np.diff(C.tocsc().indptr)
+    ready = [c for c in np.unique(labels[fluid]) if indegree[c] == 0]
+    block = np.full(nnd, -1, dtype=int)
+    position = np.zeros(nnd, dtype=int)
+    count = 0
+    while ready:
+        c = ready.pop()
+        members = fluid[labels[fluid] == c]
+        if members.size > 1:  # flow loop, ordered along the flow from an inlet of the loop
+            inlets = np.intersect1d(downstream[cross], members)
+            start = np.flatnonzero(members == (inlets[0] if inlets.size > 0 else members[0]))[0]
+            members = members[csgraph.breadth_first_order(G[members][:, members], start, directed=True,
+                                                          return_predecessors=False)]
+        block[members] = block.max() + 1
+        position[members] = np.arange(count, count + members.size)
+        count += members.size
+        for d in C.indices[C.indptr[c]:C.indptr[c + 1]]:
+            indegree[d] -= 1
+            if indegree[d] == 0:
+                ready.append(d)
+
+    # The other nodes join the block of the nearest fluid node (breadth-first search through the other conductors)
+    H = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(nnd, nnd))
+    distance, _, sources = csgraph.dijkstra(H, directed=False, indices=fluid, unweighted=True, min_only=True,
+                                            return_predecessors=True)
+    others = np.setdiff1d(np.arange(nnd), fluid)
+    connected = others[sources[others] >= 0]
+    block[connected] = block[sources[connected]]
+    position[connected] = position[sources[connected]]
+    block[block < 0] = block.max() + 1
+    distance[~np.isfinite(distance)] = 0.0
+    order = np.lexsort((distance, position, block))
+    return order, block[order]
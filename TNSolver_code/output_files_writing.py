@@ -98,6 +98,39 @@ def wrt_time(fid, stepn, time, nd, el, Toff):
     fid.write(f'\n')
 
 
+def write_time_history(fid, T, Q, nd, el):
+    """Writes the time histories returned by tnsdriver to the CSV file, in the wrt_time format.
+
+    Args:
+        fid: File object.
+        T: Temperature history, time in the first column (NumPy array).
+        Q: Heat flow history, time in the first column (NumPy array).
+        nd: List of nodes (labels).
+        el: List of elements (labels and the final 'U').
+    """
+
+    fid.write(' time,')
+    for n in nd:
+        fid.write(f' T_{n.label},')
+    for e in el:
+        fid.write(f' Q_{e.label},')
+    for e in el:
+        fid.write(f' U_{e.label},')
+    fid.write(f'\n')
+
+    for i in range(T.shape[0]):
+        if i > 0 and T[i, 0] <= T[i - 1, 0]:  # rows not filled by the solver
+            break
+        fid.write(f' {T[i, 0]},')
+        for n in range(len(nd)):
+            fid.write(f' {T[i, n + 1]},')
+        for e in range(len(el)):
+            fid.write(f' {Q[i, e + 1]},')
+        for e in el:
+            fid.write(f' {e.U},')
+        fid.write(f'\n')
+
+
 def write_mat(fid, mat, matID=None):
     """
     Print the material library.
@@ -297,6 +330,8 @@ def write_out(fid, spar, nd, el, bc, src, ic, enc, mat):
     fid.write(f'  Maximum nonlinear iterations =  {spar.max_iter_number}\n')
     fid.write(f'  Gravity                      =  {spar.gravity} ({u['a']})\n')
     fid.write(f'  Stefan-Boltzmann constant    =  {spar.sigma} ({u['sigma']})\n')
+    if spar.steady_time == spar.steady_time:  # steady state detected in a transient run
+        fid.write(f'  Steady state detected at     =  {spar.steady_time} ({u['time']})\n')
 
     nnd = len(nd)
     fid.write('\n*** Nodes ***\n\n')
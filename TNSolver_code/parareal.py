@@ -0,0 +1,251 @@
+"""
+Parallel-in-time (Parareal) integration of long transient models.
+
+The time steps of tnsdriver are serial. Parareal splits the time interval into slices and iterates
+
+    U[j+1] = G(U[j]) + F(U_old[j]) - G(U_old[j])
+
+with U[j] the node temperatures at the beginning of the slice j, F the fine propagator (tnsdriver with the time step
+of the model) and G the coarse propagator (tnsdriver with implicit Euler steps COARSE_RATIO times longer). The
+coarse time step sets the number of iterations: with a single coarse step per slice the iterations run up to the
+number of slices (no speedup), a coarse step of about ten fine steps converges in a few. The fine solves of all the
+slices of an iteration are independent and run in a process pool, the cheap coarse solves are serial. After
+k iterations the first k slices are exact, the iterations usually converge in a few iterations, much fewer than the
+number of slices: the wall time is then about (iterations + 1) / slices of the serial run plus the coarse solves.
+The fine solves of the iterations return the end temperatures of the slices only; the time histories (the rows of
+the print interval) of a slice are returned once, by its fine solve from the exact initial temperatures or by a
+final fine pass from the converged ones.
+
+The converged fine solution is written to base_file_name + '_parareal_py.csv' (same format as the time data file),
+the log reports the iterations and the speedup over the serial fine run (estimated from the fine solve times).
+
+Usage:
+    python -m TNSolver_code.parareal model [--slices N] [--coarse-steps N] [--workers N] [--tolerance dT]
+"""
+
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from .utility_functions import user_feedback, setunits
+from .solver_session import SolverSession
+from .core_solver import tnsdriver
+from .multirate_integration import time_steps
+from .output_files_writing import write_time_history
+
+COARSE_RATIO = 10  # fine time steps per implicit Euler step of the coarse propagator
+TOLERANCE = 1.0e-4  # convergence: max change of the slice temperatures between iterations (temperature units)
+
+# Model solved by the worker processes (each worker reads and initializes the model once)
+_worker_session = None
+
+
+def _init_worker(base_file_name):
+    global _worker_session
+    _worker_session = SolverSession(base_file_name, 0)
+
+
+def propagate(session, T0, begin_time, end_time, n_steps, rows=None):
+    """
+    Integrates the transient model of a session over a time slice.
+
+    Args:
+        session: SolverSession of the transient model.
+        T0: node temperatures at the beginning of the slice (K, NumPy array by node number).
+        begin_time, end_time: time slice.
+        n_steps: number of time steps.
+        rows: time steps of the slice (1 to n_steps) of which the histories are returned (None: no histories).
+
+    Returns:
+        The node temperatures at the end of the slice (K); with rows, a tuple containing them and the temperature
+        and heat flow histories of these time steps (I/O units, time in the first column).
+    """
+
+    T, Q, spar, nd, el, bc, src, ic, func, enc, mat = session.model()
+    spar.begin_time = begin_time
+    spar.end_time = end_time
+    spar.time_step = float('nan')
+    spar.number_time_steps = n_steps
+    spar.print_interval = 1 if rows is not None else n_steps  # without rows, tnsdriver records only the end
+    spar.steady_rate = 0.0
+    spar.steady_imbalance = 0.0
+    for n in range(len(nd)):
+        nd[n].T = T0[n]
+        T[n] = T0[n]
+    T, Q, spar, nd, el, src, func = tnsdriver(None, T, Q, spar, nd, el, bc, src, func, mat, session.logfID, 0)
+    T_end = T[-1, 1:] + spar.Toff
+    return (T_end, T[rows], Q[rows]) if rows is not None else T_end
+
+
+def _fine_slice(task):
+    """Fine propagator of a time slice (worker process), returns the result and the solve time."""
+
+    T0, begin_time, end_time, n_steps, rows = task
+    start = time.perf_counter()
+    result = propagate(_worker_session, T0, begin_time, end_time, n_steps, rows)
+    return result, time.perf_counter() - start
+
+
+def printed_steps(n_time_steps, print_interval):
+    """Returns the time steps recorded by tnsdriver at the print interval (NumPy array, 0 included)."""
+
+    printed = [0]
+    next_out = print_interval
+    for n in range(n_time_steps):
+        if n + 1 >= next_out:
+            printed.append(n + 1)
+            next_out = min(next_out + print_interval, n_time_steps - 1)
+    return np.array(printed, dtype=int)
+
+
+def slice_boundaries(n_time_steps, slices):
+    """Returns the first time step of each slice (NumPy array, n_time_steps appended)."""
+
+    slices = max(1, min(slices, n_time_steps))
+    return np.round(np.linspace(0, n_time_steps, slices + 1)).astype(int)
+
+
+def tn_parareal(base_file_name, slices=None, coarse_steps=None, workers=None, tolerance=TOLERANCE,
+                max_iterations=None, prog_report=1, *text_widget):
+    """
+    Solves a transient model with the Parareal iterations and writes the time histories.
+
+    Args:
+        base_file_name: Base name of the input file (e.g., 'my_model').
+        slices: number of time slices (default: number of workers).
+        coarse_steps: implicit Euler steps of the coarse propagator per slice (default: a step per COARSE_RATIO
+            fine time steps).
+        workers: number of processes of the fine solves (default: number of CPUs, 1 = in this process).
+        tolerance: max change of the slice temperatures between two iterations (temperature units).
+        max_iterations: maximum number of iterations (default: number of slices, the exact serial solution).
+        prog_report: code for the progress report (0 = silent, 1 = screen, 2 = GUI).
+        *text_widget: optional argument used by the GUI to provide a widget for the progress reports
+
+    Returns:
+        A tuple containing the temperature and heat flow histories (I/O units, time in the first column), None on
+        errors.
+    """
+
+    session = SolverSession(base_file_name, 0)
+    if not session.ready or session.initial[2].steady:
+        message = '\nTNSolver: The Parareal solver needs a valid transient model.\n'
+        user_feedback(message, prog_report, None, *text_widget)
+        return None
+
+    spar = session.initial[2]
+    n_time_steps, dt = time_steps(spar)
+    workers = workers or os.cpu_count() or 1
+    steps = slice_boundaries(n_time_steps, slices or workers)
+    n_slices = len(steps) - 1
+    times = spar.begin_time + steps * dt
+    times[-1] = spar.end_time
+    max_iterations = min(max_iterations or n_slices, n_slices)
+    units, _ = setunits(spar.units)
+    wall_start = time.perf_counter()
+
+    def coarse(T0, j):
+        fine_steps = steps[j + 1] - steps[j]
+        n_coarse = coarse_steps or max(1, int(round(fine_steps / COARSE_RATIO)))
+        return propagate(session, T0, times[j], times[j + 1], min(n_coarse, fine_steps))
+
+    # Iteration 0: coarse propagation of the initial temperatures
+    U = [np.array([node.T for node in session.initial[3]], dtype=float)]
+    G = []
+    for j in range(n_slices):
+        G.append(coarse(U[j], j))
+        U.append(G[j].copy())
+
+    # Printed time steps of each slice
+    printed = printed_steps(n_time_steps, int(spar.print_interval))
+    rows = [printed[(printed > steps[j]) & (printed <= steps[j + 1])] - steps[j] for j in range(n_slices)]
+
+    executor = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(base_file_name,))
+    else:
+        _init_worker(base_file_name)
+
+    def fine(first, slice_rows):
+        """Fine solves of the slices from first on, with the histories of the rows of slice_rows (by slice)."""
+
+        tasks = [(U[j], times[j], times[j + 1], steps[j + 1] - steps[j], slice_rows.get(j))
+                 for j in range(first, n_slices)]
+        return list(executor.map(_fine_slice, tasks) if executor else map(_fine_slice, tasks))
+
+    serial_time = 0.0
+    change = float('inf')
+    iteration = 0
+    histories = [None] * n_slices  # printed rows of the slices, from their exact initial temperatures
+    try:
+        while iteration < max_iterations and change >= tolerance:
+            iteration += 1
+            first = iteration - 1  # the slices before are converged (exact initial temperatures)
+            results = fine(first, {first: rows[first]})  # only the first one starts from the exact temperatures
+            if iteration == 1:
+                serial_time = sum(solve_time for _, solve_time in results)  # the whole fine run, one slice each
+            F = {}
+            for j, (result, _) in zip(range(first, n_slices), results):
+                if j == first:
+                    F[j], histories[j] = result[0], result[1:]
+                else:
+                    F[j] = result
+
+            # Serial correction sweep
+            change = 0.0
+            for j in range(first, n_slices):
+                G_new = coarse(U[j], j)
+                U_new = G_new + F[j] - G[j]
+                change = max(change, float(np.abs(U_new - U[j + 1]).max()))
+                G[j] = G_new
+                U[j + 1] = U_new
+            message = '\nParareal iteration {:3d}: max change of the slice temperatures {:g} {}'.format(
+                iteration, change, units["T"])
+            user_feedback(message, prog_report, None, *text_widget)
+
+        # Final fine pass of the other slices from the converged temperatures, with their printed rows
+        if iteration < n_slices:
+            results = fine(iteration, {j: rows[j] for j in range(iteration, n_slices)})
+            for j, (result, _) in zip(range(iteration, n_slices), results):
+                histories[j] = result[1:]
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    wall_time = time.perf_counter() - wall_start
+    T_begin = np.concatenate(([spar.begin_time], U[0] - spar.Toff))
+    Q_begin = np.zeros(len(session.initial[4]) + 1)
+    Q_begin[0] = spar.begin_time
+    T = np.vstack([T_begin] + [h[0] for h in histories])
+    Q = np.vstack([Q_begin] + [h[1] for h in histories])
+    file_name = base_file_name + '_parareal_py.csv'
+    with open(file_name, 'w') as fid:
+        write_time_history(fid, T, Q, session.initial[3], session.initial[4])
+    message = ('\n\nParareal: {} time slices, {} iterations{}, {} workers\n'
+               'Wall time {:.3f} s, serial fine integration {:.3f} s, speedup {:.2f}\n'
+               'Time data written to: {}\n'.format(n_slices, iteration,
+                                                   '' if change < tolerance or iteration == n_slices
+                                                   else ' (not converged)', workers, wall_time, serial_time,
+                                                   serial_time / wall_time, file_name))
+    user_feedback(message, prog_report, None, *text_widget)
+    return T, Q
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='TNSolver Parareal transient solver.')
+    parser.add_argument('model', help='base name of the input file')
+    parser.add_argument('--slices', type=int, default=None, help='number of time slices (default: workers)')
+    parser.add_argument('--coarse-steps', type=int, default=None,
+                        help='coarse time steps per slice (default: a step per {} fine steps)'.format(COARSE_RATIO))
+    parser.add_argument('--workers', type=int, default=None, help='number of parallel processes')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help='convergence tolerance (temperature)')
+    parser.add_argument('--max-iterations', type=int, default=None, help='maximum number of iterations')
+    args = parser.parse_args(argv)
+
+    result = tn_parareal(args.model, args.slices, args.coarse_steps, args.workers, args.tolerance,
+                         args.max_iterations)
+    return 0 if result is not None else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
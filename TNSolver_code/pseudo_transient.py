@@ -0,0 +1,54 @@
+"""
+Pseudo-transient continuation of the steady nonlinear iterations (nonlinear solver = continuation).
+
+The Newton iterations of a strongly radiating network can diverge from a cold start, the usual fix being a physical
+transient run to equilibrium. The continuation iterations solve instead
+
+    (V / dtau + A) dT = b
+
+with A and b the Newton matrix and residual of tnsdriver and V an artificial capacitance, the diagonal of A: with a
+small pseudo time step dtau each iteration is a heavily damped (implicit Euler) step towards the steady state, and
+the pseudo time step grows by switched evolution relaxation (SER) as the residual decreases,
+
+    dtau_k = dtau_(k-1) * residual_(k-1) / residual_k
+
+(at least doubled while the residual decreases, reduced by the square of the ratio when it increases) until the
+iterations turn into the usual Newton iterations (quadratic convergence) near the solution. The pseudo capacitance
+does not change the steady solution, only the path to it.
+"""
+
+import numpy as np
+
+INITIAL_PSEUDO_STEP = 10.0  # initial pseudo time step, relative to the relaxation time of the nodes (V / A = 1)
+MAX_PSEUDO_STEP = 1.0e12  # beyond this pseudo time step the pseudo capacitance is dropped (Newton iterations)
+MAX_GROWTH = 10.0  # maximum growth of the pseudo time step in one iteration
+MIN_GROWTH = 2.0  # minimum growth of the pseudo time step when the residual decreases
+
+
+class PseudoTransient:
+    def __init__(self, initial_step=INITIAL_PSEUDO_STEP):
+        self.dtau = initial_step  # double - current pseudo time step
+        self.residual = None  # double - residual of the previous iteration
+
+    def update(self, residual):
+        """
+        Updates the pseudo time step with the residual of the current iteration (SER).
+
+        Returns:
+            The pseudo time step of the iteration (inf when the pseudo capacitance is dropped).
+        """
+
+        if self.residual is not None and residual > 0.0:
+            ratio = self.residual / residual
+            self.dtau *= min(max(ratio, MIN_GROWTH), MAX_GROWTH) if ratio > 1.0 else ratio ** 2
+        self.residual = residual
+        return self.dtau if self.dtau < MAX_PSEUDO_STEP else float('inf')
+
+    def add_capacitance(self, A, fixed):
+        """Adds the pseudo capacitance term V / dtau to the diagonal of the matrix, except the fixed equations."""
+
+        if self.dtau >= MAX_PSEUDO_STEP:
+            return
+        diagonal = np.abs(np.diagonal(A)).copy()
+        diagonal[fixed] = 0.0
+        A[np.diag_indices_from(A)] += diagonal / self.dtau
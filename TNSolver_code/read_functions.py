@@ -2,6 +2,7 @@ import re
 import numpy as np
 from .utility_functions import user_feedback
 from .material_library import Material, matlib
+from .network_assembly import shell_geometry
 from .element_matrix import elmat_radiation, elmat_outflow, elmat_conduction, elmat_convection, elmat_advection
 from .element_postprocessor import elpost_radiation, elpost_convection, elpost_advection, elpost_conduction
 from .element_preprocessor import (elpre_radiation, elpre_FCuser, elpre_NCuser, elpre_IFCduct, elpre_INCvenc,
@@ -37,6 +38,34 @@ class SolutionParameters:
         self.Dirichlet = []
         self.nNBC = 0
         self.Neumann = []
+        self.factor = None  # factorization of the last solved linear system (see linear_solvers)
+        self.step_monitor = None  # callable(time, dt, spar, nd, el, bc, src) called at the end of every (time) step
+        self.coarsening = 0  # network coarsening before the solution (see network_coarsening)
+        self.lumping_ratio = 0.0  # conductance ratio to lump tightly coupled nodes (0 = no lumping)
+        self.condensation = 0  # static condensation of the arithmetic nodes (see network_coarsening)
+        self.component_solve = 1  # solve the thermally disconnected parts of the network separately
+        self.iterations = 0  # int - number of nonlinear iterations of the last solution (all time steps)
+        self.subdomains = 0  # int - number of subdomains of the domain decomposition solver (0 = dense solver)
+        self.partition = None  # NumPy array - subdomain of each equation (see linear_solvers.SchurFactor)
+        self.banded = 1  # banded factorization of the networks with a small bandwidth (see linear_solvers)
+        self.ordering = None  # NumPy array - bandwidth minimizing order of the equations (see linear_solvers)
+        self.bandwidth = 0  # int - half bandwidth of the reordered network matrix
+        self.flow_sweep = 0  # flow ordered sweep solver of the advection networks (see linear_solvers.SweepFactor)
+        self.flow_order = None  # tuple - order of the equations along the flow and their blocks (see network_graph)
+        self.multirate = 0  # int - sub-steps of the fast nodes in a time step (0 = single rate integration)
+        self.quasi_steady = []  # list - nodes with no capacitance term in the time steps (see multirate_integration)
+        self.setup = None  # DriverSetup class - constant quantities kept between tnsdriver calls (see core_solver)
+        self.nonlinear_solver = 'newton'  # string - 'newton' (tnsdriver), 'jfnk', 'kirchhoff', 'continuation'
+        self.steady_rate = 0.0  # double - steady state detection: max |dT/dt| threshold (0 = not used)
+        self.steady_imbalance = 0.0  # double - steady state detection: stored/conducted heat threshold (0 = not used)
+        self.steady_steps = 5  # int - steady state detection: consecutive time steps meeting the criterion
+        self.steady_action = 'stop'  # string - at steady state: 'stop' the transient or 'steady' final solve
+        self.steady_time = float('nan')  # double - time the steady state was detected (NaN = not detected)
+        self.auto_time_step = 0  # time step and print interval from the thermal time constants (see modal_analysis)
+        self.auto_end_time = 0  # end time from the slowest thermal time constant (see modal_analysis)
+        self.jacobian = 'element'  # string - Newton matrix: 'element' matrices or 'colored' finite differences
+        self.predictor = 'none'  # string - initial guess of the time steps: 'none', 'linear' or 'quadratic'
+        self.predictor_iterations = float('nan')  # double - nonlinear iterations per predicted time step
 
 
 class Node:
@@ -115,6 +144,8 @@ class Source:
         self.Q = 0.0  # double - total source
         self.strQ = ""  # string - total source function
         self.fncQ = None  # function - total source function (initially None)
+        self.strQT = ""  # string - total source function of the node temperature
+        self.fncQT = None  # int - total source function of the node temperature ID
         self.tstat = ""  # string - node label for thermostat
         self.Ton = 0.0  # double - thermostat on T
         self.Toff = 0.0  # double - thermostat off T
@@ -122,6 +153,7 @@ class Source:
         self.nd = []  # list - internal node numbers
         self.tnd = 0  # int - thermostat internal node number
         self.Sc = [0, ]  # double - S = Sp*T + Sc
+        self.Sp = [0, ]  # double - S = Sp*T + Sc (temperature dependent sources, linearized at the node temperature)
         self.Qtot = 0.0  # double - total node source for output
 
 
@@ -266,6 +298,8 @@ def parse_solution_parameters(lines, line_number, spar, inp_err, logfID, prog_re
         elif tokens[0].lower() == 'end' and tokens[1].lower() == 'time':
             if is_float(tokens[3]):
                 spar.end_time = float(tokens[3])
+            elif tokens[3].lower() == 'auto':
+                spar.auto_end_time = 1
             else:
                 message = ('\nERROR: Invalid end time value at line {} : {}\n'.
                            format(line_number + 1, lines[line_number]))
@@ -275,6 +309,8 @@ def parse_solution_parameters(lines, line_number, spar, inp_err, logfID, prog_re
         elif tokens[0].lower() == 'time' and tokens[1].lower() == 'step':
             if is_float(tokens[3]):
                 spar.time_step = float(tokens[3])
+            elif tokens[3].lower() == 'auto':
+                spar.auto_time_step = 1
             else:
                 message = ('\nERROR: Invalid time step value at line {} : {}\n'.
                            format(line_number + 1, lines[line_number]))
@@ -328,6 +364,120 @@ def parse_solution_parameters(lines, line_number, spar, inp_err, logfID, prog_re
                            format(line_number + 1, lines[line_number]))
                 user_feedback(message, prog_report, logfID, *text_widget)
                 inp_err = 1
+        elif tokens[0].lower() == 'network' and tokens[1].lower() == 'coarsening':
+            if tokens[3].lower() == 'yes':
+                spar.coarsening = 1
+            elif tokens[3].lower() == 'no':
+                spar.coarsening = 0
+            else:
+                message = ('\nERROR: Invalid decision (yes/no) at line {} : {}\n'.
+                           format(line_number + 1, lines[line_number]))
+                user_feedback(message, prog_report, logfID, *text_widget)
+                inp_err = 1
+        elif tokens[0].lower() == 'banded' and tokens[1].lower() == 'solver':
+            if tokens[3].lower() == 'yes':
+                spar.banded = 1
+            elif tokens[3].lower() == 'no':
+                spar.banded = 0
+            else:
+                message = ('\nERROR: Invalid decision (yes/no) at line {} : {}\n'.
+                           format(line_number + 1, lines[line_number]))
+                user_feedback(message, prog_report, logfID, *text_widget)
+                inp_err = 1
+        elif tokens[0].lower() == 'flow' and tokens[1].lower() == 'sweep':
+            if tokens[3].lower() == 'yes':
+                spar.flow_sweep = 1
+            elif tokens[3].lower() == 'no':
+                spar.flow_sweep = 0
+            else:
+                message = ('\nERROR: Invalid decision (yes/no) at line {} : {}\n'.
+                           format(line_number + 1, lines[line_number]))
+                user_feedback(message, prog_report, logfID, *text_widget)
+                inp_err = 1
+        elif tokens[0].lower() == 'component' and tokens[1].lower() == 'solve':
+            if tokens[3].lower() == 'yes':
+                spar.component_solve = 1
+            elif tokens[3].lower() == 'no':
+                spar.component_solve = 0
+            else:
+                message = ('\nERROR: Invalid decision (yes/no) at line {} : {}\n'.
+                           format(line_number + 1, lines[line_number]))
+                user_feedback(message, prog_report, logfID, *text_widget)
+                inp_err = 1
+        elif tokens[0].lower() == 'domain' and tokens[1].lower() == 'decomposition':
+            if is_integer(tokens[3]) and int(tokens[3]) >= 0:
+                spar.subdomains = int(tokens[3])
+            else:
+                message = ('\nERROR: Invalid number of subdomains at line {} : {}\n'.
+                           format(line_number + 1, lines[line_number]))
+                user_feedback(message, prog_report, logfID, *text_widget)
+                inp_err = 1
+        elif tokens[0].lower() == 'multirate' and tokens[1].lower() == 'substeps':
+            if is_integer(tokens[3]) and int(tokens[3]) >= 0:
+                spar.multirate = int(tokens[3])
+            else:
+                message = ('\nERROR: Invalid number of multirate substeps at line {} : {}\n'.
+                           format(line_number + 1, lines[line_number]))
+                user_feedback(message, prog_report, logfID, *text_widget)
+                inp_err = 1
+        elif tokens[0].lower() == 'static' and tokens[1].lower() == 'condensation':
+            if tokens[3].lower() == 'yes':
+                spar.condensation = 1
+            elif tokens[3].lower() == 'no':
+                spar.condensation = 0
+            else:
+                message = ('\nERROR: Invalid decision (yes/no) at line {} : {}\n'.
+                           format(line_number + 1, lines[line_number]))
+                user_feedback(message, prog_report, logfID, *text_widget)
+                inp_err = 1
+        elif tokens[0].lower() == 'steady' and tokens[1].lower() == 'detection':
+            name = tokens[2].lower()
+            if name in ('rate', 'imbalance') and is_float(tokens[4]) and float(tokens[4]) >= 0.0:
+                if name == 'rate':
+                    spar.steady_rate = float(tokens[4])
+                else:
+                    spar.steady_imbalance = float(tokens[4])
+            elif name == 'steps' and is_integer(tokens[4]) and int(tokens[4]) >= 1:
+                spar.steady_steps = int(tokens[4])
+            elif name == 'action' and tokens[4].lower() in ('stop', 'steady'):
+                spar.steady_action = tokens[4].lower()
+            else:
+                message = ('\nERROR: Invalid steady state detection parameter at line {} : {}\n'.
+                           format(line_number + 1, lines[line_number]))
+                user_feedback(message, prog_report, logfID, *text_widget)
+                inp_err = 1
+        elif tokens[0].lower() == 'nonlinear' and tokens[1].lower() == 'solver':
+            if tokens[3].lower() in ('newton', 'jfnk', 'kirchhoff', 'continuation'):
+                spar.nonlinear_solver = tokens[3].lower()
+            else:
+                message = ('\nERROR: Invalid nonlinear solver (newton/jfnk/kirchhoff/continuation) at line {} : '
+                           '{}\n'.format(line_number + 1, lines[line_number]))
+                user_feedback(message, prog_report, logfID, *text_widget)
+                inp_err = 1
+        elif tokens[0].lower() == 'jacobian':
+            if tokens[2].lower() in ('element', 'colored'):
+                spar.jacobian = tokens[2].lower()
+            else:
+                message = ('\nERROR: Invalid jacobian (element/colored) at line {} : {}\n'.
+                           format(line_number + 1, lines[line_number]))
+                user_feedback(message, prog_report, logfID, *text_widget)
+                inp_err = 1
+        elif tokens[0].lower() == 'predictor':
+            if tokens[2].lower() in ('none', 'linear', 'quadratic'):
+                spar.predictor = tokens[2].lower()
+            else:
+                message = ('\nERROR: Invalid predictor (none/linear/quadratic) at line {} : {}\n'.
+                           format(line_number + 1, lines[line_number]))
+                user_feedback(message, prog_report, logfID, *text_widget)
+                inp_err = 1
+        elif tokens[0].lower() == 'lumping' and tokens[1].lower() == 'ratio':
+            if is_float(tokens[3]) and float(tokens[3]) >= 0.0:
+                spar.lumping_ratio = float(tokens[3])
+            else:
+                message = ('\nERROR: Invalid lumping ratio value at line {} : {}\n'.
+                           format(line_number + 1, lines[line_number]))
+                user_feedback(message, prog_report, logfID, *text_widget)
+                inp_err = 1
         elif tokens[0].lower() == 'plot' and tokens[1].lower() == 'functions':
             if tokens[3].lower() == 'yes':
                 spar.plot_function = 1
@@ -480,10 +630,8 @@ def parse_conductors(lines, line_number, el, inp_err, logfID, prog_report, *text
                     user_feedback(message, prog_report, logfID, *text_widget)
                     inp_err = 1
 
-                rm = (el[-1].ro - el[-1].ri) / np.log(el[-1].ro / el[-1].ri)
-                el[-1].A = 2 * np.pi * el[-1].cylL * rm
-                el[-1].L = el[-1].ro - el[-1].ri
                 el[-1].elst = 14
+                shell_geometry(el[-1])
                 el[-1].elmat = elmat_conduction
                 el[-1].elpre = elpre_conduction
                 el[-1].elpost = elpost_conduction
@@ -517,9 +665,8 @@ def parse_conductors(lines, line_number, el, inp_err, logfID, prog_report, *text
                     user_feedback(message, prog_report, logfID, *text_widget)
                     inp_err = 1
 
-                el[-1].A = 4 * np.pi * (el[-1].ri * el[-1].ro)
-                el[-1].L = el[-1].ro - el[-1].ri
                 el[-1].elst = 15
+                shell_geometry(el[-1])
                 el[-1].elmat = elmat_conduction
                 el[-1].elpre = elpre_conduction
                 el[-1].elpost = elpost_conduction
@@ -1113,7 +1260,7 @@ def parse_conductors(lines, line_number, el, inp_err, logfID, prog_report, *text
                     user_feedback(message, prog_report, logfID, *text_widget)
                     inp_err = 1
 
-                if is_float(tokens[4]) and 0.0 >= float(tokens[4]) > 1.0:
+                if is_float(tokens[4]) and 0.0 < float(tokens[4]) <= 1.0:
                     el[-1].sF = float(tokens[4])
                     el[-1].emiss = el[-1].sF
                 else:
@@ -1122,7 +1269,7 @@ def parse_conductors(lines, line_number, el, inp_err, logfID, prog_report, *text
                     user_feedback(message, prog_report, logfID, *text_widget)
                     inp_err = 1
 
-                if is_float(tokens[5]) and float(tokens[5]) <= 0.0:
+                if is_float(tokens[5]) and float(tokens[5]) > 0.0:
                     el[-1].A = float(tokens[5])
                 else:
                     message = ('\nERROR: Invalid surfrad area command at line {} in the input file:\n{}'.
@@ -1465,6 +1612,19 @@ def parse_sources(lines, line_number, src, inp_err, logfID, prog_report, *text_w
                         inp_err = 1
                     for index in range(len(tokens[5:n_tokens])):
                         src[-1].nds.append(tokens[index+5])
+            elif tokens[0] == 'QsrcT':
+                if is_float(tokens[1]):
+                    message = ('\nERROR: Invalid QsrcT command at line {} in the input file:\n{}'
+                               '\nThe source must be a function of the temperature.'.format(line_number + 1, str_))
+                    user_feedback(message, prog_report, logfID, *text_widget)
+                    inp_err = 1
+                else:
+                    src.append(Source())
+                    src[-1].type = tokens[0]
+                    src[-1].ntype = 4
+                    src[-1].strQT = tokens[1]  # Function name, heat source vs node temperature
+                    for index in range(len(tokens[2:n_tokens])):
+                        src[-1].nds.append(tokens[index+2])
             else:
                 message = ('\nERROR: Unknown type of source at line {} in the input file:\n{}'.
                            format(line_number + 1, str_))
@@ -1595,6 +1755,50 @@ def parse_functions(lines, line_number, func, inp_err, logfID, prog_report, *tex
                                 user_feedback(message, prog_report, logfID, *text_widget)
                                 inp_err = 1
 
+        elif func_block.lower() == 'begin temperature table':  # function of the temperature (I/O units)
+            func.append(Function())
+            func[-1].name = '_'.join(tokens[3:])
+            func[-1].indvar = 2
+            func[-1].type = 1
+            func[-1].data = []
+            while line_number < len(lines):
+                line_number += 1
+                str_, line_number = nextline(lines, line_number)
+
+                if re.search(r'end.*temperature.*table', str_, re.IGNORECASE):
+                    break
+                else:
+                    tokens = re.findall(r'\S+', str_)
+                    if len(tokens) > 1 and is_float(tokens[0]) and is_float(tokens[1]):
+                        func[-1].data.append([float(tokens[0]), float(tokens[1])])
+                    else:
+                        message = ('\nERROR: Invalid function data at line {} in the input file:\n{}.'.
+                                   format(line_number + 1, str_))
+                        user_feedback(message, prog_report, logfID, *text_widget)
+                        inp_err = 1
+
+        elif func_block.lower() == 'begin temperature polynomial':  # coefficients, highest power first
+            func.append(Function())
+            func[-1].name = '_'.join(tokens[3:])
+            func[-1].indvar = 2
+            func[-1].type = 3
+            func[-1].data = []
+            while line_number < len(lines):
+                line_number += 1
+                str_, line_number = nextline(lines, line_number)
+
+                if re.search(r'end.*temperature.*polynomial', str_, re.IGNORECASE):
+                    break
+                else:
+                    tokens = re.findall(r'\S+', str_)
+                    if all(is_float(token) for token in tokens):
+                        func[-1].data.extend(float(token) for token in tokens)
+                    else:
+                        message = ('\nERROR: Invalid function data at line {} in the input file:\n{}.'.
+                                   format(line_number + 1, str_))
+                        user_feedback(message, prog_report, logfID, *text_widget)
+                        inp_err = 1
+
         elif func_block.lower() == 'begin composite':
             func.append(Function())
             func[-1].name = '_'.join(tokens[2:])
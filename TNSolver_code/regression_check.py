@@ -0,0 +1,395 @@
+"""
+Regression and timing harness for the reference cases shipped in Test_Gui.
+
+Every case having an input file (<case>.inp) and at least one reference output of the original solver
+(<case>_nd.csv, <case>_cond.csv or <case>_timedata.csv) is solved in a separate process, in memory: the
+temperatures and heat flows returned by the solver are compared, no output file is written (the tracked outputs
+are never overwritten and the output writers cannot fail a case).
+For each case the harness:
+    - diffs node temperatures and conductor heat flows against the reference outputs, with tolerances;
+    - records the wall time of the solution;
+    - compares temperatures and heat flows against a stored baseline (regression_baseline.json), flagging the
+      numerical regressions;
+    - compares the wall time against the timing baseline of the machine (regression_timing_<host>.json, not
+      tracked: the wall times of a machine are meaningless on another one), flagging the performance regressions.
+
+A case failing to solve is a regression, unless it failed in the baseline too: the known failures are listed in the
+report (and reported as fixed when they solve again), the run fails on them with --strict.
+
+Usage:
+    python -m TNSolver_code.regression_check [case_dir] [--update-baseline] [--workers N] [--strict]
+"""
+
+import os
+import sys
+import csv
+import json
+import math
+import time
+import argparse
+import platform
+from concurrent.futures import ProcessPoolExecutor
+from .core_solver import solve_input_file
+
+BASELINE_FILE = 'regression_baseline.json'
+TIMING_FILE = 'regression_timing_{}.json'  # per machine (host name)
+
+
+class Tolerances:
+    def __init__(self):
+        self.ref_rtol = 1.0e-3  # relative tolerance against the original solver outputs (written with %g)
+        self.ref_atol = 1.0e-3  # absolute tolerance against the original solver outputs
+        self.num_rtol = 1.0e-6  # relative tolerance against the stored baseline
+        self.num_atol = 1.0e-8  # absolute tolerance against the stored baseline
+        self.time_rtol = 0.5  # allowed relative increase of the wall time against the baseline
+        self.time_atol = 0.05  # wall time increase (s) always accepted, it filters out the timer noise
+
+
+def find_cases(case_dir):
+    """
+    Lists the cases of a folder having an input file and at least one reference output.
+
+    Args:
+        case_dir: folder containing the cases.
+
+    Returns:
+        Sorted list of the case base names.
+    """
+
+    cases = []
+    for file_name in os.listdir(case_dir):
+        if not file_name.endswith('.inp'):
+            continue
+        case = file_name[:-4]
+        for suffix in ('_nd.csv', '_cond.csv', '_timedata.csv'):
+            if os.path.isfile(os.path.join(case_dir, case + suffix)):
+                cases.append(case)
+                break
+    return sorted(cases)
+
+
+def read_csv_table(file_name):
+    """
+    Reads a csv output file of TNSolver (quoted or not, with or without trailing commas).
+
+    Args:
+        file_name: name of the csv file.
+
+    Returns:
+        A tuple containing the header (list of strings) and the data rows (list of lists of strings).
+    """
+
+    with open(file_name, 'r', newline='') as fid:
+        rows = [[cell.strip().strip('"') for cell in row] for row in csv.reader(fid, skipinitialspace=True)]
+    rows = [[cell for cell in row if cell != ''] for row in rows]
+    rows = [row for row in rows if row]
+    if not rows:
+        return [], []
+    return rows[0], rows[1:]
+
+
+def run_case(case_dir, case):
+    """
+    Solves a case in memory (core_solver.solve_input_file) and collects the results.
+
+    Args:
+        case_dir: folder containing the case.
+        case: base name of the case.
+
+    Returns:
+        Dictionary with the status, the wall time and the results of the case. Temperatures are in the model
+        units, steady results are stored as a single time row.
+    """
+
+    result = {'case': case, 'status': 'failed', 'wall_time': float('nan')}
+    start = time.perf_counter()
+    try:
+        with open(os.path.join(case_dir, case + '.inp'), 'r') as fid:
+            output = solve_input_file(fid, None, None, 0)  # in memory, no output file written
+    except Exception as e:
+        result['error'] = str(e)
+        return result
+    result['wall_time'] = time.perf_counter() - start
+
+    if output is None:
+        result['error'] = 'errors reading the input file'
+        return result
+
+    T, Q, spar, nd, el = output[:5]
+    result['status'] = 'ok'
+    result['steady'] = bool(spar.steady)
+    result['nodes'] = [n.label for n in nd]
+    result['conductors'] = [e.label for e in el]
+    if spar.steady:
+        result['time'] = [0.0]
+        result['T'] = [[float(value) for value in T]]
+        result['Q'] = [[float(value) for value in Q]]
+    else:
+        result['time'] = [float(row[0]) for row in T]
+        result['T'] = [[float(value) for value in row[1:]] for row in T]
+        result['Q'] = [[float(value) for value in row[1:]] for row in Q]
+    return result
+
+
+def close_enough(value, reference, rtol, atol):
+    """Checks |value - reference| <= atol + rtol * |reference|, NaN values only match NaN values."""
+
+    if math.isnan(value) or math.isnan(reference):
+        return math.isnan(value) and math.isnan(reference)
+    return abs(value - reference) <= atol + rtol * abs(reference)
+
+
+def compare_values(kind, labels, values, ref_values, rtol, atol):
+    """
+    Compares two dictionaries of values keyed by label.
+
+    Returns:
+        A list of mismatch records (kind, label, value, reference).
+    """
+
+    mismatches = []
+    for label in labels:
+        if label not in ref_values or label not in values:
+            continue
+        if not close_enough(values[label], ref_values[label], rtol, atol):
+            mismatches.append((kind, label, values[label], ref_values[label]))
+    return mismatches
+
+
+def compare_reference(result, case_dir, tol):
+    """
+    Diffs the results of a case against the outputs of the original solver.
+
+    Args:
+        result: dictionary returned by run_case.
+        case_dir: folder containing the reference outputs.
+        tol: Tolerances class.
+
+    Returns:
+        A tuple containing the number of compared values and the list of mismatches.
+    """
+
+    case = result['case']
+    n_compared = 0
+    mismatches = []
+    T_last = dict(zip(result['nodes'], result['T'][-1]))
+    Q_last = dict(zip(result['conductors'], result['Q'][-1]))
+
+    if result['steady']:
+        file_name = os.path.join(case_dir, case + '_nd.csv')
+        if os.path.isfile(file_name):
+            header, rows = read_csv_table(file_name)
+            ref = {row[0]: float(row[-1]) for row in rows}
+            n_compared += len(set(ref) & set(T_last))
+            mismatches += compare_values('T', result['nodes'], T_last, ref, tol.ref_rtol, tol.ref_atol)
+
+        file_name = os.path.join(case_dir, case + '_cond.csv')
+        if os.path.isfile(file_name):
+            header, rows = read_csv_table(file_name)
+            iQ = [n for n in range(len(header)) if header[n].startswith('Q')][0]
+            ref = {row[0]: float(row[iQ]) for row in rows}
+            n_compared += len(set(ref) & set(Q_last))
+            mismatches += compare_values('Q', result['conductors'], Q_last, ref, tol.ref_rtol, tol.ref_atol)
+
+    else:
+        file_name = os.path.join(case_dir, case + '_timedata.csv')
+        if os.path.isfile(file_name):
+            header, rows = read_csv_table(file_name)
+            for row in rows:
+                ref_time = float(row[0])
+                # Only the output times available in both the runs are compared
+                for n_row in range(len(result['time'])):
+                    if close_enough(result['time'][n_row], ref_time, 1.0e-9, 1.0e-12):
+                        break
+                else:
+                    continue
+                T_row = dict(zip(result['nodes'], result['T'][n_row]))
+                Q_row = dict(zip(result['conductors'], result['Q'][n_row]))
+                ref_T = {header[i][2:]: float(row[i]) for i in range(len(row)) if header[i].startswith('T_')}
+                ref_Q = {header[i][2:]: float(row[i]) for i in range(len(row)) if header[i].startswith('Q_')}
+                n_compared += len(set(ref_T) & set(T_row)) + len(set(ref_Q) & set(Q_row))
+                kind = 'T(t={:g})'.format(ref_time)
+                mismatches += compare_values(kind, result['nodes'], T_row, ref_T, tol.ref_rtol, tol.ref_atol)
+                kind = 'Q(t={:g})'.format(ref_time)
+                mismatches += compare_values(kind, result['conductors'], Q_row, ref_Q, tol.ref_rtol,
+                                             tol.ref_atol)
+
+    return n_compared, mismatches
+
+
+def compare_baseline(result, baseline, wall_time, tol):
+    """
+    Compares the results of a case against the stored baseline.
+
+    Args:
+        result: dictionary returned by run_case.
+        baseline: baseline record of the case (None if the case is not in the baseline).
+        wall_time: baseline wall time of the case on this machine (None if not available).
+        tol: Tolerances class.
+
+    Returns:
+        A tuple containing the list of numerical regressions and the performance regression message (or None).
+        A case that failed in the baseline too (known failure) has no regressions.
+    """
+
+    if result['status'] != 'ok':
+        if baseline is not None and baseline['status'] != 'ok':
+            return [], None
+        return [('status', result['case'], 'failed', 'no baseline' if baseline is None else 'ok')], None
+    if baseline is None or baseline['status'] != 'ok':
+        return [], None
+
+    regressions = []
+    if len(result['time']) != len(baseline['time']):
+        regressions.append(('output times', result['case'], len(result['time']), len(baseline['time'])))
+    else:
+        for n_row in range(len(result['time'])):
+            kind = 'T' if result['steady'] else 'T(t={:g})'.format(result['time'][n_row])
+            regressions += compare_values(kind, result['nodes'], dict(zip(result['nodes'], result['T'][n_row])),
+                                          dict(zip(baseline['nodes'], baseline['T'][n_row])),
+                                          tol.num_rtol, tol.num_atol)
+            kind = 'Q' if result['steady'] else 'Q(t={:g})'.format(result['time'][n_row])
+            regressions += compare_values(kind, result['conductors'],
+                                          dict(zip(result['conductors'], result['Q'][n_row])),
+                                          dict(zip(baseline['conductors'], baseline['Q'][n_row])),
+                                          tol.num_rtol, tol.num_atol)
+
+    slow_down = None
+    if wall_time is not None and result['wall_time'] > wall_time * (1.0 + tol.time_rtol) + tol.time_atol:
+        slow_down = 'wall time {:.3f} s, baseline {:.3f} s'.format(result['wall_time'], wall_time)
+
+    return regressions, slow_down
+
+
+def run_cases(case_dir, cases, workers=None, repeat=1):
+    """
+    Runs the cases in parallel, the wall time of each case is the best of 'repeat' runs.
+
+    Returns:
+        Dictionary of the run_case results keyed by case name.
+    """
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for n in range(repeat):
+            for result in pool.map(run_case, [case_dir] * len(cases), cases):
+                case = result['case']
+                if case not in results or results[case]['status'] != 'ok':
+                    results[case] = result
+                elif result['status'] == 'ok':
+                    results[case]['wall_time'] = min(results[case]['wall_time'], result['wall_time'])
+    return results
+
+
+def known_failure(result, baseline):
+    """Checks if a case failed and failed in the baseline too."""
+
+    return result['status'] != 'ok' and baseline is not None and baseline['status'] != 'ok'
+
+
+def write_report(fid, results, reference, regressions, slow_downs, baseline, max_lines=5):
+    """Writes the summary table, the details of the differences found and the known failures."""
+
+    fid.write('\n    Case                          Status   Wall (s)  Reference        Baseline\n')
+    fid.write(' ------------------------------ -------- -------- ---------------- ----------------\n')
+    for case in sorted(results):
+        n_compared, mismatches = reference[case]
+        ref_text = 'n/a' if n_compared == 0 else '{}/{} diff'.format(len(mismatches), n_compared)
+        if regressions[case]:
+            base_text = 'NUMERICAL' if results[case]['status'] == 'ok' else 'FAILED'
+        elif known_failure(results[case], baseline.get(case)):
+            base_text = 'KNOWN FAILURE'
+        elif results[case]['status'] == 'ok' and baseline.get(case, {}).get('status', 'ok') != 'ok':
+            base_text = 'FIXED'
+        elif slow_downs[case]:
+            base_text = 'PERFORMANCE'
+        else:
+            base_text = 'ok'
+        fid.write(f' {case:30} {results[case]["status"]:8} {results[case]["wall_time"]:8.3f} '
+                  f'{ref_text:16} {base_text:16}\n')
+
+    for case in sorted(results):
+        if reference[case][1]:
+            fid.write(f'\n{case}: differences against the reference outputs\n')
+            for kind, label, value, ref in reference[case][1][:max_lines]:
+                fid.write(f'    {kind:12} {label:10} {value:14g} reference {ref:14g}\n')
+            if len(reference[case][1]) > max_lines:
+                fid.write(f'    ... {len(reference[case][1]) - max_lines} more\n')
+        if regressions[case]:
+            fid.write(f'\n{case}: NUMERICAL REGRESSION against the baseline\n')
+            for kind, label, value, ref in regressions[case][:max_lines]:
+                fid.write(f'    {kind:12} {label:10} {value} baseline {ref}\n')
+        if slow_downs[case]:
+            fid.write(f'\n{case}: PERFORMANCE REGRESSION, {slow_downs[case]}\n')
+
+    known = [case for case in sorted(results) if known_failure(results[case], baseline.get(case))]
+    if known:
+        fid.write('\nKnown failures (the case failed in the baseline too): {}\n'.format(', '.join(known)))
+    fixed = [case for case in sorted(results)
+             if results[case]['status'] == 'ok' and baseline.get(case, {}).get('status', 'ok') != 'ok']
+    if fixed:
+        fid.write('\nFixed (failed in the baseline, update it): {}\n'.format(', '.join(fixed)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='TNSolver regression and timing harness.')
+    parser.add_argument('case_dir', nargs='?',
+                        default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                             'Test_Gui'),
+                        help='folder with the cases and the reference outputs')
+    parser.add_argument('--cases', nargs='*', help='run only these cases')
+    parser.add_argument('--workers', type=int, default=None, help='number of parallel processes')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per case, the best wall time is kept')
+    parser.add_argument('--baseline', default=None, help='baseline file (default: <case_dir>/' + BASELINE_FILE + ')')
+    parser.add_argument('--timing', default=None, help='timing baseline of this machine (default: <case_dir>/' +
+                        TIMING_FILE.format('<host>') + ')')
+    parser.add_argument('--update-baseline', action='store_true', help='store the current results as baseline')
+    parser.add_argument('--strict', action='store_true',
+                        help='fail also on differences against the references and on the known failures')
+    args = parser.parse_args(argv)
+
+    tol = Tolerances()
+    baseline_file = args.baseline or os.path.join(args.case_dir, BASELINE_FILE)
+    timing_file = args.timing or os.path.join(args.case_dir, TIMING_FILE.format(platform.node() or 'local'))
+    cases = args.cases or find_cases(args.case_dir)
+
+    results = run_cases(args.case_dir, cases, args.workers, args.repeat)
+
+    baseline = {}
+    if os.path.isfile(baseline_file):
+        with open(baseline_file, 'r') as fid:
+            baseline = json.load(fid)
+    timing = {}
+    if os.path.isfile(timing_file):
+        with open(timing_file, 'r') as fid:
+            timing = json.load(fid)
+
+    reference = {}
+    regressions = {}
+    slow_downs = {}
+    for case, result in results.items():
+        reference[case] = compare_reference(result, args.case_dir, tol) if result['status'] == 'ok' else (0, [])
+        regressions[case], slow_downs[case] = compare_baseline(result, baseline.get(case), timing.get(case), tol)
+
+    write_report(sys.stdout, results, reference, regressions, slow_downs, baseline)
+
+    if args.update_baseline:
+        baseline.update({case: {key: value for key, value in result.items() if key != 'wall_time'}
+                         for case, result in results.items()})
+        with open(baseline_file, 'w') as fid:
+            json.dump(baseline, fid, indent=1, sort_keys=True)
+        timing.update({case: result['wall_time'] for case, result in results.items() if result['status'] == 'ok'})
+        with open(timing_file, 'w') as fid:
+            json.dump(timing, fid, indent=1, sort_keys=True)
+        print('\nBaseline written to: {}\nTiming baseline written to: {}'.format(baseline_file, timing_file))
+        return 0
+
+    failed = any(regressions.values()) or any(slow_downs.values())
+    if args.strict:
+        failed = (failed or any(reference[case][1] for case in reference) or
+                  any(known_failure(results[case], baseline.get(case)) for case in results))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
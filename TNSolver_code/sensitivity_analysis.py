@@ -0,0 +1,194 @@
+import numpy as np
+from .utility_functions import setunits, user_feedback
+from .solver_session import SolverSession
+from .network_assembly import conductance_log_derivatives
+
+
+class Sensitivity:
+    def __init__(self):
+        self.kind = ""  # string - 'conductor', 'source' or 'bc'
+        self.label = ""  # string - conductor label or source/BC description
+        self.name = ""  # string - parameter name (k, L, A, ri, ro, cylL, htc, sF, vel, Q, qdot, q, Tinf)
+        self.value = 0.0  # double - parameter value
+        self.eqn = []  # list - equations of the residual depending on the parameter
+        self.dR = []  # list - derivative of the residual with respect to the parameter
+        self.dTdp = 0.0  # double - derivative of the target temperature with respect to the parameter
+        self.scaled = 0.0  # double - dTdp * value, target temperature change for a 100% parameter change
+
+
+def model_parameters(spar, nd, el, bc, src):
+    """
+    Lists the parameters of a solved model with the derivative of the residual vector with respect to each one.
+
+    The residual of the thermal network is R(T, p) = sources - sum of the conductor heat flows, each conductor
+    contributes with the right-hand side of its element matrix, which is proportional to its conductance.
+    For a conductor parameter p it follows dR/dp = R_e * d(ln G)/dp, i.e. n * R_e / p for G ~ p^n; the radii and
+    length of the cylindrical and spherical conductors (ri, ro, cylL) are included through the exact shell
+    conductance (see network_assembly.conductance_log_derivatives).
+    Rows of Dirichlet nodes (R = Tinf - T) only depend on the BC temperature.
+
+    Args:
+        spar: Simulation parameters (solved model, temperatures in the I/O units).
+        nd: List of nodes.
+        el: List of elements.
+        bc: List of boundary conditions.
+        src: List of sources.
+
+    Returns:
+        List of Sensitivity classes, with the fields kind, label, name, value, eqn and dR set.
+    """
+
+    dirichlet = set()
+    for i in range(spar.nDBC):
+        bcn = spar.Dirichlet[i]
+        for j in range(len(bc[bcn].nd)):
+            dirichlet.add(nd[int(bc[bcn].nd[j])].eqn)
+
+    def new_parameter(kind, label, name, value, eqn, dR):
+        keep = [i for i in range(len(eqn)) if eqn[i] not in dirichlet or kind == 'bc']
+        par = Sensitivity()
+        par.kind = kind
+        par.label = label
+        par.name = name
+        par.value = float(value)
+        par.eqn = [eqn[i] for i in keep]
+        par.dR = [float(dR[i]) for i in keep]
+        return par
+
+    parameters = []
+    rhs = np.zeros((2, 1))
+    for e in range(len(el)):
+        nd1 = el[e].elnd[0]
+        nd2 = el[e].elnd[1]
+        Tel = np.array([nd[nd1].T, nd[nd2].T], dtype=float).reshape(2) + spar.Toff
+        _, Re = el[e].elmat(el[e], Tel, rhs)  # element residual, proportional to the conductance
+        eqn = [nd[nd1].eqn, nd[nd2].eqn]
+        for name, dlnG in conductance_log_derivatives(el[e]).items():
+            parameters.append(new_parameter('conductor', el[e].label, name, getattr(el[e], name), eqn,
+                                            dlnG * Re.reshape(2)))
+
+    for i in range(len(src)):
+        label = '{} ({})'.format(i + 1, src[i].type)
+        eqn = [nd[src[i].nd[j]].eqn for j in range(len(src[i].nd))]
+        if src[i].ntype == 1:
+            dR = [nd[src[i].nd[j]].vol for j in range(len(src[i].nd))]
+            parameters.append(new_parameter('source', label, 'qdot', src[i].qdot, eqn, dR))
+        elif src[i].ntype == 2:
+            parameters.append(new_parameter('source', label, 'Q', src[i].Q, eqn, [1.0] * len(eqn)))
+        elif src[i].ntype == 3:
+            dR = [1.0 if src[i].Sc[j] != 0.0 else 0.0 for j in range(len(src[i].nd))]
+            parameters.append(new_parameter('source', label, 'Q', src[i].Q, eqn, dR))
+
+    for i in range(len(bc)):
+        label = '{} ({})'.format(i + 1, bc[i].type)
+        eqn = [nd[int(bc[i].nd[j])].eqn for j in range(len(bc[i].nd))]
+        if bc[i].type == 'fixed_T':
+            parameters.append(new_parameter('bc', label, 'Tinf', bc[i].Tinf, eqn, [1.0] * len(eqn)))
+        elif bc[i].type == 'heat_flux':
+            keep = [j for j in range(len(eqn)) if eqn[j] not in dirichlet]
+            eqn = [eqn[j] for j in keep]
+            parameters.append(new_parameter('bc', label, 'q', bc[i].q, eqn, [bc[i].A] * len(eqn)))
+            parameters.append(new_parameter('bc', label, 'A', bc[i].A, eqn, [bc[i].q] * len(eqn)))
+
+    return parameters
+
+
+def adjoint_sensitivity(target, spar, nd, el, bc, src):
+    """
+    Evaluates the derivative of a node temperature with respect to every parameter of a steady model with a
+    single transposed (adjoint) solve, reusing the factorization of the converged linear system (spar.factor).
+
+    With A the matrix of the converged Newton step, dT/dp = A^-1 dR/dp; for the target node t:
+        dT_t/dp = lambda^T dR/dp,  with  A^T lambda = e_t
+
+    The result is exact for linear networks and for radiation; temperature dependent properties and correlations
+    are lagged in the solver matrix, so for them it is a first order approximation.
+
+    Args:
+        target: label of the target node.
+        spar, nd, el, bc, src: solved model (e.g. from a SolverSession).
+
+    Returns:
+        List of Sensitivity classes sorted by decreasing |scaled| sensitivity (None if target is not found).
+    """
+
+    eqn_t = None
+    for n in range(len(nd)):
+        if nd[n].label == target:
+            eqn_t = nd[n].eqn
+    if eqn_t is None or spar.factor is None:
+        return None
+
+    e_t = np.zeros((len(nd), 1))
+    e_t[eqn_t] = 1.0
+    lam = spar.factor.solve(e_t, trans='T').reshape(-1)
+
+    parameters = model_parameters(spar, nd, el, bc, src)
+    for par in parameters:
+        par.dTdp = float(np.dot(lam[par.eqn], par.dR)) if par.eqn else 0.0
+        par.scaled = par.dTdp * par.value
+
+    parameters.sort(key=lambda par: abs(par.scaled), reverse=True)
+    return parameters
+
+
+def write_sensitivity_report(fid, target, parameters, spar):
+    """
+    Writes the ranked sensitivity report.
+
+    Args:
+        fid: File object.
+        target: label of the target node.
+        parameters: list of Sensitivity classes from adjoint_sensitivity.
+        spar: Simulation parameters.
+    """
+
+    u, _ = setunits(spar.units)
+
+    fid.write('\n*** Sensitivity of the temperature of node {} ***\n\n'.format(target))
+    fid.write('  Parameters are ranked by the scaled sensitivity p*dT/dp, i.e. the temperature change\n')
+    fid.write('  ({}) for a 100% change of the parameter (first order).\n\n'.format(u['T']))
+    fid.write(' Rank    Kind       Label          Parameter      Value          dT/dp       p*dT/dp\n')
+    fid.write(' ---- ---------- -------------------- ------ ------------- ------------- -------------\n')
+    for n in range(len(parameters)):
+        par = parameters[n]
+        fid.write(f' {n + 1:4d} {par.kind:10} {par.label:20} {par.name:6} {par.value:13g} {par.dTdp:13g} '
+                  f'{par.scaled:13g}\n')
+
+
+def tn_sensitivity(base_file_name, target, prog_report=1, *text_widget):
+    """
+    Solves a steady model and writes the adjoint sensitivity report of a node temperature to
+    base_file_name + '_sens_py.out'.
+
+    Args:
+        base_file_name: Base name of the input file (e.g., 'my_model').
+        target: label of the target (hot-spot) node.
+        prog_report: code for the progress report (0 = silent, 1 = screen, 2 = GUI).
+        *text_widget: optional argument used by the GUI to provide a widget for the progress reports
+
+    Returns:
+        List of Sensitivity classes sorted by decreasing |scaled| sensitivity, None on errors.
+    """
+
+    session = SolverSession(base_file_name, prog_report, *text_widget)
+    if not session.ready:
+        return None
+    if not session.initial[2].steady:
+        message = '\nTNSolver: the adjoint sensitivity analysis is available for steady models only.\n'
+        user_feedback(message, prog_report, None, *text_widget)
+        return None
+
+    session.solve()
+    parameters = adjoint_sensitivity(target, session.spar, session.nd, session.el, session.bc, session.src)
+    if parameters is None:
+        message = '\nERROR: Node {} not found, or the model was not solved.\n'.format(target)
+        user_feedback(message, prog_report, None, *text_widget)
+        return None
+
+    with open(base_file_name + '_sens_py.out', 'w') as fid:
+        write_sensitivity_report(fid, target, parameters, session.spar)
+    message = '\nSensitivity report has been written to: {}\n'.format(base_file_name + '_sens_py.out')
+    user_feedback(message, prog_report, None, *text_widget)
+
+    return parameters
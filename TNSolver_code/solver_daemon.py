@@ -0,0 +1,235 @@
+"""
+Local solver service keeping the thermal models in memory.
+
+Programs solving the same models many times (e.g. an optimization loop) pay the Python start-up, the imports and
+read_input_file only once: the service loads the models once and then answers requests, one JSON object per line,
+on a Unix socket or on stdin/stdout:
+
+    {"id": 1, "op": "load", "model": "box", "file": "Test_Gui/conduction"}
+    {"id": 2, "op": "set", "model": "box", "kind": "conductor", "label": "1", "name": "k", "value": 15.0}
+    {"id": 3, "op": "solve", "model": "box"}
+    {"id": 4, "op": "results", "model": "box", "nodes": ["1", "3"], "elements": ["1"], "history": false}
+
+Other operations: "unload", "list", "ping" and "shutdown". Every response echoes the request id and reports the
+time spent on the request:
+
+    {"id": 3, "ok": true, "result": {"solves": 1}, "latency_ms": 12.3}
+    {"id": 5, "ok": false, "error": "unknown model: foo", "latency_ms": 0.01}
+
+Several clients are served concurrently and the requests of a client are executed concurrently too: the requests
+to a model are executed in the order they are received by the worker thread of the model, different models are
+solved in parallel (tnsdriver keeps the state of a solve, e.g. the simulation time, in local variables and in the
+model data, never in module globals).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .solver_session import SolverSession
+
+
+class ModelWorker:
+    """A model loaded in the service, with the single thread executing its requests."""
+
+    def __init__(self, name, base_file_name):
+        self.name = name
+        self.base_file_name = base_file_name
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='tnsolver-' + name)
+        self.session = None
+
+    async def run(self, function, *args):
+        """Runs a function in the worker thread of the model."""
+
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    def load(self):
+        self.session = SolverSession(self.base_file_name, 0)
+        if not self.session.ready:
+            raise ValueError('errors reading the input file: {}.inp'.format(self.base_file_name))
+        return {'nodes': len(self.session.initial[3]), 'elements': len(self.session.initial[4])}
+
+    def set_parameter(self, kind, label, name, value):
+        if not self.session.set_parameter(kind, label, name, value):
+            raise ValueError('parameter not found: {} {} {}'.format(kind, label, name))
+        return {}
+
+    def solve(self):
+        T, _ = self.session.solve()
+        if T is None:
+            raise RuntimeError('solution failed')
+        return {'solves': self.session.n_solves}
+
+    def results(self, nodes=None, elements=None, history=False):
+        session = self.session
+        if session.nd is None:
+            raise ValueError('the model has not been solved')
+        result = {'T': session.node_temperatures(nodes), 'Q': session.element_heat_flows(elements)}
+        if history and not session.spar.steady:
+            labels = list(result['T'])
+            result['time'] = session.T[:, 0].tolist()
+            result['T_history'] = {label: session.T[:, session.node_index(label) + 1].tolist() for label in labels}
+        return result
+
+
+class SolverService:
+    """Models loaded in the service and dispatch of the requests."""
+
+    def __init__(self):
+        self.models = {}
+        self.stopped = asyncio.Event()
+
+    def worker(self, request):
+        name = request.get('model')
+        if name not in self.models:
+            raise KeyError('unknown model: {}'.format(name))
+        return self.models[name]
+
+    async def handle(self, request):
+        """Executes a request, returns the response (dictionary)."""
+
+        start = time.perf_counter()
+        response = {'id': request.get('id')} if isinstance(request, dict) else {'id': None}
+        try:
+            if not isinstance(request, dict):
+                raise ValueError('the request must be a JSON object')
+            op = request.get('op')
+            if op == 'load':
+                name = request['model']
+                worker = ModelWorker(name, request.get('file', name))
+                old = self.models.get(name)
+                self.models[name] = worker  # the next requests to the model wait for the load in its worker
+                if old is not None:
+                    old.executor.shutdown(wait=False)
+                try:
+                    result = await worker.run(worker.load)
+                except Exception:
+                    if self.models.get(name) is worker:
+                        del self.models[name]
+                    raise
+            elif op == 'unload':
+                self.worker(request).executor.shutdown(wait=False)
+                del self.models[request['model']]
+                result = {}
+            elif op == 'set':
+                worker = self.worker(request)
+                result = await worker.run(worker.set_parameter, request['kind'], request['label'],
+                                          request['name'], float(request['value']))
+            elif op == 'solve':
+                worker = self.worker(request)
+                result = await worker.run(worker.solve)
+            elif op == 'results':
+                worker = self.worker(request)
+                result = await worker.run(worker.results, request.get('nodes'), request.get('elements'),
+                                          bool(request.get('history', False)))
+            elif op == 'list':
+                result = {name: worker.base_file_name for name, worker in self.models.items()}
+            elif op == 'ping':
+                result = {}
+            elif op == 'shutdown':
+                self.stopped.set()
+                result = {}
+            else:
+                raise ValueError('unknown operation: {}'.format(op))
+            response['ok'] = True
+            response['result'] = result
+        except Exception as e:
+            response['ok'] = False
+            response['error'] = str(e) if not isinstance(e, KeyError) else str(e.args[0])
+        response['latency_ms'] = (time.perf_counter() - start) * 1000.0
+        return response
+
+    async def serve_stream(self, reader, write):
+        """Answers the requests of a client, the requests are executed concurrently."""
+
+        tasks = set()
+
+        async def answer(line):
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError as e:
+                response = {'id': None, 'ok': False, 'error': 'invalid JSON: {}'.format(e), 'latency_ms': 0.0}
+            else:
+                response = await self.handle(request)
+            await write(json.dumps(response) + '\n')
+
+        stopped = asyncio.ensure_future(self.stopped.wait())
+        while True:
+            read = asyncio.ensure_future(reader.readline())
+            await asyncio.wait({read, stopped}, return_when=asyncio.FIRST_COMPLETED)
+            if not read.done():  # shutdown requested
+                read.cancel()
+                break
+            line = read.result()
+            if not line:
+                break
+            if line.strip():
+                task = asyncio.create_task(answer(line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+        stopped.cancel()
+
+    async def serve_unix(self, path):
+        async def client(reader, writer):
+            async def write(text):
+                writer.write(text.encode())
+                await writer.drain()
+
+            try:
+                await self.serve_stream(reader, write)
+            finally:
+                writer.close()
+
+        if os.path.exists(path):
+            os.remove(path)
+        server = await asyncio.start_unix_server(client, path=path)
+        async with server:
+            await self.stopped.wait()
+        os.remove(path)
+
+    async def serve_stdio(self):
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+
+        async def write(text):
+            sys.stdout.write(text)
+            sys.stdout.flush()
+
+        await self.serve_stream(reader, write)
+
+
+async def run_service(socket_path=None, preload=()):
+    """Runs the service on a Unix socket (stdin/stdout if socket_path is None) until a shutdown request."""
+
+    service = SolverService()
+    for base_file_name in preload:
+        response = await service.handle({'op': 'load', 'model': os.path.basename(base_file_name),
+                                         'file': base_file_name})
+        if not response['ok']:
+            print(response['error'], file=sys.stderr)
+    if socket_path is None:
+        await service.serve_stdio()
+    else:
+        await service.serve_unix(socket_path)
+    for worker in service.models.values():
+        worker.executor.shutdown(wait=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='TNSolver local solver service (JSON lines requests).')
+    parser.add_argument('--socket', default=None, help='Unix socket path (default: stdin/stdout)')
+    parser.add_argument('--preload', nargs='*', default=[], help='base names of the models to load at start-up')
+    args = parser.parse_args(argv)
+
+    asyncio.run(run_service(args.socket, args.preload))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,176 @@
+import copy
+import numpy as np
+from .utility_functions import user_feedback
+from .read_functions import read_input_file
+from .core_solver import init, tnsdriver
+from .network_assembly import shell_geometry
+from .what_if_analysis import what_if, MAX_UPDATE_RANK
+
+
+class SolverSession:
+    """
+    Thermal model kept in memory: the input file is read and the model initialized only once, then the model can
+    be solved as many times as needed (e.g. after changing some parameters), without writing any output file.
+
+    The initialized model is stored in the 'initial' attributes; each solve works on a copy of it, and the solved
+    model is stored in the attributes T, Q, spar, nd, el, bc, src, func (temperatures in the I/O units, as returned
+    by tnsdriver). The factorization of the last linear system is available as spar.factor.
+    """
+
+    def __init__(self, base_file_name, prog_report=0, *text_widget):
+        """
+        Args:
+            base_file_name: Base name of the input file (e.g., 'my_model').
+            prog_report: code for the progress report (0 = silent, 1 = screen, 2 = GUI), no log file is written.
+            *text_widget: optional argument used by the GUI to provide a widget for the progress reports
+        """
+
+        self.base_file_name = base_file_name
+        self.prog_report = prog_report
+        self.text_widget = text_widget
+        self.logfID = None
+        self.ready = False
+        self.n_solves = 0
+
+        self.T = None
+        self.Q = None
+        self.spar = None
+        self.nd = None
+        self.el = None
+        self.bc = None
+        self.src = None
+        self.ic = None
+        self.func = None
+        self.enc = None
+        self.mat = None
+
+        with open(base_file_name + '.inp', 'r') as fid:
+            inp_err, spar, nd, el, bc, src, ic, func, enc, mat = read_input_file(fid, self.logfID, prog_report,
+                                                                                 *text_widget)
+        if inp_err:
+            message = '\nTNSolver: Errors reading the input file.\nPlease correct them and try again.\n\n'
+            user_feedback(message, prog_report, self.logfID, *text_widget)
+            return
+
+        T, Q, spar, nd, el, bc, src, ic, func, enc, mat = init(spar, nd, el, bc, src, ic, func, enc, mat,
+                                                               self.logfID, prog_report, *text_widget)
+        self.initial = [T, Q, spar, nd, el, bc, src, ic, func, enc, mat]
+        self.ready = True
+
+    def model(self):
+        """Returns a copy of the initialized model: T, Q, spar, nd, el, bc, src, ic, func, enc, mat."""
+
+        return copy.deepcopy(self.initial)
+
+    def solve(self, step_monitor=None):
+        """
+        Solves a copy of the initialized model.
+
+        Args:
+            step_monitor: optional callable(time, dt, spar, nd, el, bc, src) called by the solver at the end of every
+                          (time) step, with the converged temperatures (absolute) and factorization.
+
+        Returns:
+            T, Q as returned by tnsdriver (temperatures in the I/O units).
+        """
+
+        T, Q, spar, nd, el, bc, src, ic, func, enc, mat = self.model()
+        spar.step_monitor = step_monitor
+        T, Q, spar, nd, el, src, func = tnsdriver(None, T, Q, spar, nd, el, bc, src, func, mat, self.logfID,
+                                                  self.prog_report, *self.text_widget)
+        self.T, self.Q, self.spar, self.nd, self.el, self.bc = T, Q, spar, nd, el, bc
+        self.src, self.ic, self.func, self.enc, self.mat = src, ic, func, enc, mat
+        self.n_solves += 1
+        return T, Q
+
+    def node_index(self, label):
+        """Returns the internal number of the node with the given label (-1 if not found)."""
+
+        for n in range(len(self.initial[3])):
+            if self.initial[3][n].label == label:
+                return n
+        return -1
+
+    def element_index(self, label):
+        """Returns the internal number of the element with the given label (-1 if not found)."""
+
+        for e in range(len(self.initial[4])):
+            if self.initial[4][e].label == label:
+                return e
+        return -1
+
+    def node_temperatures(self, labels=None):
+        """Returns a dictionary label: temperature of the solved model (all the nodes if labels is None)."""
+
+        T = np.array([n.T for n in self.nd])
+        if labels is None:
+            labels = [n.label for n in self.nd]
+        return {label: float(T[self.node_index(label)]) for label in labels if self.node_index(label) != -1}
+
+    def element_heat_flows(self, labels=None):
+        """Returns a dictionary label: heat flow of the solved model (all the elements if labels is None)."""
+
+        if labels is None:
+            labels = [e.label for e in self.el]
+        return {label: float(self.el[self.element_index(label)].Q) for label in labels
+                if self.element_index(label) != -1}
+
+    def what_if(self, scale=None, add=None, remove=None, max_rank=MAX_UPDATE_RANK):
+        """
+        Evaluates the temperatures after changing some conductors of the solved steady model, with a low-rank update
+        of the factorization of the last solve (see what_if_analysis). The solved model is not changed.
+
+        Args:
+            scale: dictionary conductor label: conductance multiplier.
+            add: list of (node label, node label, conductance) of new conductors.
+            remove: list of labels of conductors to remove.
+            max_rank: maximum rank of the update, beyond it the updated matrix is factorized.
+
+        Returns:
+            Dictionary node label: temperature (I/O units).
+        """
+
+        if self.nd is None:
+            raise ValueError('the model has not been solved')
+        return what_if(self.spar, self.nd, self.el, self.bc, scale, add, remove, max_rank)
+
+    def set_parameter(self, kind, label, name, value):
+        """
+        Changes a parameter of the initialized model, the next solve uses the new value.
+
+        Args:
+            kind: 'conductor', 'source' or 'bc'.
+            label: conductor label, or source/BC number in the input file order (starting from 1, e.g. '2' or
+                   '2 (qdot)' as reported by the sensitivity analysis).
+            name: name of the parameter (e.g. k, A, L, ri, ro, cylL, htc, sF, vel for conductors, qdot, Q for sources, Tinf, q, A
+                  for BCs); setting k of a conductor made of a material replaces the material conductivity.
+            value: new value of the parameter.
+
+        Returns:
+            True if the parameter has been set, False if it is not found.
+        """
+
+        T, spar, nd, el, bc, src = (self.initial[0], self.initial[2], self.initial[3], self.initial[4],
+                                    self.initial[5], self.initial[6])
+        if kind == 'conductor':
+            e = self.element_index(label)
+            if e == -1 or not hasattr(el[e], name):
+                return False
+            setattr(el[e], name, value)
+            if name == 'k':
+                el[e].matID = ''  # the conductivity is no longer evaluated from the material
+            elif name in ('ri', 'ro', 'cylL'):
+                shell_geometry(el[e])  # A and L of the shell conductors follow the radii
+            return True
+
+        index = int(str(label).split()[0]) - 1
+        items = src if kind == 'source' else bc if kind == 'bc' else []
+        if index < 0 or index >= len(items) or not hasattr(items[index], name):
+            return False
+        setattr(items[index], name, value)
+        if kind == 'bc' and name == 'Tinf' and items[index].type == 'fixed_T':
+            for j in range(len(items[index].nd)):  # the fixed temperatures are set by init
+                n = int(items[index].nd[j])
+                nd[n].T = value + spar.Toff
+                T[nd[n].eqn] = nd[n].T
+        return True
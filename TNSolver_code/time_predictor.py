@@ -0,0 +1,85 @@
+"""
+Extrapolating predictor of the node temperatures at the beginning of a time step.
+
+The nonlinear iterations of a time step start from the temperatures of the previous step. With 'predictor = linear'
+or 'predictor = quadratic' they start from the polynomial extrapolation, at the new time, of the last two or three
+accepted steps: on a smoothly varying transient the initial residual is much smaller and the Newton iterations
+converge in fewer iterations.
+
+The extrapolation is safeguarded against overshoot (e.g. a thermostat switching or a BC function with a corner):
+the quadratic correction is dropped at the nodes where it is larger than the linear change, and the predicted change
+of a node is limited as the Newton updates (max change times the temperature). The fixed temperature nodes keep
+their BC value.
+"""
+
+import numpy as np
+from .utility_functions import user_feedback
+
+PREDICTOR_ORDER = {'none': 0, 'linear': 1, 'quadratic': 2}  # extrapolation order of each predictor
+
+
+class PredictorHistory:
+    def __init__(self, order):
+        self.order = order  # int - extrapolation order
+        self.times = []  # times of the last accepted steps (oldest first)
+        self.T = []  # node temperatures (K, NumPy arrays) of the last accepted steps
+        self.predicted = []  # nonlinear iterations of the predicted time steps
+
+    def accept(self, time, T):
+        """Stores the temperatures of an accepted time step."""
+
+        self.times.append(time)
+        self.T.append(np.array(T, dtype=float))
+        if len(self.times) > self.order + 1:
+            del self.times[0]
+            del self.T[0]
+
+    def record(self, iterations):
+        """Records the nonlinear iterations of a predicted time step."""
+
+        self.predicted.append(iterations)
+
+
+def predict_temperatures(history, time, T, fixed, max_change):
+    """
+    Extrapolates the node temperatures to the given time from the last accepted steps.
+
+    Args:
+        history: PredictorHistory class.
+        time: time of the new step.
+        T: current node temperatures (K, NumPy array by node number), with the BCs of the new step.
+        fixed: node numbers with a fixed temperature (not predicted).
+        max_change: maximum relative change of a node temperature (as spar.max_change).
+
+    Returns:
+        The predicted temperatures (K, NumPy array by node number), None if the history is too short.
+    """
+
+    if len(history.times) < 2:
+        return None
+    t = history.times
+    T0 = history.T[-1]
+    linear = T0 + (T0 - history.T[-2]) * (time - t[-1]) / (t[-1] - t[-2])
+    T_pred = linear
+    if history.order == 2 and len(t) == 3:  # Lagrange interpolation through the last three steps
+        weights = [(time - t[1]) * (time - t[2]) / ((t[0] - t[1]) * (t[0] - t[2])),
+                   (time - t[0]) * (time - t[2]) / ((t[1] - t[0]) * (t[1] - t[2])),
+                   (time - t[0]) * (time - t[1]) / ((t[2] - t[0]) * (t[2] - t[1]))]
+        quadratic = sum(w * Ti for w, Ti in zip(weights, history.T))
+        T_pred = np.where(np.abs(quadratic - linear) <= np.abs(linear - T0), quadratic, linear)
+
+    limit = max_change * np.abs(T0)
+    T_pred = T0 + np.clip(T_pred - T0, -limit, limit)
+    T_pred[fixed] = T[fixed]
+    return T_pred
+
+
+def write_predictor_statistics(spar, history, logfID, prog_report, *text_widget):
+    """Writes the number of nonlinear iterations of the predicted time steps (see spar.predictor_iterations)."""
+
+    spar.predictor_iterations = float(np.mean(history.predicted)) if history.predicted else float('nan')
+    if not history.predicted:
+        return
+    message = '\nPredictor ({}): {} predicted time steps, {:.2f} nonlinear iterations per step\n'.format(
+        spar.predictor, len(history.predicted), spar.predictor_iterations)
+    user_feedback(message, prog_report, logfID, *text_widget)
@@ -0,0 +1,509 @@
+"""
+Uncertainty propagation through a thermal model by Monte Carlo sampling.
+
+The uncertain parameters (conductor properties, contact conductances, heat transfer coefficients, source powers,
+BC values) are listed in a csv file, one per line:
+
+    kind, label, name, distribution, p1, p2[, p3]
+
+    kind:         conductor, source or bc
+    label:        conductor label, or source/BC number in the input file order (starting from 1)
+    name:         parameter name (k, A, L, htc, sF, vel for conductors, qdot, Q for sources, Tinf, q, A for BCs)
+    distribution: normal (p1 = mean, p2 = standard deviation), lognormal (p1 = median, p2 = standard deviation of
+                  the log), uniform (p1 = min, p2 = max), triangular (p1 = min, p2 = mode, p3 = max)
+
+Lines starting with # are comments. Samples are drawn with a Latin hypercube or a scrambled Sobol sequence.
+Steady models made of linear conductors share the network topology and the matrix structure among the samples,
+so they are solved in batches vectorized across the samples; the other models are solved sample by sample with
+the full nonlinear solver, spread over several processes.
+Mean, standard deviation, extremes and percentiles of every node temperature are accumulated while the samples
+are solved (the percentiles with the P-square estimator), the sampled temperature fields are not stored.
+
+Usage:
+    python -m TNSolver_code.uncertainty_quantification model parameters.csv [--samples N] [--method lhs|sobol]
+"""
+
+import os
+import csv
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import scipy.sparse as sparse
+import scipy.sparse.linalg as spla
+from scipy import stats
+from scipy.stats import qmc
+from .utility_functions import user_feedback, setunits
+from .solver_session import SolverSession
+from .network_assembly import (is_linear_element, conductance_exponents, element_blocks, assemble_matrix,
+                               dirichlet_equations)
+
+DISTRIBUTIONS = {'normal': 2, 'lognormal': 2, 'uniform': 2, 'triangular': 3}  # number of parameters
+MAX_BATCH_MEMORY = 2.0e8  # bytes used by the stacked matrices of a vectorized batch
+MAX_DENSE_SIZE = 1000  # larger networks are solved sample by sample with sparse matrices
+
+
+class UncertainParameter:
+    def __init__(self):
+        self.kind = ""  # string - 'conductor', 'source' or 'bc'
+        self.label = ""  # string - conductor label or source/BC number
+        self.name = ""  # string - parameter name
+        self.distribution = ""  # string - 'normal', 'lognormal', 'uniform' or 'triangular'
+        self.p = []  # list - parameters of the distribution
+
+
+def read_uncertain_parameters(file_name, prog_report=1, *text_widget):
+    """
+    Reads the csv file of the uncertain parameters.
+
+    Args:
+        file_name: name of the csv file.
+        prog_report: code for the progress report (0 = silent, 1 = screen, 2 = GUI).
+        *text_widget: optional argument used by the GUI to provide a widget for the progress reports
+
+    Returns:
+        A tuple containing an error flag (1 = errors) and the list of UncertainParameter classes.
+    """
+
+    err = 0
+    parameters = []
+    with open(file_name, 'r', newline='') as fid:
+        for line_number, row in enumerate(csv.reader(fid, skipinitialspace=True)):
+            row = [cell.strip() for cell in row if cell.strip() != '']
+            if not row or row[0].startswith('#') or row[0].lower() == 'kind':
+                continue
+            distribution = row[3].lower() if len(row) > 3 else ''
+            try:
+                p = [float(cell) for cell in row[4:]]
+            except ValueError:
+                p = []
+            if (row[0] not in ('conductor', 'source', 'bc') or distribution not in DISTRIBUTIONS or
+                    len(p) != DISTRIBUTIONS[distribution]):
+                message = '\nERROR: Invalid uncertain parameter at line {} of {}:\n{}\n'.format(
+                    line_number + 1, file_name, ', '.join(row))
+                user_feedback(message, prog_report, None, *text_widget)
+                err = 1
+                continue
+            par = UncertainParameter()
+            par.kind, par.label, par.name = row[0], row[1], row[2]
+            par.distribution = distribution
+            par.p = p
+            parameters.append(par)
+    return err, parameters
+
+
+def inverse_cdf(par, u):
+    """Maps uniform samples u in (0, 1) to the distribution of an uncertain parameter."""
+
+    p = par.p
+    if par.distribution == 'normal':
+        return stats.norm.ppf(u, loc=p[0], scale=p[1])
+    elif par.distribution == 'lognormal':
+        return stats.lognorm.ppf(u, s=p[1], scale=p[0])
+    elif par.distribution == 'uniform':
+        return p[0] + (p[1] - p[0]) * u
+    else:
+        return stats.triang.ppf(u, c=(p[1] - p[0]) / (p[2] - p[0]), loc=p[0], scale=p[2] - p[0])
+
+
+def draw_samples(parameters, n_samples, method='lhs', seed=None):
+    """
+    Draws the samples of the uncertain parameters.
+
+    Args:
+        parameters: list of UncertainParameter classes.
+        n_samples: number of samples.
+        method: 'lhs' (Latin hypercube) or 'sobol' (scrambled Sobol sequence, best with a power of 2 samples).
+        seed: seed of the random generator.
+
+    Returns:
+        The parameter values (n_samples, number of parameters).
+    """
+
+    if method == 'sobol':
+        engine = qmc.Sobol(d=len(parameters), scramble=True, seed=seed)
+    else:
+        engine = qmc.LatinHypercube(d=len(parameters), seed=seed)
+    u = engine.random(n_samples)
+    values = np.zeros_like(u)
+    for j in range(len(parameters)):
+        values[:, j] = inverse_cdf(parameters[j], u[:, j])
+    return values
+
+
+class P2Quantile:
+    """
+    P-square estimator of a quantile (R. Jain and I. Chlamtac, Communications of the ACM, 28(10), 1985),
+    vectorized over the nodes: five markers per node track the quantile without storing the observations.
+    """
+
+    def __init__(self, p, size):
+        self.p = p  # quantile (0 < p < 1)
+        self.count = 0
+        self.q = np.zeros((5, size))  # marker heights, the first 5 observations until count = 5
+        self.n = np.tile(np.arange(1.0, 6.0)[:, None], (1, size))  # marker positions
+        self.desired = np.array([1.0, 1.0 + 2.0 * p, 1.0 + 4.0 * p, 3.0 + 2.0 * p, 5.0])  # desired positions
+        self.dn = np.array([0.0, p / 2.0, p, (1.0 + p) / 2.0, 1.0])  # increments of the desired positions
+
+    def update(self, x):
+        if self.count < 5:
+            self.q[self.count] = x
+            self.count += 1
+            if self.count == 5:
+                self.q.sort(axis=0)
+            return
+
+        self.count += 1
+        q, n = self.q, self.n
+        q[0] = np.minimum(q[0], x)
+        q[4] = np.maximum(q[4], x)
+        n[1:4] += x < q[1:4]
+        n[4] += 1.0
+        self.desired += self.dn
+
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            move = ((d >= 1.0) & (n[i + 1] - n[i] > 1.0)) | ((d <= -1.0) & (n[i - 1] - n[i] < -1.0))
+            if not move.any():
+                continue
+            s = np.sign(d) * move
+            # Parabolic prediction, the linear one when it would break the ordering of the markers
+            qp = q[i] + s / (n[i + 1] - n[i - 1]) * ((n[i] - n[i - 1] + s) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+                                                     (n[i + 1] - n[i] - s) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+            qs = np.where(s > 0, q[i + 1], q[i - 1])
+            ns = np.where(s > 0, n[i + 1], n[i - 1])
+            ql = q[i] + s * (qs - q[i]) / (ns - n[i])
+            q[i] = np.where(move, np.where((q[i - 1] < qp) & (qp < q[i + 1]), qp, ql), q[i])
+            n[i] += s
+
+    def value(self):
+        if self.count == 0:
+            return np.full(self.q.shape[1], np.nan)
+        if self.count < 5:
+            return np.percentile(self.q[:self.count], 100.0 * self.p, axis=0)
+        return self.q[2].copy()
+
+
+class StreamingStatistics:
+    """Mean, standard deviation, extremes and percentiles of the node temperatures, updated batch by batch."""
+
+    def __init__(self, size, percentiles=(5.0, 50.0, 95.0)):
+        self.count = 0
+        self.mean = np.zeros(size)
+        self.M2 = np.zeros(size)  # sum of the squared deviations from the mean
+        self.min = np.full(size, np.inf)
+        self.max = np.full(size, -np.inf)
+        self.percentiles = list(percentiles)
+        self.quantiles = [P2Quantile(pc / 100.0, size) for pc in self.percentiles]
+
+    def update(self, X):
+        """Adds a batch of temperature fields X (samples, nodes)."""
+
+        if X.shape[0] == 0:
+            return
+        m = X.shape[0]
+        mean = X.mean(axis=0)
+        M2 = ((X - mean) ** 2).sum(axis=0)
+        delta = mean - self.mean
+        total = self.count + m
+        self.mean += delta * m / total
+        self.M2 += M2 + delta ** 2 * self.count * m / total
+        self.count = total
+        self.min = np.minimum(self.min, X.min(axis=0))
+        self.max = np.maximum(self.max, X.max(axis=0))
+        for x in X:
+            for quantile in self.quantiles:
+                quantile.update(x)
+
+    def std(self):
+        return np.sqrt(self.M2 / (self.count - 1)) if self.count > 1 else np.zeros_like(self.mean)
+
+
+class LinearBatchModel:
+    """
+    Steady network of linear conductors, solved for many samples of the parameters at once.
+
+    The element matrices are evaluated once at the nominal parameters; the uncertain conductor parameters scale
+    them as (p / p_nominal)^n (G ~ p^n), the sources and the BCs enter the right-hand side.
+    """
+
+    def __init__(self, session, parameters):
+        T, Q, spar, nd, el, bc, src, ic, func, enc, mat = session.model()
+        for e in range(len(el)):
+            Tel = np.array([nd[el[e].elnd[0]].T, nd[el[e].elnd[1]].T])
+            el[e] = el[e].elpre(el[e], mat, Tel, None, 0)  # nominal conductances
+        self.spar, self.nd, self.el, self.bc, self.src = spar, nd, el, bc, src
+        self.nnd = len(nd)
+        self.eqs, self.blocks = element_blocks(nd, el)
+        self.dirichlet, _ = dirichlet_equations(spar, nd, bc)
+        self.node_eqn = np.array([nd[n].eqn for n in range(self.nnd)], dtype=int)
+        self.parameters = parameters
+        self.element = [session.element_index(par.label) if par.kind == 'conductor' else -1 for par in parameters]
+        self.index = [int(par.label.split()[0]) - 1 if par.kind != 'conductor' else -1 for par in parameters]
+
+        # Scatter of the element matrix entries into the (flattened) global matrix
+        rows = np.repeat(self.eqs, 2, axis=1).reshape(-1)
+        cols = np.tile(self.eqs, (1, 2)).reshape(-1)
+        nent = rows.size
+        self.scatter = sparse.csr_matrix((np.ones(nent), (rows * self.nnd + cols, np.arange(nent))),
+                                         shape=(self.nnd * self.nnd, nent))
+
+    def nominal(self, j):
+        par = self.parameters[j]
+        if par.kind == 'conductor':
+            return getattr(self.el[self.element[j]], par.name)
+        return getattr(self.src[self.index[j]] if par.kind == 'source' else self.bc[self.index[j]], par.name)
+
+    def sample_value(self, values, kind, index, name):
+        """Values of a source/BC parameter over the samples (nominal value if it is not uncertain)."""
+
+        for j in range(len(self.parameters)):
+            par = self.parameters[j]
+            if par.kind == kind and self.index[j] == index and par.name == name:
+                return values[:, j]
+        item = self.src[index] if kind == 'source' else self.bc[index]
+        return np.full(values.shape[0], float(getattr(item, name)))
+
+    def scale(self, values):
+        scale = np.ones((values.shape[0], len(self.el)))
+        for j in range(len(self.parameters)):
+            e = self.element[j]
+            if e != -1:
+                n = conductance_exponents(self.el[e])[self.parameters[j].name]
+                scale[:, e] *= (values[:, j] / self.nominal(j)) ** n
+        return scale
+
+    def load(self, values):
+        m = values.shape[0]
+        nd, bc, src, spar = self.nd, self.bc, self.src, self.spar
+        f = np.zeros((m, self.nnd))
+        for i in range(len(src)):
+            if src[i].ntype == 1:
+                qdot = self.sample_value(values, 'source', i, 'qdot')
+                for j in range(len(src[i].nd)):
+                    f[:, nd[src[i].nd[j]].eqn] += qdot * nd[src[i].nd[j]].vol
+            elif src[i].ntype == 2:
+                Qsrc = self.sample_value(values, 'source', i, 'Q')
+                for j in range(len(src[i].nd)):
+                    f[:, nd[src[i].nd[j]].eqn] += Qsrc
+        for i in range(spar.nNBC):
+            bcn = spar.Neumann[i]
+            if bc[bcn].type == 'heat_flux':
+                qA = self.sample_value(values, 'bc', bcn, 'q') * self.sample_value(values, 'bc', bcn, 'A')
+                for j in range(len(bc[bcn].nd)):
+                    f[:, nd[int(bc[bcn].nd[j])].eqn] += qA
+        for i in range(spar.nDBC):
+            bcn = spar.Dirichlet[i]
+            Tinf = self.sample_value(values, 'bc', bcn, 'Tinf') + spar.Toff
+            for j in range(len(bc[bcn].nd)):
+                f[:, nd[int(bc[bcn].nd[j])].eqn] = Tinf
+        return f
+
+    def solve(self, values):
+        """
+        Solves the network for a batch of samples.
+
+        Args:
+            values: parameter values (samples, number of parameters).
+
+        Returns:
+            The node temperatures in the I/O units (samples, nodes), in the node order.
+        """
+
+        m = values.shape[0]
+        scale = self.scale(values)
+        f = self.load(values)
+        if self.nnd <= MAX_DENSE_SIZE:
+            contrib = (self.blocks.reshape(1, -1, 4) * scale[:, :, None]).reshape(m, -1)
+            K = np.asarray((self.scatter @ contrib.T).T).reshape(m, self.nnd, self.nnd)
+            K[:, self.dirichlet, :] = 0.0
+            K[:, self.dirichlet, self.dirichlet] = 1.0
+            T = np.linalg.solve(K, f[:, :, None])[:, :, 0]
+        else:
+            T = np.zeros((m, self.nnd))
+            keep = np.ones(self.nnd)
+            keep[self.dirichlet] = 0.0
+            for s in range(m):
+                K = assemble_matrix(self.nnd, self.eqs, self.blocks, scale[s])
+                K = sparse.diags(keep) @ K + sparse.diags(1.0 - keep)
+                T[s] = spla.spsolve(K.tocsc(), f[s])
+        return T[:, self.node_eqn] - self.spar.Toff
+
+
+def linear_batch_applicable(session, parameters):
+    """Checks if the model and the uncertain parameters can be solved with a LinearBatchModel."""
+
+    T, Q, spar, nd, el, bc, src, ic, func, enc, mat = session.initial
+    if not spar.steady or any(not is_linear_element(el[e], mat) for e in range(len(el))):
+        return False
+    if any(src[i].ntype not in (1, 2) for i in range(len(src))):
+        return False
+    for par in parameters:
+        if par.kind == 'conductor':
+            e = session.element_index(par.label)
+            if e == -1 or par.name not in conductance_exponents(el[e]):
+                return False
+            if getattr(el[e], par.name) == 0.0 and not (par.name == 'k' and el[e].matID != ''):
+                return False
+    return True
+
+
+# Model solved by the worker processes (each worker reads and initializes the model once)
+_worker_session = None
+_worker_parameters = None
+
+
+def _init_worker(base_file_name, parameters):
+    global _worker_session, _worker_parameters
+    _worker_session = SolverSession(base_file_name, 0)
+    _worker_parameters = parameters
+
+
+def _solve_samples(values):
+    """Solves a chunk of samples with the full solver, failed samples are returned as NaN."""
+
+    session = _worker_session
+    nnd = len(session.initial[3])
+    T = np.full((values.shape[0], nnd), np.nan)
+    for s in range(values.shape[0]):
+        for j in range(len(_worker_parameters)):
+            par = _worker_parameters[j]
+            session.set_parameter(par.kind, par.label, par.name, float(values[s, j]))
+        try:
+            Ts, _ = session.solve()
+        except Exception:
+            continue
+        T[s] = Ts if Ts.ndim == 1 else Ts[-1, 1:]  # final temperatures of a transient
+    return T
+
+
+def propagate(session, parameters, values, statistics, workers=None, batch_size=None):
+    """
+    Solves the model for all the samples and accumulates the node temperature statistics.
+
+    Args:
+        session: SolverSession of the model.
+        parameters: list of UncertainParameter classes.
+        values: parameter values (samples, number of parameters).
+        statistics: StreamingStatistics class, updated in place.
+        workers: number of processes for the nonlinear models (1 = in this process).
+        batch_size: samples solved together (default: as many as fit in MAX_BATCH_MEMORY).
+
+    Returns:
+        A tuple containing the solution method ('vectorized' or 'sample by sample') and the number of failed samples.
+    """
+
+    n_samples = values.shape[0]
+    nnd = len(session.initial[3])
+    failed = 0
+    if linear_batch_applicable(session, parameters):
+        model = LinearBatchModel(session, parameters)
+        batch_size = batch_size or max(1, min(n_samples, int(MAX_BATCH_MEMORY / (8.0 * nnd * nnd))))
+        for start in range(0, n_samples, batch_size):
+            statistics.update(model.solve(values[start:start + batch_size]))
+        return 'vectorized', failed
+
+    workers = workers or os.cpu_count() or 1
+    batch_size = batch_size or max(1, min(64, n_samples // (4 * workers)))
+    chunks = [values[start:start + batch_size] for start in range(0, n_samples, batch_size)]
+
+    def collect(T):
+        ok = ~np.isnan(T).any(axis=1)
+        statistics.update(T[ok])
+        return int(np.count_nonzero(~ok))
+
+    if workers == 1:
+        _init_worker(session.base_file_name, parameters)
+        for chunk in chunks:
+            failed += collect(_solve_samples(chunk))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(session.base_file_name, parameters)) as executor:
+            for T in executor.map(_solve_samples, chunks):
+                failed += collect(T)
+    return 'sample by sample', failed
+
+
+def write_statistics(fid, nd, statistics):
+    """Writes the node temperature statistics as csv."""
+
+    fid.write('"Label", "Mean", "Std", "Min", "Max"')
+    for pc in statistics.percentiles:
+        fid.write(', "P{:g}"'.format(pc))
+    fid.write('\n')
+    std = statistics.std()
+    values = [quantile.value() for quantile in statistics.quantiles]
+    for n in range(len(nd)):
+        fid.write(f'"{nd[n].label}", {statistics.mean[n]:g}, {std[n]:g}, {statistics.min[n]:g}, '
+                  f'{statistics.max[n]:g}')
+        for v in values:
+            fid.write(f', {v[n]:g}')
+        fid.write('\n')
+
+
+def tn_uncertainty(base_file_name, parameter_file, n_samples=1000, method='lhs', seed=None,
+                   percentiles=(5.0, 50.0, 95.0), workers=None, prog_report=1, *text_widget):
+    """
+    Propagates the uncertainty of the model parameters to the node temperatures and writes the statistics to
+    base_file_name + '_uq_py.csv'.
+
+    Args:
+        base_file_name: Base name of the input file (e.g., 'my_model').
+        parameter_file: csv file of the uncertain parameters (see the module description).
+        n_samples: number of samples.
+        method: sampling method, 'lhs' or 'sobol'.
+        seed: seed of the random generator.
+        percentiles: percentiles of the node temperatures to estimate.
+        workers: number of processes used for the nonlinear models (default: number of CPUs).
+        prog_report: code for the progress report (0 = silent, 1 = screen, 2 = GUI).
+        *text_widget: optional argument used by the GUI to provide a widget for the progress reports
+
+    Returns:
+        StreamingStatistics class with the statistics of the node temperatures, None on errors.
+    """
+
+    err, parameters = read_uncertain_parameters(parameter_file, prog_report, *text_widget)
+    session = SolverSession(base_file_name, 0)
+    if err or not session.ready:
+        message = '\nTNSolver: Errors reading the model or the uncertain parameters.\n'
+        user_feedback(message, prog_report, None, *text_widget)
+        return None
+    for par in parameters:  # the median is taken as the nominal value
+        if not session.set_parameter(par.kind, par.label, par.name, float(inverse_cdf(par, 0.5))):
+            message = '\nERROR: Unknown uncertain parameter: {} {} {}\n'.format(par.kind, par.label, par.name)
+            user_feedback(message, prog_report, None, *text_widget)
+            return None
+
+    values = draw_samples(parameters, n_samples, method, seed)
+    statistics = StreamingStatistics(len(session.initial[3]), percentiles)
+    solution, failed = propagate(session, parameters, values, statistics, workers)
+
+    u, _ = setunits(session.initial[2].units)
+    file_name = base_file_name + '_uq_py.csv'
+    with open(file_name, 'w') as fid:
+        write_statistics(fid, session.initial[3], statistics)
+    message = ('\nUncertainty propagation: {} {} samples of {} parameters solved {}, {} failed.\n'
+               'Node temperature ({}) statistics written to: {}\n'.format(n_samples, method, len(parameters),
+                                                                         solution, failed, u['T'], file_name))
+    user_feedback(message, prog_report, None, *text_widget)
+    return statistics
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='TNSolver uncertainty propagation.')
+    parser.add_argument('model', help='base name of the input file')
+    parser.add_argument('parameters', help='csv file of the uncertain parameters')
+    parser.add_argument('--samples', type=int, default=1000, help='number of samples')
+    parser.add_argument('--method', choices=('lhs', 'sobol'), default='lhs', help='sampling method')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the random generator')
+    parser.add_argument('--percentiles', type=float, nargs='*', default=[5.0, 50.0, 95.0],
+                        help='percentiles of the node temperatures')
+    parser.add_argument('--workers', type=int, default=None, help='number of parallel processes')
+    args = parser.parse_args(argv)
+
+    statistics = tn_uncertainty(args.model, args.parameters, args.samples, args.method, args.seed, args.percentiles,
+                                args.workers)
+    return 0 if statistics is not None else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,93 @@
+"""
+Update plan of the model quantities in tnsdriver.
+
+Each quantity is classified as constant, time dependent or temperature dependent, and tnsdriver updates it at the
+matching frequency:
+
+    constant     once per run (at the beginning of tnsdriver)
+    time         once per time step
+    temperature  once per nonlinear iteration
+
+The node heat capacities are temperature dependent for the materials with temperature dependent density or
+specific heat, time dependent with a heat capacity function; the node volumes are time dependent with a volume
+function. The conductors are temperature dependent unless linear (see network_assembly.is_linear_element). The
+sources and BCs are time dependent with a function of time, the thermostats are updated with them (they switch once
+per time step, with the temperature of the sensing node at the beginning of the step); the sources function of the
+node temperature (QsrcT) are temperature dependent.
+"""
+
+from .utility_functions import user_feedback
+from .network_assembly import is_linear_element, constant_property
+
+CONSTANT = 'constant'
+TIME = 'time'
+TEMPERATURE = 'temperature'
+
+
+class UpdatePlan:
+    def __init__(self):
+        self.capacity = {CONSTANT: [], TIME: [], TEMPERATURE: []}  # node numbers - heat capacity (rho*cv)
+        self.volume = {CONSTANT: [], TIME: [], TEMPERATURE: []}  # node numbers - volume
+        self.elements = {CONSTANT: [], TIME: [], TEMPERATURE: []}  # element numbers - coefficients (elpre)
+        self.sources = {CONSTANT: [], TIME: [], TEMPERATURE: []}  # source numbers - source terms (Sc)
+        self.bcs = {CONSTANT: [], TIME: [], TEMPERATURE: []}  # BC numbers - Tinf, q
+
+
+def update_plan(nd, el, bc, src, mat):
+    """
+    Classifies the model quantities by update frequency.
+
+    Args:
+        nd, el, bc, src, mat: initialized model.
+
+    Returns:
+        UpdatePlan class.
+    """
+
+    plan = UpdatePlan()
+    for n in range(len(nd)):
+        if nd[n].mfncID is not None:
+            plan.capacity[TIME].append(n)
+        elif (nd[n].matID is not None and nd[n].matID > 0 and
+              not (constant_property(mat[nd[n].matID].rhotype) and constant_property(mat[nd[n].matID].cvtype))):
+            plan.capacity[TEMPERATURE].append(n)
+        else:
+            plan.capacity[CONSTANT].append(n)
+        plan.volume[TIME if nd[n].vfncID is not None else CONSTANT].append(n)
+
+    for e in range(len(el)):
+        plan.elements[CONSTANT if is_linear_element(el[e], mat) else TEMPERATURE].append(e)
+
+    for i in range(len(src)):
+        if src[i].ntype == 4:  # function of the node temperature
+            plan.sources[TEMPERATURE].append(i)
+        elif src[i].ntype == 3:  # thermostat, switched once per time step
+            plan.sources[TIME].append(i)
+        elif ((src[i].ntype == 1 and (src[i].fncqdot is not None or
+                                      any(nd[n].vfncID is not None for n in src[i].nd))) or
+              (src[i].ntype == 2 and src[i].fncQ is not None)):
+            plan.sources[TIME].append(i)
+        else:
+            plan.sources[CONSTANT].append(i)
+
+    for i in range(len(bc)):
+        plan.bcs[TIME if bc[i].fncTinf is not None or bc[i].fncq is not None else CONSTANT].append(i)
+    return plan
+
+
+def write_update_plan(plan, transient, logfID, prog_report, *text_widget):
+    """Writes the number of quantities updated once per run, per time step and per iteration."""
+
+    rows = [('Conductors', plan.elements), ('Sources', plan.sources), ('Boundary conditions', plan.bcs)]
+    if transient:
+        rows = [('Node heat capacities', plan.capacity), ('Node volumes', plan.volume)] + rows
+    message = ('\nUpdate plan:\n  Quantity               Per run  Per step  Per iteration\n'
+               '  --------------------- -------- --------- --------------\n')
+    for name, items in rows:
+        message += '  {:21s} {:8d} {:9d} {:14d}\n'.format(name, len(items[CONSTANT]), len(items[TIME]),
+                                                         len(items[TEMPERATURE]))
+    n_elements = len(plan.elements[CONSTANT]) + len(plan.elements[TEMPERATURE])
+    if n_elements > 0:
+        message += '\n  Pre-assembled matrix: {} of {} conductors ({:.1f} %)\n'.format(
+            len(plan.elements[CONSTANT]), n_elements, 100.0 * len(plan.elements[CONSTANT]) / n_elements)
+    user_feedback(message, prog_report, logfID, *text_widget)
@@ -218,3 +218,76 @@ def user_feedback(text, code, logFileID=None, terminal=None):
             logFileID.write(text)
     else:
         pass
+
+
+def read_excel_sheet(file_path):
+    """
+    Reads the active sheet of a Microsoft Excel file, skipping the empty rows and columns before the data region.
+
+    Args:
+        file_path: name of the Excel file.
+
+    Returns:
+        A tuple containing the sheet, the header row (first row of the data region) and the data rows, all the
+        values as strings ("" for the empty cells).
+
+    Raises:
+        ValueError: if the sheet does not contain data.
+    """
+
+    from openpyxl import load_workbook  # openpyxl is needed only for the Excel files
+
+    workbook = load_workbook(filename=file_path, data_only=True)
+    sheet = workbook.active
+
+    # --- Find the first non-empty row and column ---
+    min_row_data = 0
+    for row_idx, row in enumerate(sheet.iter_rows(values_only=True)):
+        if any(cell_value is not None for cell_value in row):
+            min_row_data = row_idx + 1  # +1 because iter_rows is 0-indexed, but sheet is 1-indexed
+            break
+
+    if min_row_data == 0:  # No data found at all
+        raise ValueError("The selected Excel sheet is empty or contains only empty rows.")
+
+    # Find the first non-empty column based on the "data region"
+    min_col_data = sheet.max_column + 1  # Initialize with a value beyond max
+    for col_idx in range(1, sheet.max_column + 1):  # Iterate through all potential columns
+        has_data_in_col = False
+        for row_idx in range(min_row_data, sheet.max_row + 1):
+            cell_value = sheet.cell(row=row_idx, column=col_idx).value
+            if cell_value is not None:
+                has_data_in_col = True
+                break
+        if has_data_in_col:
+            min_col_data = col_idx
+            break
+
+    if min_col_data > sheet.max_column:  # No data found in any column from the first non-empty row
+        raise ValueError("The selected Excel sheet does not contains data.")
+
+    # Now, read the data from the identified data region
+    # max_column and max_row still give the overall max, which is fine here
+    # since min_col_data and min_row_data narrow down the starting point.
+    num_columns = sheet.max_column
+    num_rows = sheet.max_row  # Use actual max_row, not just first data row
+
+    # Read all rows from the identified starting row and column
+    all_rows_raw = list(sheet.iter_rows(min_row=min_row_data,
+                                        max_row=num_rows,
+                                        min_col=min_col_data,
+                                        max_col=num_columns,
+                                        values_only=True))
+
+    if not all_rows_raw:
+        raise ValueError("No data found after cleaning initial empty rows/columns.")
+
+    # Assume the first row of the cleaned data is the header
+    header_row = [str(cell_value) if cell_value is not None else "" for cell_value in all_rows_raw[0]]
+
+    # Store the rest of the data
+    all_data = []
+    for row_data_tuple in all_rows_raw[1:]:  # Skip the header row
+        all_data.append([str(cell_value) if cell_value is not None else "" for cell_value in row_data_tuple])
+
+    return sheet, header_row, all_data
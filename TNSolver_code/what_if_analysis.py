@@ -0,0 +1,132 @@
+"""
+What-if queries on a solved steady model: temperature change due to a few modified, added or removed conductors.
+
+Changing the conductors of the (linearized) network is a low-rank update of the network matrix A:
+
+    A' = A + U V^T
+
+with a column pair for every changed conductor (a single column for the symmetric conductors, G [[1, -1], [-1, 1]]).
+The temperature change solves A' dT = -U V^T T, evaluated with the Sherman-Morrison-Woodbury formula
+
+    inv(A') r = inv(A) r - inv(A) U inv(I + V^T inv(A) U) V^T inv(A) r
+
+reusing the factorization of the converged solution (spar.factor), with one solve per column of U instead of a
+new factorization. Beyond max_rank columns the updated matrix is assembled and factorized. For nonlinear
+conductors (e.g. radiation) the result is the linearized response around the converged solution.
+"""
+
+import numpy as np
+from .network_assembly import element_blocks, assemble_matrix, dirichlet_equations
+from .linear_solvers import factorize
+
+MAX_UPDATE_RANK = 20  # columns of the low-rank update, beyond them the matrix is factorized again
+
+
+def woodbury_solve(factor, U, V, r):
+    """
+    Solves (A + U V^T) x = r with the factorization of A (Sherman-Morrison-Woodbury formula).
+
+    Args:
+        factor: factorization of A, with a solve(b) method.
+        U, V: update matrices (n, k).
+        r: right-hand side (n).
+
+    Returns:
+        The solution x (NumPy array).
+    """
+
+    y = factor.solve(r.reshape(-1, 1)).reshape(-1)
+    if U.shape[1] == 0:
+        return y
+    Z = factor.solve(U)
+    C = np.eye(U.shape[1]) + V.T @ Z
+    return y - Z @ np.linalg.solve(C, V.T @ y)
+
+
+def update_matrices(spar, nd, el, bc, scale=None, add=None, remove=None):
+    """
+    Builds the low-rank update of the network matrix for a set of conductor changes.
+
+    Args:
+        spar, nd, el, bc: solved model (temperatures in the I/O units).
+        scale: dictionary conductor label: conductance multiplier.
+        add: list of (node label, node label, conductance) of new conductors.
+        remove: list of labels of conductors to remove.
+
+    Returns:
+        A tuple containing U and V (NumPy arrays (n, k)).
+    """
+
+    nnd = len(nd)
+    eqs, blocks = element_blocks(nd, el, spar.Toff)
+    element = {el[e].label: e for e in range(len(el))}
+    node = {nd[n].label: nd[n].eqn for n in range(nnd)}
+    fixed, _ = dirichlet_equations(spar, nd, bc)
+
+    changes = []  # (equations, change of the element matrix)
+    for label, factor in (scale or {}).items():
+        if label not in element:
+            raise KeyError('unknown conductor: {}'.format(label))
+        changes.append((eqs[element[label]], (factor - 1.0) * blocks[element[label]]))
+    for label in (remove or []):
+        if label not in element:
+            raise KeyError('unknown conductor: {}'.format(label))
+        changes.append((eqs[element[label]], -blocks[element[label]]))
+    for label1, label2, G in (add or []):
+        if label1 not in node or label2 not in node:
+            raise KeyError('unknown node: {}'.format(label1 if label1 not in node else label2))
+        changes.append((np.array([node[label1], node[label2]]), G * np.array([[1.0, -1.0], [-1.0, 1.0]])))
+
+    U = []
+    V = []
+    for (i, j), dB in changes:
+        if np.allclose(dB, dB[0, 0] * np.array([[1.0, -1.0], [-1.0, 1.0]])):  # symmetric: rank one
+            u = np.zeros(nnd)
+            u[[i, j]] = [1.0, -1.0]
+            U.append(dB[0, 0] * u)
+            V.append(u)
+        else:
+            for k in range(2):
+                u = np.zeros(nnd)
+                u[[i, j]] = dB[:, k]
+                v = np.zeros(nnd)
+                v[[i, j][k]] = 1.0
+                U.append(u)
+                V.append(v)
+    U = np.array(U).T.reshape(nnd, -1)
+    V = np.array(V).T.reshape(nnd, -1)
+    U[fixed, :] = 0.0  # the rows of the fixed temperatures are not changed
+    return U, V
+
+
+def what_if(spar, nd, el, bc, scale=None, add=None, remove=None, max_rank=MAX_UPDATE_RANK):
+    """
+    Evaluates the temperatures of a solved steady model after changing some conductors (see update_matrices).
+
+    Args:
+        spar, nd, el, bc: solved steady model (temperatures in the I/O units, spar.factor set).
+        scale, add, remove: conductor changes, see update_matrices.
+        max_rank: maximum rank of the low-rank update, beyond it the updated matrix is factorized.
+
+    Returns:
+        Dictionary node label: temperature after the changes.
+    """
+
+    if not spar.steady:
+        raise ValueError('what-if queries need a steady model')
+    U, V = update_matrices(spar, nd, el, bc, scale, add, remove)
+    T = np.zeros(len(nd))
+    for n in range(len(nd)):
+        T[nd[n].eqn] = nd[n].T
+    r = -U @ (V.T @ (T + spar.Toff))
+
+    if U.shape[1] <= max_rank and spar.factor is not None:
+        dT = woodbury_solve(spar.factor, U, V, r)
+    else:
+        eqs, blocks = element_blocks(nd, el, spar.Toff)
+        A = assemble_matrix(len(nd), eqs, blocks).toarray() + U @ V.T
+        fixed, _ = dirichlet_equations(spar, nd, bc)
+        A[fixed, :] = 0.0
+        A[fixed, fixed] = 1.0
+        dT = factorize(A, spar).solve(r.reshape(-1, 1)).reshape(-1)
+    return {nd[n].label: float(T[nd[n].eqn] + dT[nd[n].eqn]) for n in range(len(nd))}